@@ -18,7 +18,9 @@ argument_names = {
     "game-start": ["rom_path", "rom_name", "game_name"],
     "screensaver-game-select": ["system_name", "rom_path", "game_name", "media"],
     "system-selected": ["system_name", "access_type"],
-    "game-selected": ["system_name", "rom_path", "game_name", "access_type"]
+    "game-selected": ["system_name", "rom_path", "game_name", "access_type"],
+    "button-press": ["button"],
+    "button-release": ["button"]
 }
 
 # Prepare the arguments dictionary based on the event type
@@ -40,7 +42,8 @@ message = {
 try:
     with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
         sock.connect(SOCKET_PATH)
-        sock.sendall(json.dumps(message).encode("utf-8"))
+        # One line of JSON; the service does not wait for the end of the connection to handle it
+        sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
         print(f"Sent to daemon: {json.dumps(message)}")
 except FileNotFoundError:
     print(f"Error: Unix socket at {SOCKET_PATH} not found.")
@@ -1,10 +1,16 @@
 #!/userdata/pixel_multiverse/venv/bin/python3
 import os
 import sys
-import socket
+import json
+import asyncio
+import threading
 import yaml
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pixelpusher import (
+    ArtIndex,
+    ButtonController,
     LedMatrix,
     PlasmaButtons,
     DISPLAY_INTERSTATE75_128x32,
@@ -15,6 +21,7 @@ from pixelpusher import (
     COLOR_ORDER_BRG,
     COLOR_ORDER_GRB,
     COLOR_ORDER_GBR,
+    DEFAULT_ART_SCAN_INTERVAL,
     RGBl
 )
 from PIL import Image, ImageDraw, ImageFont
@@ -23,6 +30,8 @@ from PIL import Image, ImageDraw, ImageFont
 SOCKET_PATH = "/run/pixel_multiverse.sock"
 CONFIG_PATH = "/userdata/system/configs/pixel_multiverse/pixel_multiverse.yml"
 TEMP_FILE_BASE = "/dev/shm/temp_image"
+MAX_MESSAGE_SIZE = 1024 * 1024  # Largest length-framed message accepted from a client
+LENGTH_PREFIX = b"#"  # Starts the line that holds the length of a length-framed message
 
 # Display Mapping
 DISPLAY_MAPPING = {
@@ -30,6 +39,16 @@ DISPLAY_MAPPING = {
     "GALACTIC_UNICORN": {"type": DISPLAY_GALACTIC_UNICORN, "resolution": "lo-res", "width": 53},
 }
 
+# Events that only change what the marquee shows. Of the waiting events of one class only the newest is handled.
+COALESCED_EVENT_CLASSES = {
+    "system-selected": "selection",
+    "game-selected": "selection",
+    "screensaver-game-select": "selection",
+}
+
+# Set when the event being handled has been superseded by a newer event of the same class
+render_cancelled = threading.Event()
+
 
 # Logging Configuration
 def configure_logging(config):
@@ -88,6 +107,22 @@ def load_pattern_queue_from_yaml(yaml_config):
     return local_pattern_queue
 
 
+def load_press_effect_from_yaml(yaml_config):
+    """
+    Load the effect shown when a button is pressed from the YAML configuration.
+
+    :param yaml_config: full yaml configuration
+    :return: Keyword arguments for PlasmaButtons.press_button.
+    """
+    params = dict(yaml_config.get('buttons', {}).get('press_effect', {}))
+    if 'color' in params:
+        params['color'] = RGBl(*params['color'])
+    for name in ('duration', 'radius', 'speed'):
+        if name in params:
+            params[name] = float(params[name])
+    return params
+
+
 # Initialize buttons
 def initialize_buttons(config):
     button_config = config.get("buttons", {})
@@ -95,12 +130,21 @@ def initialize_buttons(config):
         logger.info("Button leds are disabled in the configuration.")
         return None
 
-    connection_path = button_config.get("connection")
-    if not connection_path or not os.path.exists(connection_path):
-        logger.error("Connection path '%s' does not exist. Disabling buttons", connection_path)
-        return None
+    # Either one connection with num_leds, or a list of controllers with their own connection and num_leds
+    controllers = [ButtonController(item.get("connection"), item.get("num_leds", 128))
+                   for item in button_config.get("controllers", [])]
+    if controllers:
+        connection_paths = [controller.serial_port_path for controller in controllers]
+        num_leds = sum(controller.num_leds for controller in controllers)
+    else:
+        connection_paths = [button_config.get("connection")]
+        num_leds = button_config.get("num_leds", 128)
+    for connection_path in connection_paths:
+        if not connection_path or not os.path.exists(connection_path):
+            logger.error("Connection path '%s' does not exist. Disabling buttons", connection_path)
+            return None
+    connection_path = ", ".join(connection_paths)
 
-    num_leds = button_config.get("num_leds", 128)
     refresh_rate = button_config.get("refresh_rate", 60)
     button_map = button_config.get("button_map", {})
 
@@ -113,10 +157,11 @@ def initialize_buttons(config):
     try:
         plasma_buttons = PlasmaButtons(
             num_leds=num_leds,
-            serial_port_path=connection_path,
+            serial_port_path=connection_paths[0],
             refresh_rate=refresh_rate,
             coord_map=led_map,
-            button_map=button_map
+            button_map=button_map,
+            controllers=controllers or None
         )
         logger.info("Buttons initialized with '%s' leds, connection '%s', refresh rate '%s'.",
                     num_leds, connection_path, refresh_rate)
@@ -259,6 +304,68 @@ def overlay_text_on_image_in_memory(
         raise
 
 
+# Initialize Art Index
+def initialize_art_index(config):
+    marquee_config = config.get("marquee", {})
+    image_path = marquee_config.get("image_path", "/userdata/pixel_multiverse/visuals/marquee")
+    image_extensions = marquee_config.get("image_extensions", ["gif", "png", "jpg"])
+    scan_interval = float(marquee_config.get("art_scan_interval", DEFAULT_ART_SCAN_INTERVAL))
+    cache_path = marquee_config.get("art_index_cache", "/userdata/pixel_multiverse/art_index.json")
+    try:
+        index = ArtIndex(image_path, image_extensions, scan_interval, cache_path=cache_path or None)
+        index.start()
+        logger.info("Art index built: %s", index)
+        return index
+    except Exception as e:
+        logger.error("Failed to build art index: %s. Searching the image path instead", e)
+        return None
+
+
+def find_image(image_path, image_extensions, *parts):
+    """
+    Finds the image for a path without extension, trying the extensions in order.
+
+    Paths below the root of the art index are looked up in the index, other paths on disk.
+
+    Args:
+        image_path (str): Directory holding the images.
+        image_extensions (list): Image extensions without the dot, the preferred one first.
+        parts (str): Path components below image_path, without the extension.
+
+    Returns:
+        str: Path of the image, or None if there is none.
+    """
+    stem = os.path.normpath(os.path.join(image_path, *parts))
+    if art_index is not None and art_index.extensions == tuple(image_extensions) and \
+            stem.startswith(art_index.root + os.sep):
+        return art_index.find(stem)
+    for ext in image_extensions:
+        candidate = f"{stem}.{ext}"
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def match_image(image_path, image_extensions, system_name, rom_path, game_name):
+    """
+    Finds the image of a game by normalized name in the art index, see ArtIndex.match.
+
+    Args:
+        image_path (str): Directory holding the images.
+        image_extensions (list): Image extensions without the dot, the preferred one first.
+        system_name (str): Name of the system.
+        rom_path (str): Path to the ROM file, tried first.
+        game_name (str): Name of the game, can be None.
+
+    Returns:
+        str: Path of the image, or None if there is none or no art index for image_path.
+    """
+    if art_index is not None and art_index.extensions == tuple(image_extensions) and \
+            art_index.root == os.path.normpath(image_path):
+        return art_index.match(system_name, rom_path, game_name)
+    return None
+
+
 def search_and_display_image(marquee, system_name="", game_name=None, rom_path=None, ui_image="default.png"):
     """
     Search and display an image based on system_name and game_name, with placeholder creation.
@@ -271,8 +378,14 @@ def search_and_display_image(marquee, system_name="", game_name=None, rom_path=N
         ui_image (str): Name of de default image that should be used. Useful for
 
     Returns:
-        bool: True if an image was successfully displayed, False otherwise.
+        bool: True if an image was successfully displayed, False otherwise. None if the render was
+        cancelled because a newer event superseded it. The render only checks render_cancelled
+        when it starts and before it displays game, system or default art; the image lookup and
+        marquee.display_image itself run to the end once started.
     """
+    if render_cancelled.is_set():
+        return None
+
     image_path = configuration.get("marquee", {}).get("image_path", "/userdata/pixel_multiverse/visuals/marquee")
     image_extensions = configuration.get("marquee", {}).get("image_extensions", ["gif", "png", "jpg"])
     create_placeholders = str(configuration.get("marquee", {}).
@@ -297,16 +410,19 @@ def search_and_display_image(marquee, system_name="", game_name=None, rom_path=N
 
     # Search for game-specific image
     if rom_path:
-        for ext in image_extensions:
-            game_image_path = os.path.join(system_path, f"{rom_path}.{ext}")
-            if os.path.exists(game_image_path):
-                try:
-                    marquee.display_image(game_image_path, rescale=True)
-                    logger.info("Displayed game image: %s", game_image_path)
-                    return True
-                except Exception as e:
-                    logger.error("Failed to display game image: %s", e)
-                    return False
+        # Art named exactly after the ROM first, then art whose name differs only in tags, case or punctuation
+        game_image_path = (find_image(image_path, image_extensions, system_name, rom_path) or
+                           match_image(image_path, image_extensions, system_name, rom_path, game_name))
+        if game_image_path:
+            if render_cancelled.is_set():
+                return None
+            try:
+                marquee.display_image(game_image_path, rescale=True)
+                logger.info("Displayed game image: %s", game_image_path)
+                return True
+            except Exception as e:
+                logger.error("Failed to display game image: %s", e)
+                return False
 
         # No specific game image found; create placeholder if enabled
         if create_placeholders:
@@ -328,25 +444,28 @@ def search_and_display_image(marquee, system_name="", game_name=None, rom_path=N
                     logger.error("Failed to create placeholder file for game %s: %s", game_name, e)
 
     # Search for system-wide image in image_path
-    for ext in image_extensions:
-        system_image_path = os.path.join(image_path, f"{system_name}.{ext}")
-        if os.path.exists(system_image_path):
-            try:
-                with Image.open(system_image_path) as system_image:
-                    if resolution == "hi-res" and max_width:
-                        overlayed_path = overlay_text_on_image_in_memory(
-                            system_image, game_name or "", temp_file_base, max_width=max_width
-                        )
-                        marquee.display_image(overlayed_path, rescale=True)
-                    else:
-                        marquee.display_image(system_image_path, rescale=True)
-                    logger.info("Displayed system image: %s", system_image_path)
-                    return True
-            except Exception as e:
-                logger.error("Failed to display system image: %s", e)
-                return False
+    system_image_path = find_image(image_path, image_extensions, system_name)
+    if system_image_path:
+        if render_cancelled.is_set():
+            return None
+        try:
+            with Image.open(system_image_path) as system_image:
+                if resolution == "hi-res" and max_width:
+                    overlayed_path = overlay_text_on_image_in_memory(
+                        system_image, game_name or "", temp_file_base, max_width=max_width
+                    )
+                    marquee.display_image(overlayed_path, rescale=True)
+                else:
+                    marquee.display_image(system_image_path, rescale=True)
+                logger.info("Displayed system image: %s", system_image_path)
+                return True
+        except Exception as e:
+            logger.error("Failed to display system image: %s", e)
+            return False
 
     # Fallback to default image
+    if render_cancelled.is_set():
+        return None
     try:
         ui_image_path = os.path.join(default_image_path, ui_image)
         with Image.open(ui_image_path) as default_image:
@@ -436,7 +555,7 @@ def handle_game_start_event(arguments):
             return
 
         success = search_and_display_image(system_name=system_name, game_name=game_name, marquee=marquee)
-        if not success:
+        if success is False:
             logger.error("Failed to display image for 'screensaver-game-select'.")
     if buttons and buttons.attract_mode_active():
         buttons.stop_attract_mode()
@@ -488,7 +607,7 @@ def handle_screensaver_game_select_event(arguments):
             return
 
         success = search_and_display_image(system_name=system_name, game_name=game_name, marquee=marquee, rom_path=rom_path)
-        if not success:
+        if success is False:
             logger.error("Failed to display image for 'screensaver-game-select'.")
 
 
@@ -500,7 +619,7 @@ def handle_system_select_event(arguments):
             return
 
         success = search_and_display_image(system_name=system_name, marquee=marquee)
-        if not success:
+        if success is False:
             logger.error("Failed to display image for 'system-select'.")
 
 
@@ -514,10 +633,32 @@ def handle_game_select_event(arguments):
             return
 
         success = search_and_display_image(system_name=system_name, game_name=game_name, marquee=marquee, rom_path=rom_path)
-        if not success:
+        if success is False:
             logger.error("Failed to display image for 'screensaver-game-select'.")
 
 
+def handle_button_press_event(arguments):
+    # Fast path: no logging, this runs for every button press
+    if buttons:
+        params = press_effect
+        if "effect" in arguments:
+            params = dict(press_effect, effect=arguments["effect"])
+        buttons.press_button(arguments.get("button"), **params)
+
+
+def handle_button_release_event(arguments):
+    # Fast path: no logging, this runs for every button release
+    if buttons:
+        buttons.release_button(arguments.get("button"), duration=press_effect.get("duration", 0.3))
+
+
+# Events that are handled without logging and without building the handler table, for the lowest latency
+FAST_EVENT_HANDLERS = {
+    "button-press": handle_button_press_event,
+    "button-release": handle_button_release_event,
+}
+
+
 def create_event_handlers():
     return {
         "quit": lambda args: handle_quit_event(args),
@@ -537,6 +678,8 @@ def create_event_handlers():
         "screensaver-game-select": lambda args: handle_screensaver_game_select_event(args),
         "system-selected": lambda args: handle_system_select_event(args),
         "game-selected": lambda args: handle_game_select_event(args),
+        "button-press": lambda args: handle_button_press_event(args),
+        "button-release": lambda args: handle_button_release_event(args),
         # Add other events and their handlers here...
     }
 
@@ -554,44 +697,238 @@ def process_event(event_name, arguments, event_handlers):
         logger.warning("Unhandled event '%s' with arguments: %s", event_name, arguments)
 
 
+# Event Queue
+class EventQueue:
+    """
+    Events waiting to be handled by the executor, one at a time in the order they arrived.
+
+    When an event of a class in COALESCED_EVENT_CLASSES arrives, a waiting event of the same class
+    is dropped and the new one takes its place at the end of the queue. If an event of that class
+    is being handled, its render is cancelled. Events of a class are held back until no newer one
+    has arrived for settle_time seconds, so a burst of selections renders only its last one.
+
+    Attributes:
+        coalesced (int): Number of waiting events dropped for a newer event of the same class.
+        cancelled (int): Number of renders cancelled for a newer event of the same class. A render
+            stops at its next check, so one that is already sending the image to the marquee still completes.
+    """
+
+    def __init__(self, executor, event_handlers, settle_time=0.0):
+        """
+        Initializes the EventQueue object. It must be created and used on the event loop.
+
+        :param executor: Executor the events are handled on. It should have a single thread.
+        :param event_handlers: Dictionary mapping event names to their handlers.
+        :param settle_time: Time in seconds an event of a coalesced class waits for a newer one.
+        """
+        self.coalesced = 0
+        self.cancelled = 0
+        self._executor = executor
+        self._event_handlers = event_handlers
+        self._settle_time = settle_time
+        self._pending = deque()  # (event_name, arguments, event_class)
+        self._latest = {}  # event class -> loop time of its newest event
+        self._handling_class = None
+        self._reported = 0
+        self._ready = asyncio.Event()
+
+    def put(self, event_name, arguments):
+        """
+        Adds an event to the end of the queue, replacing a waiting event of the same class.
+
+        :param event_name: Name of the event.
+        :param arguments: Arguments of the event.
+        """
+        event_class = COALESCED_EVENT_CLASSES.get(event_name)
+        if event_class is not None:
+            for index, pending in enumerate(self._pending):
+                if pending[2] == event_class:
+                    del self._pending[index]
+                    self.coalesced += 1
+                    break
+            if self._handling_class == event_class and not render_cancelled.is_set():
+                render_cancelled.set()
+                self.cancelled += 1
+            self._latest[event_class] = asyncio.get_running_loop().time()
+        self._pending.append((event_name, arguments, event_class))
+        self._ready.set()
+
+    async def run(self):
+        """
+        Hands the events to the executor until the task is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            event_name, arguments, event_class = self._pending[0]
+            if event_class is not None and self._settle_time > 0:
+                remaining = self._latest[event_class] + self._settle_time - loop.time()
+                if remaining > 0:
+                    # A newer event arriving meanwhile replaces this one, so look at the queue again
+                    await asyncio.sleep(remaining)
+                    continue
+            self._pending.popleft()
+            skipped = self.coalesced + self.cancelled - self._reported
+            if skipped:
+                self._reported += skipped
+                logger.info("Superseded %d events before '%s' (%d coalesced, %d renders cancelled in total).",
+                            skipped, event_name, self.coalesced, self.cancelled)
+            render_cancelled.clear()
+            self._handling_class = event_class
+            try:
+                await loop.run_in_executor(self._executor, process_event, event_name, arguments,
+                                           self._event_handlers)
+            finally:
+                self._handling_class = None
+
+    def __str__(self):
+        return (f"EventQueue({len(self._pending)} waiting, {self.coalesced} coalesced, "
+                f"{self.cancelled} renders cancelled)")
+
+
+# Parse Message
+def parse_message(text):
+    # The event scripts send JSON, which the json module parses much faster than the YAML parser
+    try:
+        return json.loads(text)
+    except ValueError:
+        return yaml.safe_load(text)
+
+
+def message_events(message):
+    """
+    Lists the events in a message: a single event, a list of events, or an object with a list of
+    events under "events".
+
+    :param message: The parsed message.
+    :return: List of (event_name, arguments) tuples.
+    """
+    if isinstance(message, dict):
+        message = message.get("events", [message])
+    events = []
+    for event in message:
+        events.append((event.get("event"), event.get("arguments") or {}))
+    return events
+
+
+# Client Connection
+async def read_messages(reader):
+    """
+    Reads the messages of one client. A message is either one line of JSON, or a line holding
+    LENGTH_PREFIX and the length of the message in bytes (such as "#42") followed by the message
+    itself, which may span several lines. The prefix keeps a message that is just a number from
+    being taken for a length: it is read as a message of its own, which holds no events.
+    The last message may end at the end of the connection instead of with a newline, which is how
+    older event scripts send their single message.
+
+    :param reader: The StreamReader of the client.
+    :return: Asynchronous iterator over the text of the messages.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        text = line.strip()
+        if not text:
+            continue
+        if text.startswith(LENGTH_PREFIX) and text[len(LENGTH_PREFIX):].isdigit():
+            length = int(text[len(LENGTH_PREFIX):])
+            if length > MAX_MESSAGE_SIZE:
+                raise ValueError(f"Message of {length} bytes is larger than {MAX_MESSAGE_SIZE} bytes")
+            text = await reader.readexactly(length)
+        yield text.decode()
+
+
+async def handle_client(reader, writer, event_queue):
+    """
+    Reads the messages of one client and handles the events in them, see read_messages and
+    message_events. A message with "ack" set to true is answered with a line of JSON holding the
+    number of events accepted and rejected, and its "id" if it has one.
+
+    Events are put in the event queue, so the event loop keeps accepting clients while an image
+    is rendered. Button presses are handled right here, as they only start an effect.
+    """
+    try:
+        async for text in read_messages(reader):
+            try:
+                message = parse_message(text)
+                events = message_events(message)
+            except Exception as e:
+                logger.error("Invalid message %r: %s", text, e)
+                continue
+            accepted = rejected = 0
+            for event_name, arguments in events:
+                fast_handler = FAST_EVENT_HANDLERS.get(event_name)
+                if fast_handler:
+                    try:
+                        fast_handler(arguments)
+                        accepted += 1
+                    except Exception as e:
+                        logger.error("Error while handling event '%s': %s", event_name, e)
+                        rejected += 1
+                elif event_name:
+                    event_queue.put(event_name, arguments)
+                    accepted += 1
+                else:
+                    logger.error("Message without event name: %r", text)
+                    rejected += 1
+            if isinstance(message, dict) and message.get("ack"):
+                reply = {"accepted": accepted, "rejected": rejected}
+                if "id" in message:
+                    reply["id"] = message["id"]
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+    # ValueError: a line longer than the stream limit, EOFError: a message shorter than its length
+    except (ConnectionError, ValueError, EOFError) as e:
+        logger.error("Error reading from client: %s", e)
+    finally:
+        writer.close()
+
+
 # Main Event Loop
-def start_event_loop():
+async def serve_events():
     if os.path.exists(SOCKET_PATH):
         os.remove(SOCKET_PATH)
 
-    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="events")
+    settle_time = float(configuration.get("general", {}).get("event_settle_time", 0.0))
+    event_queue = EventQueue(executor, create_event_handlers(), settle_time)
+    event_task = asyncio.create_task(event_queue.run())
+    server = await asyncio.start_unix_server(lambda reader, writer: handle_client(reader, writer, event_queue),
+                                             path=SOCKET_PATH)
     try:
-        server_socket.bind(SOCKET_PATH)
         os.chmod(SOCKET_PATH, 0o666)
-        server_socket.listen(1)
         logger.info("Listening on %s...", SOCKET_PATH)
-
-        while True:
-            client_socket, _ = server_socket.accept()
-            with client_socket:
-                while True:
-                    data = client_socket.recv(1024)
-                    if not data:
-                        break
-                    message = yaml.safe_load(data.decode().strip())
-                    event_name = message.get("event")
-                    arguments = message.get("arguments", {})
-                    process_event(event_name, arguments, create_event_handlers())
-    except Exception as e:
-        logger.error("Error: %s", e)
+        async with server:
+            await server.serve_forever()
     finally:
-        server_socket.close()
+        event_task.cancel()
+        render_cancelled.set()
+        executor.shutdown(wait=False)
+        logger.info("%s", event_queue)
         if os.path.exists(SOCKET_PATH):
             os.remove(SOCKET_PATH)
         logger.info("Server shut down.")
 
 
+def start_event_loop():
+    try:
+        asyncio.run(serve_events())
+    except Exception as e:
+        logger.error("Error: %s", e)
+
+
 # Main Service Execution
 if __name__ == "__main__":
     configuration = load_configuration()
     logger = configure_logging(configuration)
     marquee, matrix_resolution, matrix_max_width = initialize_marquee(configuration)
+    art_index = initialize_art_index(configuration) if marquee else None
     buttons = initialize_buttons(configuration)
+    press_effect = load_press_effect_from_yaml(configuration)
 
     pattern_queue = [
         ('linear', {'direction': 'left_to_right', 'color_on': RGBl(31, 0, 0, 5), 'color_off': RGBl(0, 31, 0, 5), 'delay': 0.01}),
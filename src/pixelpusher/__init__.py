@@ -1,3 +1,9 @@
+from .asset import *
+from .artindex import *
+from .attract import *
 from .buttons import *
+from .cache import *
 from .colors import *
-from .matrix import *
\ No newline at end of file
+from .geometry import *
+from .matrix import *
+from .transport import *
@@ -0,0 +1,588 @@
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import re
+import select
+import struct
+import threading
+import time
+import unicodedata
+
+# Seconds between two scans of the image tree when inotify is not available
+DEFAULT_ART_SCAN_INTERVAL = 30.0
+
+# Version of the art index cache files, changed whenever the file format or the name normalization changes
+ART_INDEX_CACHE_VERSION = 2
+
+# Extensions of ROM files and the archives they come in, stripped from ROM file names before they are matched.
+# Other dots are part of the name, as in "Mr.Do" or "Vol.2"
+ROM_EXTENSIONS = frozenset((
+    # Archives
+    "zip", "7z", "rar", "gz", "tar", "xz", "bz2",
+    # Nintendo
+    "nes", "fds", "unf", "unif", "sfc", "smc", "fig", "swc", "bs", "gb", "gbc", "gba", "nds", "3ds", "cia",
+    "n64", "z64", "v64", "ndd", "gcm", "rvz", "wbfs", "wia", "vb", "min", "xci", "nsp",
+    # Sega
+    "md", "smd", "gen", "sms", "gg", "sg", "32x", "gdi", "cdi",
+    # Other consoles, handhelds and computers
+    "pce", "sgx", "a26", "a52", "a78", "lnx", "j64", "jag", "col", "int", "vec", "ngp", "ngc", "ws", "wsc",
+    "d64", "t64", "tap", "prg", "crt", "adf", "ipf", "dsk", "tzx", "z80", "sna", "mx1", "mx2", "cas", "rom",
+    # Disc images
+    "iso", "cso", "chd", "cue", "bin", "img", "ccd", "mds", "mdf", "pbp", "ecm", "m3u",
+))
+
+# Seconds without inotify events before a changed index is written to its cache file
+_CACHE_SAVE_DELAY = 5.0
+
+# Region, revision and dump tags, e.g. "(USA)", "(Rev 1)", "[!]" or "{Disc 1}"
+_TAG_PATTERN = re.compile(r"\([^)]*\)|\[[^\]]*\]|\{[^}]*\}")
+# Leading or moved article, e.g. "The Legend of Zelda", "Legend of Zelda, The" or "Legend of Zelda, The - ..."
+_ARTICLE_PATTERN = re.compile(r"^the\s+|,\s*the\b")
+
+# FAT file systems store modification times in 2 second steps, so a directory changed within
+# this time of a scan may change again without its modification time changing
+_MTIME_GRANULARITY_NS = 2_000_000_000
+
+# inotify event masks, from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE |
+               _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_ADDED_MASK = _IN_CREATE | _IN_MOVED_TO | _IN_CLOSE_WRITE
+_REMOVED_MASK = _IN_DELETE | _IN_MOVED_FROM
+
+# wd, mask, cookie, length of the name that follows
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def normalize_rom_name(name, file_name=False):
+    """
+    Normalizes a ROM file name, game name or image name for matching them against each other.
+
+    For file names, the directory and up to two extensions in ROM_EXTENSIONS are stripped first.
+    Then the tags in parentheses, brackets and braces, a leading "the" or one moved behind a
+    comma, accents and everything but letters and digits are removed, and the rest is case
+    folded: "/roms/snes/Legend of Zelda, The (USA) [!].zip" and "The Legend of Zelda" both
+    become "legendofzelda".
+
+    :param name: The name to normalize.
+    :param file_name: True if the name is a ROM path or file name, or the stem of an image file.
+    :return: The normalized name, empty if nothing is left of it.
+    :rtype: str
+    """
+    if file_name:
+        name = os.path.basename(name)
+        for _ in range(2):
+            stem, dot, extension = name.rpartition(".")
+            if not dot or extension.casefold() not in ROM_EXTENSIONS:
+                break
+            name = stem
+    name = _TAG_PATTERN.sub("", name).strip().casefold()
+    name = unicodedata.normalize("NFKD", _ARTICLE_PATTERN.sub("", name))
+    return "".join(character for character in name if character.isalnum())
+
+
+def _load_inotify():
+    """
+    Loads the inotify functions of the C library.
+
+    :return: The C library, or None if it has no inotify support.
+    """
+    library_name = ctypes.util.find_library("c")
+    try:
+        libc = ctypes.CDLL(library_name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class ArtIndex:
+    """
+    In-memory index of the images in a marquee art tree.
+
+    The index maps each image path without its extension to the image with the preferred
+    extension, so finding the image of a system or game is a dictionary lookup instead of a
+    file system probe per extension. It is built by scanning the tree once, and kept up to
+    date from inotify events while it is watching. Where inotify is not available (or runs
+    out of watches) the tree is scanned again every scan_interval seconds, which only reads
+    the directories whose modification time changed.
+
+    The images below a system directory are also indexed by their normalized name (see
+    normalize_rom_name), so match finds art whose name differs from the ROM in its tags,
+    case or punctuation. With a cache_path the index is saved to disk and loaded from it
+    when it is created, so only the directories that changed since are read again.
+
+    Attributes:
+        root (str): Directory holding the images.
+        extensions (tuple): Image extensions without the dot, the preferred one first.
+        scan_interval (float): Seconds between two scans when inotify is not used.
+        cache_path (str): File the index is saved to, or None.
+        uses_inotify (bool): True if the index is kept up to date from inotify events.
+    """
+
+    def __init__(self, root, extensions, scan_interval=DEFAULT_ART_SCAN_INTERVAL, cache_path=None):
+        """
+        Initializes the ArtIndex object, loads its cache file and scans the tree.
+
+        :param root: Directory holding the images. It may not exist yet.
+        :param extensions: Image extensions without the dot, the preferred one first.
+        :param scan_interval: Seconds between two scans when inotify is not used.
+        :param cache_path: File the index is saved to and loaded from. None disables the cache.
+        """
+        self.root = os.path.normpath(root)
+        self.extensions = tuple(extensions)
+        self.scan_interval = scan_interval
+        self.cache_path = cache_path
+        self.uses_inotify = False
+        self._priorities = {extension: priority for priority, extension in enumerate(self.extensions)}
+        # directory -> (modification time, {image file name: normalized name}, subdirectories)
+        self._directories = {}
+        self._stems = {}  # path without extension -> {extension: path}
+        self._images = {}  # path without extension -> path of the preferred image
+        self._match_stems = {}  # (system, normalized name) -> set of paths without extension
+        self._matches = {}  # (system, normalized name) -> the path without extension match returns
+        self._changed = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._inotify_fd = None
+        self._watches = {}  # watch descriptor -> directory
+        self._wake_read, self._wake_write = None, None
+        self._load_cache()
+        self.scan()
+        self._save_cache()
+
+    def __len__(self):
+        return len(self._images)
+
+    def find(self, *parts):
+        """
+        Finds the preferred image for a path without extension, relative to the root.
+
+        find("snes") returns the system image <root>/snes.<extension>, find("snes", "mario")
+        the game image <root>/snes/mario.<extension>.
+
+        :param parts: Path components, joined like os.path.join.
+        :return: Path of the image, or None if there is none.
+        :rtype: str
+        """
+        stem = os.path.normpath(os.path.join(self.root, *parts))
+        return self._images.get(stem)
+
+    def match(self, system_name, rom_path=None, game_name=None):
+        """
+        Finds the image of a game in a system directory by normalized name.
+
+        The ROM path is tried first, then the game name. Only the ROM path has its directory
+        and extension stripped, dots in the game name are kept. When several images have the
+        same normalized name, the one with the shortest path wins, as it has the fewest tags.
+
+        :param system_name: Name of the system directory below the root.
+        :param rom_path: ROM path or ROM file name, or None.
+        :param game_name: Name of the game, or None.
+        :return: Path of the image, or None if no name matches.
+        :rtype: str
+        """
+        for name, file_name in ((rom_path, True), (game_name, False)):
+            if name:
+                stem = self._matches.get((system_name, normalize_rom_name(name, file_name)))
+                if stem is not None:
+                    return self._images.get(stem)
+        return None
+
+    def scan(self):
+        """
+        Brings the index up to date by scanning the tree. Only directories whose modification
+        time changed since the last scan are read again.
+        """
+        found = set()
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            found.add(directory)
+            known = self._directories.get(directory)
+            if known is not None and known[0] == mtime:
+                pending.extend(known[2])
+                continue
+            pending.extend(self._read_directory(directory, mtime))
+        for directory in list(self._directories):
+            if directory not in found:
+                self._remove_directory(directory)
+
+    def start(self):
+        """
+        Starts keeping the index up to date in a background thread, from inotify events if
+        possible and by scanning the tree every scan_interval seconds otherwise.
+        """
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._wake_read, self._wake_write = os.pipe()
+        self.uses_inotify = self._start_inotify()
+        target = self._inotify_loop if self.uses_inotify else self._scan_loop
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops keeping the index up to date. The index keeps its current content.
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        os.write(self._wake_write, b"\0")
+        self._thread.join()
+        self._thread = None
+        self._stop_inotify()
+        self._save_cache()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+        self._wake_read, self._wake_write = None, None
+
+    def _read_directory(self, directory, mtime=None):
+        """
+        Replaces the images of one directory in the index with what is on disk.
+
+        :param directory: The directory to read.
+        :param mtime: Modification time of the directory, read from disk if not given.
+        :return: The subdirectories.
+        :rtype: list
+        """
+        old_names = self._directories.get(directory, (None, {}, ()))[1]
+        names = {}
+        subdirectories = []
+        try:
+            if mtime is None:
+                mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+                    elif entry.name in old_names:
+                        names[entry.name] = old_names[entry.name]
+                    elif self._split(entry.name) is not None:
+                        names[entry.name] = normalize_rom_name(self._split(entry.name)[0], file_name=True)
+        except OSError:
+            self._remove_directory(directory)
+            return []
+
+        if time.time_ns() - mtime < _MTIME_GRANULARITY_NS:
+            mtime = None  # Read it again on the next scan
+        with self._lock:
+            old_names = self._directories.get(directory, (None, {}, ()))[1]
+            self._directories[directory] = (mtime, names, tuple(subdirectories))
+            for name in old_names.keys() - names.keys():
+                self._remove_image(directory, name, old_names[name])
+            for name in names.keys() - old_names.keys():
+                self._add_image(directory, name, names[name])
+            self._changed = True
+        return subdirectories
+
+    def _remove_directory(self, directory):
+        """
+        Removes the images of a directory and all its subdirectories from the index.
+        """
+        prefix = directory + os.sep
+        with self._lock:
+            for known in [d for d in self._directories if d == directory or d.startswith(prefix)]:
+                for name, normalized_name in self._directories.pop(known)[1].items():
+                    self._remove_image(known, name, normalized_name)
+                self._changed = True
+
+    def _split(self, name):
+        """
+        Splits a file name into its stem and extension.
+
+        :return: Stem and extension, or None if the file is not an image.
+        :rtype: tuple
+        """
+        stem, dot, extension = name.rpartition(".")
+        if not dot or extension not in self._priorities:
+            return None
+        return stem, extension
+
+    def _match_key(self, directory, normalized_name):
+        """
+        Returns the key of an image in the normalized name index: the system directory it is in
+        and its normalized name, or None if it is not in a system directory or has no name left.
+        """
+        if not normalized_name or directory == self.root:
+            return None
+        system_name = directory[len(self.root) + 1:].split(os.sep, 1)[0]
+        return system_name, normalized_name
+
+    def _add_image(self, directory, name, normalized_name):
+        stem, extension = self._split(name)
+        stem = directory + os.sep + stem
+        variants = self._stems.setdefault(stem, {})
+        variants[extension] = directory + os.sep + name
+        self._images[stem] = variants[min(variants, key=self._priorities.get)]
+
+        key = self._match_key(directory, normalized_name)
+        if key is not None:
+            stems = self._match_stems.setdefault(key, set())
+            stems.add(stem)
+            self._matches[key] = min(stems, key=lambda s: (len(s), s))
+
+    def _remove_image(self, directory, name, normalized_name):
+        stem, extension = self._split(name)
+        stem = directory + os.sep + stem
+        variants = self._stems.get(stem)
+        if variants is None:
+            return
+        variants.pop(extension, None)
+        if variants:
+            self._images[stem] = variants[min(variants, key=self._priorities.get)]
+            return
+        del self._stems[stem]
+        self._images.pop(stem, None)
+
+        key = self._match_key(directory, normalized_name)
+        stems = self._match_stems.get(key)
+        if stems is not None:
+            stems.discard(stem)
+            if stems:
+                self._matches[key] = min(stems, key=lambda s: (len(s), s))
+            else:
+                del self._match_stems[key]
+                del self._matches[key]
+
+    def _add_file(self, directory, name):
+        with self._lock:
+            names = self._directories.setdefault(directory, (None, {}, ()))[1]
+            if name not in names:
+                names[name] = normalize_rom_name(self._split(name)[0], file_name=True)
+                self._add_image(directory, name, names[name])
+                self._changed = True
+
+    def _remove_file(self, directory, name):
+        with self._lock:
+            names = self._directories.get(directory, (None, {}, ()))[1]
+            if name in names:
+                self._remove_image(directory, name, names.pop(name))
+                self._changed = True
+
+    def _load_cache(self):
+        """
+        Fills the index from its cache file, if there is one for this root and these extensions.
+        The directories are read again by the next scan when their modification time changed.
+        """
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as file:
+                cache = json.load(file)
+            if (cache.get("version") != ART_INDEX_CACHE_VERSION or cache.get("root") != self.root or
+                    tuple(cache.get("extensions", ())) != self.extensions):
+                return
+            with self._lock:
+                for directory, (mtime, names, subdirectories) in cache["directories"].items():
+                    self._directories[directory] = (mtime, names, tuple(subdirectories))
+                    for name, normalized_name in names.items():
+                        self._add_image(directory, name, normalized_name)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading art index cache {self.cache_path}: {e}")
+            with self._lock:
+                self._directories.clear()
+                self._stems.clear()
+                self._images.clear()
+                self._match_stems.clear()
+                self._matches.clear()
+
+    def _save_cache(self):
+        """
+        Writes the index to its cache file if it changed since it was loaded or last saved.
+
+        The file is written under a temporary name first and then renamed, so an interrupted
+        save leaves the previous cache file intact.
+        """
+        if not self.cache_path or not self._changed:
+            return
+        with self._lock:
+            self._changed = False
+            directories = {directory: (mtime, dict(names), subdirectories)
+                           for directory, (mtime, names, subdirectories) in self._directories.items()}
+        cache = {"version": ART_INDEX_CACHE_VERSION, "root": self.root, "extensions": self.extensions,
+                 "directories": directories}
+        temporary_path = self.cache_path + ".tmp"
+        try:
+            with open(temporary_path, "w") as file:
+                json.dump(cache, file, separators=(",", ":"))
+            os.replace(temporary_path, self.cache_path)
+        except OSError as e:
+            print(f"Error saving art index cache {self.cache_path}: {e}")
+
+    def _scan_loop(self):
+        while not self._stop_event.wait(self.scan_interval):
+            try:
+                self.scan()
+                self._save_cache()
+            except Exception as e:
+                print(f"Error scanning {self.root}: {e}")
+
+    def _start_inotify(self):
+        """
+        Creates an inotify instance watching every directory of the tree.
+
+        :return: True if the whole tree is watched, False if inotify cannot be used.
+        :rtype: bool
+        """
+        libc = _load_inotify()
+        if libc is None or not os.path.isdir(self.root):
+            return False
+        self._libc = libc
+        fd = libc.inotify_init1(_IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self._inotify_fd = fd
+        with self._lock:
+            directories = list(self._directories)
+        for directory in directories:
+            if not self._add_watch(directory):
+                self._stop_inotify()
+                return False
+        # Catch up with what changed between the first scan and the watches
+        self.scan()
+        return True
+
+    def _stop_inotify(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+            self._watches.clear()
+
+    def _add_watch(self, directory):
+        """
+        Watches a directory.
+
+        :return: True if the directory is watched or no longer exists, False if inotify ran out of watches.
+        :rtype: bool
+        """
+        wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                print(f"Out of inotify watches for {directory}, scanning {self.root} instead")
+                return False
+            return error in (errno.ENOENT, errno.ENOTDIR)
+        self._watches[wd] = directory
+        return True
+
+    def _inotify_loop(self):
+        buffer_size = 64 * 1024
+        while not self._stop_event.is_set():
+            # Save the cache once the changes have settled
+            timeout = _CACHE_SAVE_DELAY if self._changed and self.cache_path else None
+            readable, _, _ = select.select([self._inotify_fd, self._wake_read], [], [], timeout)
+            if self._stop_event.is_set():
+                break
+            if not readable:
+                self._save_cache()
+                continue
+            try:
+                data = os.read(self._inotify_fd, buffer_size)
+                if not self._handle_inotify_events(data):
+                    # Fall back to scanning when events were lost and watches cannot be added
+                    self._stop_inotify()
+                    self.uses_inotify = False
+                    self.scan()
+                    self._scan_loop()
+                    return
+            except Exception as e:
+                print(f"Error watching {self.root}: {e}")
+
+    def _handle_inotify_events(self, data):
+        """
+        Applies a buffer of inotify events to the index.
+
+        :return: False if the index can no longer be kept up to date from inotify events.
+        :rtype: bool
+        """
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                self.scan()
+                if not self._watch_new_directories():
+                    return False
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & _IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                if directory == self.root:
+                    # The root itself went away, only a scan notices it coming back
+                    self._remove_directory(directory)
+                    return False
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if mask & _REMOVED_MASK:
+                    self._remove_directory(path)
+                    for other_wd, watched in list(self._watches.items()):
+                        if watched == path or watched.startswith(path + os.sep):
+                            self._libc.inotify_rm_watch(self._inotify_fd, other_wd)
+                            del self._watches[other_wd]
+                elif mask & _ADDED_MASK:
+                    # Files may have been added before the watch, so read the new tree too
+                    pending = [path]
+                    while pending:
+                        new_directory = pending.pop()
+                        if not self._add_watch(new_directory):
+                            return False
+                        pending.extend(self._read_directory(new_directory))
+            elif self._split(name) is not None:
+                if mask & _REMOVED_MASK:
+                    self._remove_file(directory, name)
+                elif mask & _ADDED_MASK:
+                    self._add_file(directory, name)
+        return True
+
+    def _watch_new_directories(self):
+        """
+        Watches the directories found by a scan that are not watched yet.
+
+        :return: False if inotify ran out of watches.
+        :rtype: bool
+        """
+        watched = set(self._watches.values())
+        with self._lock:
+            directories = [d for d in self._directories if d not in watched]
+        return all(self._add_watch(directory) for directory in directories)
+
+    def __str__(self):
+        if self._thread is None:
+            updates = "not updated"
+        elif self.uses_inotify:
+            updates = "inotify"
+        else:
+            updates = f"scanned every {self.scan_interval:g}s"
+        return f"ArtIndex({self.root}: {len(self._images)} images in {len(self._directories)} directories, {updates})"
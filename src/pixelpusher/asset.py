@@ -0,0 +1,205 @@
+from collections import namedtuple
+import mmap
+import os
+import struct
+
+# A frame rendered into the exact bytes sent to the display, and how long it is shown (in seconds)
+RenderedFrame = namedtuple('RenderedFrame', ['payload', 'duration'])
+
+# Compiled marquee assets are stored next to the source image, with this extension appended
+ASSET_EXTENSION = ".pmv"
+
+ASSET_MAGIC = b"PMVA"
+ASSET_VERSION = 1
+
+# Header flags
+ASSET_FLAG_COMPRESSED = 0b001  # Payloads use the compressed (zdat) format
+ASSET_FLAG_RESCALED = 0b010  # Source was rescaled to the display size instead of cropped
+ASSET_FLAG_OPAQUE = 0b100  # No frame has transparent pixels, so the background does not matter
+
+# magic, version, display, flags, width, height, color order (3 bytes), brightness,
+# background color (4 bytes), loop count (-1 if the source has none), frame count,
+# source modification time (ns), source size
+_HEADER = struct.Struct("<4sHBBHH3BB4BiIqq")
+# payload offset, payload length, frame duration (ms)
+_INDEX_ENTRY = struct.Struct("<QII")
+# The index is followed by the untranslated RGBA display buffer after rendering the first frame
+# (width * height * 4 bytes), and then by the payloads
+
+
+def asset_path_for(image_path):
+    """
+    Returns the path of the compiled asset belonging to a source image.
+
+    :param image_path: Path to the source image.
+    :return: Path to the compiled asset.
+    :rtype: str
+    """
+    return image_path + ASSET_EXTENSION
+
+
+def write_asset(output_path, display, width, height, color_order, compressed, rescaled, opaque, brightness,
+                background_color, loop, source_stat, frames, display_buffer):
+    """
+    Writes a compiled marquee asset.
+
+    The file is written under a temporary name first and then renamed, so a running
+    service never maps a half written asset.
+
+    :param output_path: Where to write the asset.
+    :param display: Type of display the frames were rendered for.
+    :param width: Width of the display.
+    :param height: Height of the display.
+    :param color_order: Color order the frames were translated to.
+    :param compressed: True if the payloads use the compressed format.
+    :param rescaled: True if the source was rescaled instead of cropped.
+    :param opaque: True if no frame has transparent pixels.
+    :param brightness: Brightness the frames were rendered with.
+    :param background_color: The RGBl color transparent pixels were blended against, or None for black.
+    :param loop: Loop count of the source GIF, or -1 if it has none.
+    :param source_stat: os.stat result of the source image.
+    :param frames: The frames, as RenderedFrame objects.
+    :param display_buffer: The RGBA display buffer with the first frame rendered into it.
+    """
+    if len(display_buffer) != width * height * 4:
+        raise ValueError(f"Display buffer of {len(display_buffer)} bytes does not match a {width}x{height} display")
+    flags = ((ASSET_FLAG_COMPRESSED if compressed else 0) | (ASSET_FLAG_RESCALED if rescaled else 0) |
+             (ASSET_FLAG_OPAQUE if opaque else 0))
+    background = tuple(background_color) if background_color else (0, 0, 0, 0)
+    header = _HEADER.pack(ASSET_MAGIC, ASSET_VERSION, display, flags, width, height, *color_order, brightness,
+                          *background, loop, len(frames), source_stat.st_mtime_ns, source_stat.st_size)
+
+    offset = _HEADER.size + _INDEX_ENTRY.size * len(frames) + len(display_buffer)
+    index = []
+    for rendered_frame in frames:
+        index.append(_INDEX_ENTRY.pack(offset, len(rendered_frame.payload), round(rendered_frame.duration * 1000)))
+        offset += len(rendered_frame.payload)
+
+    temp_path = output_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(header)
+        file.writelines(index)
+        file.write(display_buffer)
+        file.writelines(rendered_frame.payload for rendered_frame in frames)
+    os.replace(temp_path, output_path)
+
+
+class MarqueeAsset:
+    """
+    A compiled marquee asset, memory mapped from disk.
+
+    The frames are exposed as RenderedFrame objects whose payloads are memoryview
+    slices of the mapping, so they can be sent to the display without copying.
+
+    Attributes:
+        path (str): Path to the asset file.
+        display (int): Type of display the asset was compiled for.
+        size (tuple): Width and height of the display.
+        color_order (tuple): Color order the asset was compiled for.
+        compressed (bool): True if the payloads use the compressed format.
+        rescaled (bool): True if the source was rescaled instead of cropped.
+        opaque (bool): True if no frame has transparent pixels.
+        brightness (int): Brightness the asset was compiled with.
+        background_color (tuple): Background the transparent pixels were blended against.
+        loop (int): Loop count of the source GIF, or -1 if it has none.
+        display_buffer (memoryview): The RGBA display buffer with the first frame rendered into it.
+        source_mtime_ns (int): Modification time of the source image at compile time.
+        source_size (int): Size of the source image at compile time.
+        frames (list): The frames, as RenderedFrame objects.
+    """
+
+    def __init__(self, path):
+        """
+        Opens and maps an asset file.
+
+        :param path: Path to the asset file.
+        :raises ValueError: If the file is not a valid asset.
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self.display_buffer = None
+        self.frames = []
+        try:
+            self._parse()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def _parse(self):
+        if len(self._view) < _HEADER.size:
+            raise ValueError(f"{self.path} is too short to be a marquee asset")
+        (magic, version, self.display, flags, width, height, order_0, order_1, order_2, self.brightness,
+         red, green, blue, background_brightness, self.loop, frame_count, self.source_mtime_ns,
+         self.source_size) = _HEADER.unpack_from(self._view)
+        if magic != ASSET_MAGIC or version != ASSET_VERSION:
+            raise ValueError(f"{self.path} is not a version {ASSET_VERSION} marquee asset")
+        self.size = (width, height)
+        self.color_order = (order_0, order_1, order_2)
+        self.background_color = (red, green, blue, background_brightness)
+        self.compressed = bool(flags & ASSET_FLAG_COMPRESSED)
+        self.rescaled = bool(flags & ASSET_FLAG_RESCALED)
+        self.opaque = bool(flags & ASSET_FLAG_OPAQUE)
+
+        buffer_offset = _HEADER.size + frame_count * _INDEX_ENTRY.size
+        buffer_end = buffer_offset + width * height * 4
+        if buffer_end > len(self._view):
+            raise ValueError(f"{self.path} is truncated")
+        self.display_buffer = self._view[buffer_offset:buffer_end]
+
+        for i in range(frame_count):
+            offset, length, duration = _INDEX_ENTRY.unpack_from(self._view, _HEADER.size + i * _INDEX_ENTRY.size)
+            if offset + length > len(self._view):
+                raise ValueError(f"{self.path} is truncated")
+            self.frames.append(RenderedFrame(self._view[offset:offset + length], duration / 1000.0))
+
+    def is_fresh(self, image_path):
+        """
+        Checks whether the asset was compiled from the current version of the source image.
+
+        :param image_path: Path to the source image.
+        :return: True if the source image did not change since the asset was compiled.
+        :rtype: bool
+        """
+        try:
+            source_stat = os.stat(image_path)
+        except OSError:
+            return False
+        return source_stat.st_mtime_ns == self.source_mtime_ns and source_stat.st_size == self.source_size
+
+    def matches(self, display, color_order, compress, rescale, brightness, background_color):
+        """
+        Checks whether the asset shows the same thing as rendering the source with these parameters.
+
+        The background color only matters if the asset has transparent pixels.
+
+        :param display: Type of display the image is shown on.
+        :param color_order: Color order of the display.
+        :param compress: Boolean indicating whether the display expects compressed data.
+        :param rescale: If True, the image is rescaled to fit the display, otherwise it is cropped.
+        :param brightness: Brightness of the image.
+        :param background_color: The color used for filling transparent areas, or None.
+        :return: True if the asset can be used instead of the source image.
+        :rtype: bool
+        """
+        if (self.display, self.color_order, self.compressed, self.rescaled, self.brightness) != \
+                (display, tuple(color_order), bool(compress), bool(rescale), brightness):
+            return False
+        return self.opaque or (background_color is not None and tuple(background_color) == self.background_color)
+
+    def close(self):
+        """
+        Releases the frames and unmaps the file.
+        """
+        for rendered_frame in self.frames:
+            rendered_frame.payload.release()
+        self.frames = []
+        if self.display_buffer is not None:
+            self.display_buffer.release()
+            self.display_buffer = None
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # A frame is still referenced elsewhere, the mapping is closed when it is released
@@ -0,0 +1,476 @@
+import colorsys
+import hashlib
+import math
+from collections import namedtuple
+from .colors import RGBl
+
+# One step of a compiled attract program: the time it is due, in seconds from the start of
+# the program, the LEDs it changes as ((LED numbers, color), ...) in the order they are applied,
+# and optionally a FieldPattern that sets the colors of all LEDs on every refresh until the next step
+AttractStep = namedtuple('AttractStep', ['time', 'changes', 'field'], defaults=(None,))
+
+# A compiled attract program: its steps sorted by time, and the duration of one pass in seconds
+AttractProgram = namedtuple('AttractProgram', ['steps', 'duration'])
+
+# Pause at the end of a linear pattern, in seconds
+LINEAR_PATTERN_PAUSE = 0.2
+
+
+def attract_program_key(pattern_queue, coord_map, center=None, num_leds=None, frame_rate=None):
+    """
+    Calculates the key a compiled attract program is cached with: a hash of the pattern queue
+    and of the LED layout it was compiled for.
+
+    :param pattern_queue: A list of tuples (pattern_name, pattern_params).
+    :param coord_map: Dictionary mapping (x, y) coordinates to LED numbers.
+    :param center: The center of the circular and radial patterns.
+    :param num_leds: The number of LEDs.
+    :param frame_rate: The frame rate field patterns are compiled for.
+    :return: The hex digest of the hash.
+    :rtype: str
+    """
+    description = repr((pattern_queue, sorted(coord_map.items()), center, num_leds, frame_rate))
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def compile_attract_program(pattern_queue, coord_map, geometry, num_leds, frame_rate=60):
+    """
+    Compiles a pattern queue into the timed steps of one pass through all its patterns.
+
+    Each pattern is turned into steps using the precomputed geometry of the LEDs, with the
+    delay between steps added to the time of the next step instead of sleeping. Changes that
+    are due at the same time are merged into one step. A field pattern becomes a single step,
+    whose frames are rendered by the refresh thread while it plays. Patterns and directions
+    that are not recognized are reported and left out, as are coordinates of LEDs that do not
+    exist.
+
+    :param pattern_queue: A list of tuples (pattern_name, pattern_params).
+    :param coord_map: Dictionary mapping (x, y) coordinates to LED numbers.
+    :param geometry: GeometryIndex of coord_map.
+    :param num_leds: The number of LEDs.
+    :param frame_rate: Frames per second of the field patterns, normally the refresh rate.
+    :return: The compiled program.
+    :rtype: AttractProgram
+    """
+    steps = []
+    program_time = 0.0
+    all_leds = tuple(range(num_leds))
+    layout = None
+    for pattern_name, pattern_params in pattern_queue:
+        field_func = FIELD_PATTERNS.get(pattern_name)
+        if field_func is not None:
+            if layout is None:
+                layout = FieldLayout(coord_map, geometry, num_leds, frame_rate)
+            try:
+                field = field_func(layout, **pattern_params)
+            except TypeError as e:
+                print(f"Invalid parameters for pattern '{pattern_name}': {e}")
+                continue
+            if field is not None:
+                steps.append(AttractStep(program_time, [], field))
+                program_time += field.duration
+            continue
+        pattern_func = ATTRACT_PATTERNS.get(pattern_name)
+        if pattern_func is None:
+            print(f"Pattern '{pattern_name}' not recognized.")
+            continue
+        try:
+            pattern_steps = pattern_func(geometry, **pattern_params)
+        except TypeError as e:
+            print(f"Invalid parameters for pattern '{pattern_name}': {e}")
+            continue
+        for coords, color, delay in pattern_steps:
+            if coords is None:
+                led_numbers = all_leds
+            else:
+                led_numbers = tuple(coord_map[coord] for coord in coords if 0 <= coord_map[coord] < num_leds)
+            if led_numbers:
+                if steps and steps[-1].time == program_time and steps[-1].field is None:
+                    steps[-1].changes.append((led_numbers, color))
+                else:
+                    steps.append(AttractStep(program_time, [(led_numbers, color)]))
+            program_time += delay
+    steps = [AttractStep(step.time, tuple(step.changes), step.field) for step in steps]
+    return AttractProgram(tuple(steps), program_time)
+
+
+# The pattern functions return the steps of a pattern as a list of (coordinates, color, delay)
+# tuples, where coordinates None stands for all LEDs and delay is the time until the next step
+
+def _pattern_linear(geometry, direction, color_on=RGBl(31, 31, 31, 5), color_off=None, delay=0.05):
+    """
+    Linear pattern, lighting the LEDs one column or row per step.
+
+    :param geometry: GeometryIndex of the LEDs.
+    :param direction: Direction of the pattern ('left_to_right', 'right_to_left', 'top_to_bottom', 'bottom_to_top')
+    :param color_on: Color when LEDs are activated.
+    :param color_off: Color when LEDs are reset.
+    :param delay: Delay between steps.
+    """
+    if direction == 'left_to_right':
+        lines = [geometry.columns.get(x, ()) for x in range(geometry.min_x, geometry.max_x + 1)]
+    elif direction == 'right_to_left':
+        lines = [geometry.columns.get(x, ()) for x in reversed(range(geometry.min_x, geometry.max_x + 1))]
+    elif direction == 'top_to_bottom':
+        lines = [geometry.rows.get(y, ()) for y in range(geometry.min_y, geometry.max_y + 1)]
+    elif direction == 'bottom_to_top':
+        lines = [geometry.rows.get(y, ()) for y in reversed(range(geometry.min_y, geometry.max_y + 1))]
+    else:
+        print(f"Direction '{direction}' not recognized.")
+        return []
+
+    steps = [(None, color_off, 0.0)] if color_off else []
+    # One column or row per step (including empty ones, to keep the speed even)
+    steps.extend((line, color_on, delay) for line in lines)
+    steps.append(((), None, LINEAR_PATTERN_PAUSE))
+    return steps
+
+
+def _pattern_circular(geometry, direction, color_on=RGBl(31, 31, 31, 5), color_off=RGBl(0, 0, 0, 0), delay=0.05):
+    """
+    Circular pattern, lighting the LEDs one ring around the center per step.
+
+    :param geometry: GeometryIndex of the LEDs.
+    :param direction: Direction of the pattern ('outward', 'inward')
+    :param color_on: Color when LEDs are activated.
+    :param color_off: Color when LEDs are reset.
+    :param delay: Delay between steps.
+    """
+    if direction == 'outward':
+        rings = geometry.rings
+    elif direction == 'inward':
+        rings = reversed(geometry.rings)
+    else:
+        print(f"Direction '{direction}' not recognized for circular pattern.")
+        return []
+
+    steps = [(None, color_off, 0.0)] if color_off else []
+    steps.extend((ring, color_on, delay) for ring in rings)
+    return steps
+
+
+def _pattern_radial(geometry, direction, color_on=RGBl(31, 31, 0, 5), color_off=RGBl(0, 0, 0, 0), delay=0.05):
+    """
+    Radial pattern, lighting the LEDs one by one around the center.
+
+    :param geometry: GeometryIndex of the LEDs.
+    :param direction: Direction of the pattern ('clockwise', 'anticlockwise')
+    :param color_on: Color when LEDs are activated.
+    :param color_off: Color when LEDs are reset.
+    :param delay: Delay between steps.
+    """
+    angular_order = geometry.angular_order
+    if direction == 'anticlockwise':
+        angular_order = reversed(angular_order)
+
+    steps = [(None, color_off, 0.0)] if color_off else []
+    steps.extend(((coord,), color_on, delay) for coord in angular_order)
+    return steps
+
+
+ATTRACT_PATTERNS = {
+    'linear': _pattern_linear,
+    'radial': _pattern_radial,
+    'circular': _pattern_circular,
+}
+
+
+class FieldLayout:
+    """
+    The LEDs of a coordinate map, prepared for evaluating field patterns on all of them at once.
+
+    Attributes:
+        led_numbers (list): Numbers of the mapped LEDs that exist.
+        xs (list): x coordinate of each of these LEDs.
+        ys (list): y coordinate of each of these LEDs.
+        geometry (GeometryIndex): Layout of the coordinate map.
+        num_leds (int): The number of LEDs, mapped or not.
+        frame_rate (float): Frames per second the patterns are played at.
+        size (float): Largest side of the bounding box of the coordinates, at least 1.
+        unmapped_runs (list): (first LED number, number of LEDs) of each run of LEDs that are not mapped.
+    """
+
+    def __init__(self, coord_map, geometry, num_leds, frame_rate):
+        coords = [coord for coord, led_number in coord_map.items() if 0 <= led_number < num_leds]
+        self.led_numbers = [coord_map[coord] for coord in coords]
+        self.xs = [x for x, _ in coords]
+        self.ys = [y for _, y in coords]
+        self.geometry = geometry
+        self.num_leds = num_leds
+        self.frame_rate = frame_rate
+        self.size = max(geometry.max_x - geometry.min_x, geometry.max_y - geometry.min_y, 1)
+        self.unmapped_runs = []
+        mapped = set(self.led_numbers)
+        for led_number in range(num_leds):
+            if led_number not in mapped:
+                if self.unmapped_runs and sum(self.unmapped_runs[-1]) == led_number:
+                    self.unmapped_runs[-1] = (self.unmapped_runs[-1][0], self.unmapped_runs[-1][1] + 1)
+                else:
+                    self.unmapped_runs.append((led_number, 1))
+
+    def phase_bytes(self, phases):
+        """
+        Turns a phase of each mapped LED into one byte per LED number, for bytes.translate.
+
+        :param phases: Phase of each mapped LED in palette steps, in the order of led_numbers.
+        :return: The phases rounded down and taken modulo PALETTE_SIZE, 0 for the LEDs that are not mapped.
+        :rtype: bytes
+        """
+        phase_bytes = bytearray(self.num_leds)
+        for led_number, phase in zip(self.led_numbers, phases):
+            phase_bytes[led_number] = math.floor(phase) & PALETTE_MASK
+        return bytes(phase_bytes)
+
+
+def _rotated(table, shift):
+    """
+    Rotates a 256 byte translation table, so that index i looks up table[(i + shift) % 256].
+    """
+    shift &= PALETTE_MASK
+    return table[shift:] + table[:shift]
+
+
+class FieldPattern:
+    """
+    A field pattern ready to play: its frames are rendered one at a time, when they are shown,
+    instead of all of them up front.
+
+    A frame is a palette lookup for every LED. The palette indices of all LEDs come as one
+    bytes object, and each color channel of the frame is filled with a single bytes.translate
+    through that channel of the palette and an extended slice assignment, so rendering a frame
+    runs no Python code per LED. LEDs that are not mapped show color_off.
+
+    Attributes:
+        duration (float): Seconds the pattern plays.
+        frame_count (int): Number of frames, one per refresh at the frame rate of the layout.
+    """
+
+    def __init__(self, layout, duration, palette, color_off, indices_at):
+        """
+        :param layout: FieldLayout of the LEDs.
+        :param duration: Seconds the pattern plays.
+        :param palette: PALETTE_SIZE colors, each 4 bytes (RGBl).
+        :param color_off: Color of the LEDs that are not mapped.
+        :param indices_at: Function returning the palette indices of a time in seconds, as a bytes object
+            with one index per LED number and a shift added to all of them (modulo PALETTE_SIZE).
+        """
+        self.duration = duration
+        self.frame_count = max(1, round(duration * layout.frame_rate))
+        self._delay = duration / self.frame_count
+        self._frame_size = layout.num_leds * 4
+        self._channels = [bytes(color[channel] for color in palette) for channel in range(4)]
+        off = _color_bytes(color_off)
+        self._unmapped_slices = [(slice(first_led * 4, (first_led + count) * 4), off * count)
+                                 for first_led, count in layout.unmapped_runs]
+        self._indices_at = indices_at
+
+    def frame_index(self, elapsed):
+        """
+        Returns the index of the frame shown at a time.
+
+        :param elapsed: Seconds since the pattern started.
+        :rtype: int
+        """
+        if self._delay <= 0:
+            return 0
+        return min(max(int(elapsed / self._delay), 0), self.frame_count - 1)
+
+    def render(self, frame_index):
+        """
+        Renders a frame.
+
+        :param frame_index: Index of the frame, see frame_index.
+        :return: The colors of all LEDs, 4 bytes (RGBl) per LED.
+        :rtype: bytes
+        """
+        indices, shift = self._indices_at(frame_index * self._delay)
+        frame = bytearray(self._frame_size)
+        for channel, table in enumerate(self._channels):
+            frame[channel::4] = indices.translate(_rotated(table, shift))
+        for led_slice, colors in self._unmapped_slices:
+            frame[led_slice] = colors
+        return bytes(frame)
+
+
+# Number of colors in the palette of a field pattern, a field value of 1.0 wraps around the palette once.
+# Palette indices are bytes, so that a frame can be looked up with bytes.translate
+PALETTE_SIZE = 256
+PALETTE_MASK = PALETTE_SIZE - 1
+# Largest value of one of the four waves of the plasma pattern, so that their sum fits in a byte
+PLASMA_WAVE_MAX = 63
+
+
+def _color_bytes(color):
+    """
+    Converts an RGBl color to the 4 bytes of a frame, limiting the brightness to 0-31.
+    """
+    if not color:
+        return bytes(4)
+    red, green, blue, brightness = color
+    return bytes((red & 0xFF, green & 0xFF, blue & 0xFF, brightness & 0x1F))
+
+
+def _gradient_palette(color_off, color_on):
+    """
+    Palette going from color_off to color_on and back again, following a sine wave.
+    """
+    color_off = color_off or RGBl(0, 0, 0, 0)
+    palette = []
+    for index in range(PALETTE_SIZE):
+        ratio = (1 - math.cos(2 * math.pi * index / PALETTE_SIZE)) / 2
+        palette.append(_color_bytes(tuple(int(start + (end - start) * ratio)
+                                          for start, end in zip(color_off, color_on))))
+    return palette
+
+
+def _rainbow_palette(value, brightness):
+    """
+    Palette with all hues, at full saturation and the given value (0-255) and brightness (0-31).
+    """
+    palette = []
+    for index in range(PALETTE_SIZE):
+        red, green, blue = colorsys.hsv_to_rgb(index / PALETTE_SIZE, 1.0, 1.0)
+        palette.append(_color_bytes((int(red * value), int(green * value), int(blue * value), brightness)))
+    return palette
+
+
+def _direction_vector(direction):
+    """
+    Unit vector of a wave direction: a linear pattern direction or an angle in degrees (clockwise from the x axis).
+    """
+    angles = {'left_to_right': 0, 'top_to_bottom': 90, 'right_to_left': 180, 'bottom_to_top': 270}
+    angle = math.radians(angles.get(direction, direction))
+    return math.cos(angle), math.sin(angle)
+
+
+# The field pattern functions return a FieldPattern, or None if the parameters are not valid.
+# They calculate one byte per LED (a phase, in palette steps) up front, so rendering a frame
+# only shifts the phases of all LEDs at once and looks the colors up in a palette.
+
+def _pattern_wave(layout, direction='left_to_right', color_on=RGBl(31, 31, 31, 5), color_off=RGBl(0, 0, 0, 0),
+                  wavelength=None, speed=1.0, duration=5.0):
+    """
+    Field pattern of a wave moving across the LEDs.
+
+    :param layout: FieldLayout of the LEDs.
+    :param direction: Direction the wave moves in: 'left_to_right', 'right_to_left', 'top_to_bottom',
+        'bottom_to_top' or an angle in degrees.
+    :param color_on: Color of the crests.
+    :param color_off: Color of the troughs, and of the LEDs that are not mapped.
+    :param wavelength: Distance between two crests in world coordinates, defaults to half the size of the layout.
+    :param speed: Crests passing each LED per second.
+    :param duration: Seconds the pattern plays.
+    """
+    if not isinstance(direction, (int, float)) and direction not in \
+            ('left_to_right', 'right_to_left', 'top_to_bottom', 'bottom_to_top'):
+        print(f"Direction '{direction}' not recognized for wave pattern.")
+        return None
+    wavelength = wavelength or layout.size / 2
+    dx, dy = _direction_vector(direction)
+    phases = layout.phase_bytes((x * dx + y * dy) / wavelength * PALETTE_SIZE for x, y in zip(layout.xs, layout.ys))
+
+    def indices_at(t):
+        return phases, -math.floor(t * speed * PALETTE_SIZE)
+
+    return FieldPattern(layout, duration, _gradient_palette(color_off, color_on), color_off, indices_at)
+
+
+def _pattern_ripple(layout, origin=None, color_on=RGBl(31, 31, 31, 5), color_off=RGBl(0, 0, 0, 0),
+                    wavelength=None, speed=1.0, duration=5.0):
+    """
+    Field pattern of rings moving outward from a point.
+
+    :param layout: FieldLayout of the LEDs.
+    :param origin: The (x, y) point the rings start from, defaults to the center of the layout.
+    :param color_on: Color of the rings.
+    :param color_off: Color between the rings, and of the LEDs that are not mapped.
+    :param wavelength: Distance between two rings in world coordinates, defaults to a quarter of the size of the layout.
+    :param speed: Rings passing each LED per second.
+    :param duration: Seconds the pattern plays.
+    """
+    origin_x, origin_y = origin if origin is not None else layout.geometry.center
+    wavelength = wavelength or layout.size / 4
+    phases = layout.phase_bytes(math.hypot(x - origin_x, y - origin_y) / wavelength * PALETTE_SIZE
+                                for x, y in zip(layout.xs, layout.ys))
+
+    def indices_at(t):
+        return phases, -math.floor(t * speed * PALETTE_SIZE)
+
+    return FieldPattern(layout, duration, _gradient_palette(color_off, color_on), color_off, indices_at)
+
+
+def _pattern_rainbow(layout, direction='clockwise', value=255, brightness=5, color_off=RGBl(0, 0, 0, 0),
+                     speed=0.25, duration=5.0):
+    """
+    Field pattern of a rainbow around the center, rotating.
+
+    :param layout: FieldLayout of the LEDs.
+    :param direction: Direction of the rotation ('clockwise', 'anticlockwise')
+    :param value: Largest value of a color channel, 0-255.
+    :param brightness: Brightness of the LEDs, 0-31.
+    :param color_off: Color of the LEDs that are not mapped.
+    :param speed: Rotations per second.
+    :param duration: Seconds the pattern plays.
+    """
+    if direction == 'clockwise':
+        speed = -speed
+    elif direction != 'anticlockwise':
+        print(f"Direction '{direction}' not recognized for rainbow pattern.")
+        return None
+    angles = layout.geometry.angles
+    phases = layout.phase_bytes(angles[(x, y)] / (2 * math.pi) * PALETTE_SIZE for x, y in zip(layout.xs, layout.ys))
+
+    def indices_at(t):
+        return phases, math.floor(t * speed * PALETTE_SIZE)
+
+    return FieldPattern(layout, duration, _rainbow_palette(value, brightness), color_off, indices_at)
+
+
+def _pattern_plasma(layout, value=255, brightness=5, color_off=RGBl(0, 0, 0, 0), scale=None,
+                    speed=0.25, duration=10.0):
+    """
+    Field pattern of flowing plasma, the sum of four sine waves mapped onto the hues.
+
+    :param layout: FieldLayout of the LEDs.
+    :param value: Largest value of a color channel, 0-255.
+    :param brightness: Brightness of the LEDs, 0-31.
+    :param color_off: Color of the LEDs that are not mapped.
+    :param scale: Size of the blobs in world coordinates, defaults to a third of the size of the layout.
+    :param speed: Speed of the flow, in turns of the sine waves per second.
+    :param duration: Seconds the pattern plays.
+    """
+    scale = scale or layout.size / 3
+    center_x, center_y = layout.geometry.center
+    # One period of a sine wave, scaled to 0-PLASMA_WAVE_MAX, so the sum of the four waves of an LED fits in a byte
+    sine = bytes(round((math.sin(2 * math.pi * index / PALETTE_SIZE) + 1) * PLASMA_WAVE_MAX / 2)
+                 for index in range(PALETTE_SIZE))
+    # Phases of the horizontal, vertical, diagonal and circular waves of each LED
+    xs, ys = layout.xs, layout.ys
+    horizontal = layout.phase_bytes(x / scale * PALETTE_SIZE for x in xs)
+    vertical = layout.phase_bytes(y / scale * PALETTE_SIZE for y in ys)
+    diagonal = layout.phase_bytes((x + y) / (2 * scale) * PALETTE_SIZE for x, y in zip(xs, ys))
+    circular = layout.phase_bytes(math.hypot(x - center_x, y - center_y) / scale * PALETTE_SIZE for x, y in zip(xs, ys))
+    # The sum of the waves, from 0 to 4 * PLASMA_WAVE_MAX, covers the hues twice
+    hues = bytes(int(total * 2 * PALETTE_SIZE / (4 * PLASMA_WAVE_MAX)) & PALETTE_MASK for total in range(PALETTE_SIZE))
+    num_leds = layout.num_leds
+
+    def indices_at(t):
+        shift = t * speed * PALETTE_SIZE
+        shift_1 = int(shift)
+        waves = (horizontal.translate(_rotated(sine, shift_1)),
+                 vertical.translate(_rotated(sine, -int(shift * 0.7))),
+                 diagonal.translate(_rotated(sine, int(shift * 1.3))),
+                 circular.translate(_rotated(sine, -shift_1)))
+        # Add the waves of all LEDs at once, as the bytes of one integer; no byte overflows into the next
+        total = sum(int.from_bytes(wave, 'little') for wave in waves)
+        return total.to_bytes(num_leds, 'little').translate(hues), int(shift / 4)
+
+    return FieldPattern(layout, duration, _rainbow_palette(value, brightness), color_off, indices_at)
+
+
+FIELD_PATTERNS = {
+    'plasma': _pattern_plasma,
+    'wave': _pattern_wave,
+    'rainbow': _pattern_rainbow,
+    'ripple': _pattern_ripple,
+}
@@ -1,18 +1,339 @@
+import bisect
+from concurrent.futures import ThreadPoolExecutor
 import time
-import serial
 import threading
 import math
+import sys
+from array import array
+from collections import namedtuple
+from .attract import attract_program_key, compile_attract_program
 from .colors import RGBl
+from .geometry import GeometryIndex
+from .transport import SerialTransport
+
+# LED modes, as stored in PlasmaButtons
+LED_MODE_NORMAL = 0
+LED_MODE_BLINK = 1
+LED_MODE_FADE = 2
+LED_MODE_FADE_SWEEP = 3
+LED_MODE_SYNC_BLINK = 4
+
+LED_MODES = {
+    'normal': LED_MODE_NORMAL,
+    'blink': LED_MODE_BLINK,
+    'sync blink': LED_MODE_SYNC_BLINK,
+    'fade': LED_MODE_FADE,
+    'fade sweep': LED_MODE_FADE_SWEEP,
+}
+LED_MODE_NAMES = {code: name for name, code in LED_MODES.items()}
+
+# Effect id of the LEDs that have an effect of their own, see PlasmaButtons._solo_effects
+SOLO_EFFECT_ID = -1
+
+# Number of compiled attract programs a PlasmaButtons object keeps
+ATTRACT_PROGRAM_CACHE_SIZE = 8
+
+# Effects of press_button, and the priority of their timeline tracks
+PRESS_EFFECTS = ('flash', 'ripple')
+PRESS_PRIORITY = 10
+
+# The mode and parameters of an LED, as passed to set_led_mode
+LedEffect = namedtuple('LedEffect', ['mode', 'color_to', 'color_from', 'transition_time'],
+                       defaults=('normal', None, None, None))
+
+# One device of a button surface that spans several controllers: its serial port and its number
+# of LEDs. The controllers get consecutive ranges of LED numbers, in the order they are listed
+ButtonController = namedtuple('ButtonController', ['serial_port_path', 'num_leds'])
+
+# A keyframe of a timeline track: the time in seconds from the start of the track, the color
+# (RGBl) and brightness factor (0.0 to 1.0, scales red, green and blue) at that time, the
+# easing of the change towards the next keyframe, and the opacity (0.0 to 1.0, multiplied by
+# the opacity of the track). A color, brightness or opacity of None repeats the value of the
+# previous keyframe
+Keyframe = namedtuple('Keyframe', ['time', 'color', 'brightness', 'easing', 'opacity'],
+                      defaults=(None, None, 'linear', None))
+
+# Targets of a timeline track, next to LED numbers (int), button labels (str) and world coordinates
+# ((x, y) tuples): a button by number, and all LEDs in a rectangle of world coordinates (inclusive)
+Button = namedtuple('Button', ['number'])
+Region = namedtuple('Region', ['min_x', 'min_y', 'max_x', 'max_y'])
+
+# Easing functions of keyframes, mapping the fraction of time between two keyframes to the fraction of the change
+EASINGS = {
+    'linear': lambda ratio: ratio,
+    'step': lambda ratio: 0.0,
+    'ease in': lambda ratio: ratio * ratio,
+    'ease out': lambda ratio: ratio * (2 - ratio),
+    'ease in out': lambda ratio: ratio * ratio * (3 - 2 * ratio),
+}
+
+
+def _effect_color(now, mode, start_time, transition_time, color_from, color_to):
+    """
+    Calculates the color of an LED effect.
+
+    :param now: Clock time to calculate the color for.
+    :param mode: The LED_MODE_* code of the effect, not LED_MODE_NORMAL.
+    :param start_time: Clock time the effect started at.
+    :param transition_time: Seconds per blink cycle for blinking modes, duration for fade modes.
+    :param color_from: RGBl tuple of the off color for blinking modes, the start color for fade modes.
+    :param color_to: RGBl tuple of the blink color for blinking modes, the target color for fade modes.
+    :return: The red, green, blue and brightness values, not masked yet.
+    :rtype: tuple
+    """
+    elapsed = now - start_time
+    if mode == LED_MODE_SYNC_BLINK:
+        elapsed = now  # Phase locked to the clock instead of to the moment the mode was set
+        mode = LED_MODE_BLINK
+    if mode == LED_MODE_BLINK:
+        # First half of every cycle shows color_to, the second half color_from
+        if transition_time <= 0 or (elapsed % transition_time) < (transition_time / 2):
+            return color_to
+        return color_from
+    if mode == LED_MODE_FADE:
+        if elapsed >= transition_time:
+            return color_to
+        ratio = elapsed / transition_time
+    elif transition_time <= 0:
+        return color_from
+    else:  # LED_MODE_FADE_SWEEP, from color_from to color_to and back again every transition_time
+        elapsed %= transition_time
+        half_time = transition_time / 2
+        if elapsed < half_time:
+            ratio = elapsed / half_time
+        else:
+            ratio = (transition_time - elapsed) / half_time
+    red_from, green_from, blue_from, brightness_from = color_from
+    red_to, green_to, blue_to, brightness_to = color_to
+    return (int(red_from + (red_to - red_from) * ratio),
+            int(green_from + (green_to - green_from) * ratio),
+            int(blue_from + (blue_to - blue_from) * ratio),
+            int(brightness_from + (brightness_to - brightness_from) * ratio))
 
 
 class LEDStatus:
+    # Snapshot of the state of one LED, as returned by PlasmaButtons.get_led_status
     def __init__(self):
         # Initialize LED status to default values
         self.mode = 'normal'  # Mode of operation ('normal', 'blink', 'sync blink', 'fade', 'fade sweep')
-        self.color_from = RGBl(0, 0, 0, 0)  # Off color for blinking modes, start color for fade modes
-        self.transition_time = 0  # Blinks per second for blinking modes
+        self.color_from = RGBl(0, 0, 0, 0)  # Off color for blinking modes, start color for fade modes, else color_to
+        self.transition_time = 0  # Seconds per blink cycle for blinking modes, duration for fade modes
         self.color_to = RGBl(0, 0, 0, 0)  # Normal color, target color for fade modes, blink color for blink modes
-        self.ticks_since_last_transition = 0  # Ticks since the last transition for timing calculations
+        self.time_since_last_transition = 0.0  # Seconds since the current mode was set, 0.0 in normal mode
+
+
+class LedBatch:
+    """
+    Collects LED mode changes and applies them to PlasmaButtons all at once.
+
+    The methods mirror those of PlasmaButtons. Targets and modes are checked when a change
+    is added; commit applies all changes under one lock, so the refresh thread either sends
+    the frame before the batch or the frame with every change in it. Used as a context
+    manager, the batch is committed when the block ends without an exception:
+
+        with plasma_buttons.batch() as batch:
+            batch.set_all_leds(color_to=C64_BLACK)
+            batch.set_button_mode_by_label("P1:A", "blink", color_to=C64_RED, transition_time=0.5)
+    """
+
+    def __init__(self, plasma_buttons):
+        """
+        Initializes an empty batch.
+
+        :param plasma_buttons: The PlasmaButtons object the changes are applied to.
+        """
+        self._plasma_buttons = plasma_buttons
+        self._changes = []  # (LED numbers, mode code, color_to, color_from, transition_time)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def __len__(self):
+        return len(self._changes)
+
+    def set_led_mode(self, led_number, mode, color_to=None, color_from=None, transition_time=None):
+        """
+        Set the mode and parameters for a specific LED. See PlasmaButtons.set_led_mode.
+        """
+        self.set_leds_mode((led_number,), mode, color_to, color_from, transition_time)
+
+    def set_leds_mode(self, led_numbers, mode, color_to=None, color_from=None, transition_time=None):
+        """
+        Set the same mode and parameters for several LEDs.
+
+        LEDs set by one call that end up in the same state share their effect, so its
+        color is calculated once per refresh for all of them.
+
+        :param led_numbers: Iterable of LED indices.
+        :param mode: The mode to set, see PlasmaButtons.set_led_mode.
+        :param color_to: The target color or blink color.
+        :param color_from: The starting color for fade or off color for blinking.
+        :param transition_time: The duration of a fade, or of one blink cycle, in seconds.
+        """
+        mode_code = LED_MODES.get(mode)
+        if mode_code is None:
+            print(f"Mode '{mode}' not recognized.")
+            return
+        num_leds = self._plasma_buttons.num_leds
+        led_numbers = tuple(led_numbers)
+        for led_number in led_numbers:
+            if not 0 <= led_number < num_leds:
+                print(f"LED {led_number} does not exist.")
+                return
+        self._changes.append((led_numbers, mode_code, color_to, color_from, transition_time))
+
+    def set_all_leds(self, mode="normal", color_to=None, color_from=None, transition_time=None):
+        """
+        Set the mode and parameters for all LEDs.
+        """
+        self.set_leds_mode(range(self._plasma_buttons.num_leds), mode, color_to, color_from, transition_time)
+
+    def set_button_mode(self, button_number, mode, color_to=None, color_from=None, transition_time=None):
+        """
+        Set the mode and parameters for all LEDs in a button by button number. See PlasmaButtons.set_button_mode.
+        """
+        # Update all LEDs in the specified button (assuming 4 LEDs per button)
+        self.set_leds_mode(range(button_number * 4, (button_number + 1) * 4), mode,
+                           color_to, color_from, transition_time)
+
+    def set_button_mode_by_label(self, button_label, mode, color_to=None, color_from=None, transition_time=None):
+        """
+        Set the mode and parameters for all LEDs in a button by button label. Unknown labels are ignored.
+        """
+        button_map = self._plasma_buttons.button_map
+        if button_map and button_label in button_map:
+            self.set_button_mode(button_map[button_label], mode, color_to, color_from, transition_time)
+
+    def set_led_mode_by_coord(self, coord, mode, color_to=None, color_from=None, transition_time=None):
+        """
+        Set the mode and parameters for a specific LED by world coordinate. Unknown coordinates are ignored.
+        """
+        coord_map = self._plasma_buttons.coord_map
+        if coord_map and coord in coord_map:
+            self.set_led_mode(coord_map[coord], mode, color_to, color_from, transition_time)
+
+    def set_effects(self, effects):
+        """
+        Set the mode and parameters of many LEDs and buttons at once.
+
+        :param effects: Dictionary mapping targets to LedEffect tuples (or tuples with the same fields).
+            A target is an LED number (int), a button label (str) or a world coordinate (tuple).
+        """
+        for target, effect in effects.items():
+            effect = LedEffect(*effect)
+            if isinstance(target, str):
+                self.set_button_mode_by_label(target, *effect)
+            elif isinstance(target, tuple):
+                self.set_led_mode_by_coord(target, *effect)
+            else:
+                self.set_led_mode(target, *effect)
+
+    def commit(self):
+        """
+        Applies the collected changes, in the order they were added, and empties the batch.
+        """
+        changes, self._changes = self._changes, []
+        if changes:
+            self._plasma_buttons._apply_changes(changes)
+
+
+class TimelineTrack:
+    """
+    A keyframed color animation bound to a set of LEDs.
+
+    Tracks are played with PlasmaButtons.play_timeline. Every refresh, each playing track is
+    evaluated once and its color is blended over the LEDs it is bound to, on top of their mode.
+    Tracks are applied from low to high priority, so where tracks overlap, the one with the
+    highest priority ends up on top; with an opacity below 1.0, the tracks below show through.
+    A track that does not loop is removed after its last keyframe, and its LEDs show their
+    mode again.
+
+        track = TimelineTrack("P1:A", [Keyframe(0.0, C64_BLACK),
+                                       Keyframe(0.3, C64_RED, easing='ease out'),
+                                       Keyframe(1.0, C64_BLACK)], priority=1)
+        plasma_buttons.play_timeline([track])
+
+    Attributes:
+        target: The LEDs of the track: an LED number, button label, world coordinate, Button,
+            Region, or a list of these.
+        keyframes (list): The keyframes, sorted by time.
+        priority (int): Tracks with a higher priority are drawn over those with a lower one.
+        loop (bool): Start again after the last keyframe instead of finishing.
+        opacity (float): How much of the LEDs' color below the track shows through, from 0.0 (all) to 1.0 (none).
+        delay (float): Seconds between starting the timeline and starting this track.
+        duration (float): Time of the last keyframe, in seconds.
+    """
+
+    def __init__(self, target, keyframes, priority=0, loop=False, opacity=1.0, delay=0.0):
+        """
+        Initializes the TimelineTrack object.
+
+        :param target: The LEDs of the track, see the target attribute.
+        :param keyframes: Keyframe tuples (or tuples with the same fields). The first keyframe needs a color.
+        :param priority: Tracks with a higher priority are drawn over those with a lower one.
+        :param loop: Start again after the last keyframe instead of finishing.
+        :param opacity: From 0.0 (transparent) to 1.0 (opaque).
+        :param delay: Seconds between starting the timeline and starting this track. The track
+            does not change its LEDs until then.
+        :raises ValueError: If there are no keyframes, the first one has no color or an easing is not known.
+        """
+        keyframes = sorted((Keyframe(*keyframe) for keyframe in keyframes), key=lambda keyframe: keyframe.time)
+        if not keyframes or keyframes[0].color is None:
+            raise ValueError("The first keyframe of a track needs a color")
+        self.target = target
+        self.keyframes = keyframes
+        self.priority = priority
+        self.loop = loop
+        self.opacity = opacity
+        self.delay = delay
+        self.duration = keyframes[-1].time
+
+        # Resolve the keyframes once into parallel lists, so evaluating the track is a lookup and one interpolation
+        self._times = []
+        self._values = []  # (red, green, blue, brightness level, brightness factor, opacity) per keyframe
+        self._easings = []
+        color = None
+        brightness = 1.0
+        keyframe_opacity = 1.0
+        for keyframe in keyframes:
+            easing = EASINGS.get(keyframe.easing)
+            if easing is None:
+                raise ValueError(f"Easing '{keyframe.easing}' not recognized.")
+            color = keyframe.color if keyframe.color is not None else color
+            brightness = keyframe.brightness if keyframe.brightness is not None else brightness
+            keyframe_opacity = keyframe.opacity if keyframe.opacity is not None else keyframe_opacity
+            self._times.append(keyframe.time)
+            self._values.append((*color, brightness, keyframe_opacity * opacity))
+            self._easings.append(easing)
+
+    def color_at(self, elapsed):
+        """
+        Calculates the color of the track at a time.
+
+        :param elapsed: Seconds since the track started.
+        :return: Red, green, blue, brightness level and opacity.
+        :rtype: tuple
+        """
+        times = self._times
+        if self.loop and self.duration > 0:
+            elapsed %= self.duration
+        index = bisect.bisect_right(times, elapsed) - 1
+        if index < 0:
+            red, green, blue, level, factor, opacity = self._values[0]
+        elif index >= len(times) - 1:
+            red, green, blue, level, factor, opacity = self._values[-1]
+        else:
+            ratio = self._easings[index]((elapsed - times[index]) / (times[index + 1] - times[index]))
+            value_from = self._values[index]
+            value_to = self._values[index + 1]
+            red, green, blue, level, factor, opacity = (start + (end - start) * ratio
+                                                        for start, end in zip(value_from, value_to))
+        return int(red * factor), int(green * factor), int(blue * factor), int(level), opacity
 
 
 class PlasmaButtons:
@@ -21,27 +342,118 @@ class PlasmaButtons:
     BRIGHTNESS_MASK = 0b00011111  # Mask to limit brightness values to a maximum of 31
 
     def __init__(self, num_leds, serial_port_path="/dev/plasmabuttons",
-                 refresh_rate=60, button_map=None, coord_map=None):
+                 refresh_rate=60, button_map=None, coord_map=None, keepalive_interval=5.0, coord_center=None,
+                 controllers=None):
         """
         Initialize the PlasmaButtons class.
+
+        The attract mode patterns use a GeometryIndex of coord_map, built when coord_map is
+        set. Assign a new map to coord_map (or change coord_center) to rebuild it. Distances
+        and angles are measured from coord_center, or from the middle of the map if it is None.
+
+        Frames that did not change since the previous refresh are not sent, except once
+        every keepalive_interval seconds so the LEDs recover after a reset. The transport's
+        frames_sent and frames_skipped counters show how many frames were sent and skipped.
+
+        Effects are timed from the moment their mode is set, using the clock attribute
+        (time.monotonic), so blink and fade durations do not depend on how long a refresh takes.
+
+        The display is refreshed refresh_rate times per second while something is animating.
+        When every LED shows a fixed color, the refresh thread sleeps until the LEDs change, or
+        until the frame has to be sent again to keep the LEDs alive.
+
+        A surface with more LEDs than one device drives is spread over several controllers,
+        given as a list of ButtonController tuples instead of serial_port_path. The LEDs keep
+        one numbering, coordinate space and button_map; each controller is sent its own range
+        of LEDs, and the controllers are written at the same time, each through its own
+        transport in the transports list.
         """
+        if controllers:
+            controllers = [ButtonController(*controller) for controller in controllers]
+            total_leds = sum(controller.num_leds for controller in controllers)
+            if num_leds is not None and num_leds != total_leds:
+                print(f"The controllers have {total_leds} LEDs instead of {num_leds}, using {total_leds}.")
+            num_leds = total_leds
+        else:
+            controllers = [ButtonController(serial_port_path, num_leds)]
         self.num_leds = num_leds
         self.button_leds = bytearray([0] * (num_leds * 4))
-        self.serial_port_path = serial_port_path
+        self.controllers = controllers
+        self.serial_port_path = controllers[0].serial_port_path
+        self.transports = [SerialTransport(controller.serial_port_path, keepalive_interval=keepalive_interval)
+                           for controller in controllers]
+        self.transport = self.transports[0]
+        # Byte range of button_leds sent to each controller
+        self._controller_slices = []
+        first_led = 0
+        for controller in controllers:
+            self._controller_slices.append(slice(first_led * 4, (first_led + controller.num_leds) * 4))
+            first_led += controller.num_leds
+        self._write_pool = None  # Threads writing to the other controllers, started on the first write
         self.refresh_rate = refresh_rate
-        self.led_statuses = [LEDStatus() for _ in range(num_leds)]
+
+        # The parameters a mode change falls back on, one entry per LED (four for colors, in RGBl
+        # order): the color of an LED in normal mode and the target color of its effect otherwise,
+        # and the last transition time that was set
+        self._colors_to = array('i', [0]) * (num_leds * 4)
+        self._transition_times = array('d', [0]) * num_leds
+        # LEDs that are not in normal mode, grouped by effect: LEDs whose state was set together
+        # and is identical show the same color, so the color of each group is computed once per tick.
+        # An effect holds the state of its LEDs as (mode code, start time, transition time,
+        # color_from, color_to). LEDs with an effect of their own are kept apart, without the
+        # dict of LEDs of a shared effect
+        self._effect_ids = array('q', [0]) * num_leds  # 0 for normal mode, or SOLO_EFFECT_ID
+        self._effects = {}  # effect id -> (dict with the LEDs of the effect as keys,) + effect state
+        self._solo_effects = {}  # LED number -> effect state
+        self._next_effect_id = 1
+        self.clock = time.monotonic  # Time source for the effects, in seconds
+        self.frames_late = 0  # Refreshes that started more than one refresh interval late
         self.button_map = button_map if button_map is not None else {}
-        self.coord_map = coord_map if coord_map is not None else {}
+        self._coord_center = coord_center
+        self.coord_map = coord_map if coord_map is not None else {}  # Also builds self.geometry
+
+        # Attract mode, played by the refresh thread
+        self._attract_program = None  # AttractProgram that is playing, None when attract mode is off
+        self._attract_start = 0.0  # Clock time the current pass through the program started at
+        self._attract_step_index = 0  # Next step of the program to apply
+        self._attract_frame = None  # (step index, frame index) of the field pattern frame shown last
+        self._attract_programs = {}  # attract_program_key -> AttractProgram, oldest first
+        # Timeline tracks that are playing, as (priority, sequence, timeline id, start time, track,
+        # LED numbers) tuples sorted by priority, and the number of tracks covering each LED
+        self._tracks = []
+        self._track_leds = {}
+        self._next_timeline_id = 1
+        self._next_track_sequence = 0
+        self._pressed_buttons = {}  # button label -> (timeline id, color, LED numbers) while pressed
         self._stop_event = threading.Event()
+        self._wake_event = threading.Event()  # Set when the LED state changes, wakes up an idle refresh loop
+        self._press_event = threading.Event()  # Set by press_button, starts a refresh right away
         self._lock = threading.Lock()
         self._start_refresh_thread()
 
-        # Attract mode variables
-        self._attract_mode_running = False
-        self._attract_mode_thread = None
-        self._attract_mode_stop_event = threading.Event()
-        self._pattern_queue = []
-        self._current_pattern_index = 0
+    @property
+    def coord_map(self):
+        """
+        Dictionary mapping (x, y) world coordinates to LED numbers.
+        """
+        return self._coord_map
+
+    @coord_map.setter
+    def coord_map(self, coord_map):
+        self._coord_map = coord_map
+        self.geometry = GeometryIndex(coord_map, self._coord_center)
+
+    @property
+    def coord_center(self):
+        """
+        The (x, y) center of the circular and radial patterns, or None for the middle of coord_map.
+        """
+        return self._coord_center
+
+    @coord_center.setter
+    def coord_center(self, coord_center):
+        self._coord_center = coord_center
+        self.geometry = GeometryIndex(self._coord_map, coord_center)
 
     # Existing methods...
 
@@ -50,370 +462,698 @@ class PlasmaButtons:
         """
         Start the attract mode with the specified pattern queue.
 
+        The queue is compiled into a timed sequence of LED changes for the current coord_map,
+        which the refresh thread plays in a loop. Compiled programs are cached, so starting the
+        same queue again with the same layout does not compile it again.
+
         :param pattern_queue: A list of tuples (pattern_name, pattern_params)
         """
-        if not self._attract_mode_running:
-            self._attract_mode_running = True
-            self._attract_mode_stop_event.clear()
-            self._pattern_queue = pattern_queue
-            self._current_pattern_index = 0
-            self._attract_mode_thread = threading.Thread(target=self._run_attract_mode)
-            self._attract_mode_thread.daemon = True
-            self._attract_mode_thread.start()
+        if self._attract_program is not None:
+            return
+        if not self.geometry.coords:
+            print("Attract mode needs a coord_map.")
+            return
+        program = self._compile_attract_program(pattern_queue)
+        if not program.steps:
+            return
+        with self._lock:
+            self._attract_program = program
+            self._attract_start = self.clock()
+            self._attract_step_index = 0
+            self._attract_frame = None
+        self._wake_event.set()
 
     def stop_attract_mode(self):
         """
         Stop the attract mode.
         """
-        if self._attract_mode_running:
-            self._attract_mode_running = False
-            self._attract_mode_stop_event.set()
-            self._attract_mode_thread.join()
+        if self._attract_program is not None:
+            with self._lock:
+                self._attract_program = None
             self.set_all_leds()  # Clear LEDs when stopping attract mode
 
     def attract_mode_active(self):
-        return self._attract_mode_running
+        return self._attract_program is not None
 
-    def _run_attract_mode(self):
+    def _compile_attract_program(self, pattern_queue):
         """
-        Run the attract mode patterns in the queue.
+        Compiles a pattern queue for the current layout, or takes it from the cache.
+
+        :param pattern_queue: A list of tuples (pattern_name, pattern_params)
+        :return: The compiled program.
+        :rtype: AttractProgram
+        """
+        key = attract_program_key(pattern_queue, self.coord_map, self.geometry.center, self.num_leds,
+                                  self.refresh_rate)
+        program = self._attract_programs.pop(key, None)
+        if program is None:
+            program = compile_attract_program(pattern_queue, self.coord_map, self.geometry, self.num_leds,
+                                              self.refresh_rate)
+            if len(self._attract_programs) >= ATTRACT_PROGRAM_CACHE_SIZE:
+                del self._attract_programs[next(iter(self._attract_programs))]
+        self._attract_programs[key] = program  # (Re)insert as the most recently used
+        return program
+
+    def _play_attract_program(self, now):
         """
-        patterns = {
-            'linear': self._pattern_linear,
-            'radial': self._pattern_radial,
-            'circular': self._pattern_circular,
-        }
+        Applies the steps of the attract program that are due. Must be called with the lock held.
 
-        while not self._attract_mode_stop_event.is_set():
-            pattern_name, pattern_params = self._pattern_queue[self._current_pattern_index]
-            pattern_func = patterns.get(pattern_name)
-            if pattern_func:
-                pattern_func(**pattern_params)
+        Steps are due at a fixed time from the start of the pass, so the program keeps its
+        timing no matter when the refreshes happen. When the end of the program is reached,
+        the remaining steps are applied and the next pass starts where this one ended. While
+        a field pattern plays, its frame for the current time is rendered and shown, unless
+        it is already showing.
+        """
+        program = self._attract_program
+        steps = program.steps
+        elapsed = now - self._attract_start
+        if elapsed >= program.duration:
+            for step in steps[self._attract_step_index:]:
+                self._apply_attract_step(step, now)
+            if program.duration > 0:
+                passes = elapsed // program.duration
+                self._attract_start += passes * program.duration
+                elapsed -= passes * program.duration
             else:
-                print(f"Pattern '{pattern_name}' not recognized.")
-            self._current_pattern_index = (self._current_pattern_index + 1) % len(self._pattern_queue)
-
-    # Generalized linear pattern method
-    def _pattern_linear(self, direction, color_on=RGBl(31, 31, 31, 5), color_off=None, delay=0.05):
-        """
-        Generalized method for linear patterns.
-
-        :param direction: Direction of the pattern ('left_to_right', 'right_to_left', 'top_to_bottom', 'bottom_to_top')
-        :param color_on: Color when LEDs are activated.
-        :param color_off: Color when LEDs are reset.
-        :param delay: Delay between steps.
-        """
-        x_values = sorted(set(coord[0] for coord in self.coord_map.keys()))
-        y_values = sorted(set(coord[1] for coord in self.coord_map.keys()))
-
-        min_x, max_x = min(x_values), max(x_values) + 1
-        min_y, max_y = min(y_values), max(y_values) + 1
-
-        if direction == 'left_to_right':
-            x_range = range(min_x, max_x)
-            y_range = range(min_y, max_y)
-        elif direction == 'right_to_left':
-            x_range = reversed(range(min_x, max_x))
-            y_range = range(min_y, max_y)
-        elif direction == 'top_to_bottom':
-            x_range = range(min_x, max_x)
-            y_range = range(min_y, max_y)
-        elif direction == 'bottom_to_top':
-            x_range = range(min_x, max_x)
-            y_range = reversed(range(min_y, max_y))
-        else:
-            print(f"Direction '{direction}' not recognized.")
-            return
+                self._attract_start = now
+                elapsed = -1.0  # Without a duration, every refresh is one pass
+            self._attract_step_index = 0
+            self._attract_frame = None
+        index = self._attract_step_index
+        while index < len(steps) and steps[index].time <= elapsed:
+            self._apply_attract_step(steps[index], now)
+            index += 1
+        self._attract_step_index = index
 
-        # Determine iteration order based on direction
-        if direction in ['left_to_right', 'right_to_left']:
-            outer_range = x_range
-            inner_range = y_range
-            outer_coord_index = 0  # x-coordinate
-            inner_coord_index = 1  # y-coordinate
-        else:
-            outer_range = y_range
-            inner_range = x_range
-            outer_coord_index = 1  # y-coordinate
-            inner_coord_index = 0  # x-coordinate
-
-        if color_off:
-            self.set_all_leds(color_to=color_off)
-
-        # First loop: Turn on LEDs
-        for outer in outer_range:
-            for inner in inner_range:
-                coord = [0, 0]
-                coord[outer_coord_index] = outer
-                coord[inner_coord_index] = inner
-                coord = tuple(coord)
-                if coord in self.coord_map:
-                    self.set_led_mode_by_coord(coord=coord, mode="normal", color_to=color_on)
-            time.sleep(delay)
-            if self._attract_mode_stop_event.is_set():
-                return
-        time.sleep(0.2)
-
-    # Implement radial and circular patterns with parameters
-    def _pattern_circular(self, direction, color_on=RGBl(31, 31, 31, 5), color_off=RGBl(0, 0, 0, 0), delay=0.05):
-        """
-        Generalized method for circular patterns.
-
-        :param direction: Direction of the pattern ('outward', 'inward')
-        :param color_on: Color when LEDs are activated.
-        :param color_off: Color when LEDs are reset.
-        :param delay: Delay between steps.
-        """
-        # Calculate the center of the playfield
-        x_values = [coord[0] for coord in self.coord_map.keys()]
-        y_values = [coord[1] for coord in self.coord_map.keys()]
-        center_x = (min(x_values) + max(x_values)) / 2
-        center_y = (min(y_values) + max(y_values)) / 2
-
-        # Calculate distances from the center for all coordinates
-        coord_distances = {}
-        for coord in self.coord_map.keys():
-            dx = coord[0] - center_x
-            dy = coord[1] - center_y
-            distance = math.hypot(dx, dy)
-            coord_distances[coord] = distance
-
-        # Sort coordinates by distance
-        sorted_coords = sorted(coord_distances.items(), key=lambda item: item[1])
-
-        # Determine the range of steps based on direction
-        max_distance = max(coord_distances.values())
-        num_steps = int(max_distance) + 1
-
-        if direction == 'outward':
-            steps_range = range(num_steps)
-        elif direction == 'inward':
-            steps_range = reversed(range(num_steps))
-        else:
-            print(f"Direction '{direction}' not recognized for circular pattern.")
-            return
+        step = steps[index - 1] if index else None
+        if step is not None and step.field is not None:
+            frame_index = step.field.frame_index(elapsed - step.time)
+            if self._attract_frame != (index, frame_index):
+                self._attract_frame = (index, frame_index)
+                self._show_frame(step.field.render(frame_index))
+
+    def _apply_attract_step(self, step, now):
+        """
+        Sets the LEDs of an attract program step to their colors. Must be called with the lock held.
+        """
+        if step.changes:
+            self._apply_changes_locked([(led_numbers, LED_MODE_NORMAL, color, None, None)
+                                    for led_numbers, color in step.changes], now)
 
-        if color_off:
-            self.set_all_leds(color_to=color_off)
+    def _show_frame(self, frame):
+        """
+        Sets all LEDs to normal mode with the colors of a frame. Must be called with the lock held.
 
-        # First loop: Activate LEDs based on distance
-        for step in steps_range:
-            for coord, distance in sorted_coords:
-                if int(distance) == step:
-                    self.set_led_mode_by_coord(coord=coord, mode="normal", color_to=color_on)
-            time.sleep(delay)
-            if self._attract_mode_stop_event.is_set():
-                return
+        The frame is copied into the color array and button_leds with slice assignments, so
+        showing a frame costs about the same for a few LEDs as for hundreds.
 
-    # Implement radial patterns
-    def _pattern_radial(self, direction, color_on=RGBl(31, 31, 0, 5), color_off=RGBl(0, 0, 0, 0), delay=0.05):
-        x_values = [coord[0] for coord in self.coord_map.keys()]
-        y_values = [coord[1] for coord in self.coord_map.keys()]
-        center_x = (min(x_values) + max(x_values)) / 2
-        center_y = (min(y_values) + max(y_values)) / 2
-
-        # Calculate angles
-        coord_angles = {}
-        for coord in self.coord_map.keys():
-            dx = coord[0] - center_x
-            dy = coord[1] - center_y
-            angle = (math.atan2(dy, dx) + 2 * math.pi) % (2 * math.pi)
-            coord_angles[coord] = angle
-
-        # Sort coordinates by angle
-        sorted_coords = sorted(coord_angles.items(), key=lambda item: item[1], reverse=(direction == 'anticlockwise'))
-
-        if color_off:
-            self.set_all_leds(color_to=color_off)
-
-        # First loop: Turn on LEDs
-        for coord, angle in sorted_coords:
-            self.set_led_mode_by_coord(coord=coord, mode="normal", color_to=color_on)
-            time.sleep(delay)
-            if self._attract_mode_stop_event.is_set():
-                return
+        :param frame: Bytes with the color of every LED, 4 bytes (RGBl) per LED.
+        """
+        if self._effects or self._solo_effects:
+            self._effects.clear()
+            self._solo_effects.clear()
+            self._effect_ids[:] = array('q', [0]) * self.num_leds
+        # Widen the bytes to the integers of the color array by placing each in the low byte of an item
+        item_size = self._colors_to.itemsize
+        items = bytearray(len(frame) * item_size)
+        items[0 if sys.byteorder == 'little' else item_size - 1::item_size] = frame
+        self._colors_to[:] = array('i', items)
+        button_leds = self.button_leds
+        button_leds[0::4] = frame[2::4]
+        button_leds[1::4] = frame[1::4]
+        button_leds[2::4] = frame[0::4]
+        button_leds[3::4] = frame[3::4]
+
+    def batch(self):
+        """
+        Start a batch of LED mode changes that are applied all at once.
+
+        :return: An empty batch, to be used as a context manager or committed with its commit method.
+        :rtype: LedBatch
+        """
+        return LedBatch(self)
 
     def set_led_mode(self, led_number, mode, color_to=None, color_from=None, transition_time=None):
         """
         Set the mode and parameters for a specific LED.
 
         :param led_number: The index of the LED to update.
-        :param mode: The mode to set ('normal', 'blink', 'fade', 'fade sweep').
+        :param mode: The mode to set ('normal', 'blink', 'sync blink', 'fade', 'fade sweep'). 'sync blink'
+            blinks in phase with every other LED that sync blinks with the same interval, no matter when it was set.
         :param color_to: The target color or blink color.
         :param color_from: The starting color for fade or off color for blinking.
-        :param transition_time: The transition time for fade or blink interval.
+        :param transition_time: The duration of a fade, or of one blink cycle, in seconds.
+        """
+        with self.batch() as batch:
+            batch.set_led_mode(led_number, mode, color_to, color_from, transition_time)
+
+    def set_effects(self, effects):
+        """
+        Set the mode and parameters of many LEDs and buttons at once, see LedBatch.set_effects.
+
+        :param effects: Dictionary mapping LED numbers, button labels or world coordinates to LedEffect tuples.
+        """
+        with self.batch() as batch:
+            batch.set_effects(effects)
+
+    def play_timeline(self, tracks):
+        """
+        Start playing timeline tracks on top of the LED modes.
+
+        The targets of the tracks are resolved to LED numbers once, when they start. Unknown
+        labels and coordinates are ignored. All tracks of one call start at the same time.
+
+        :param tracks: Iterable of TimelineTrack objects.
+        :return: Id of the timeline, to stop it with stop_timeline.
+        :rtype: int
+        """
+        with self._lock:
+            timeline_id = self._play_timeline_locked(tracks)
+        self._wake_event.set()
+        return timeline_id
+
+    def _play_timeline_locked(self, tracks):
+        """
+        Starts playing timeline tracks, see play_timeline. Must be called with the lock held.
+        """
+        timeline_id = self._next_timeline_id
+        self._next_timeline_id += 1
+        now = self.clock()
+        for track in tracks:
+            led_numbers = tuple(dict.fromkeys(self._resolve_target(track.target)))
+            for led_number in led_numbers:
+                self._track_leds[led_number] = self._track_leds.get(led_number, 0) + 1
+            # Sorted by priority, then by the order the tracks were started in
+            bisect.insort(self._tracks, (track.priority, self._next_track_sequence, timeline_id,
+                                         now, track, led_numbers))
+            self._next_track_sequence += 1
+        return timeline_id
+
+    def stop_timeline(self, timeline_id=None):
+        """
+        Stop playing timeline tracks. Their LEDs show their mode again.
+
+        :param timeline_id: Id returned by play_timeline, or None to stop all timelines.
+        """
+        with self._lock:
+            self._stop_timeline_locked(timeline_id)
+        self._wake_event.set()
+
+    def _stop_timeline_locked(self, timeline_id):
+        """
+        Stops playing timeline tracks, see stop_timeline. Must be called with the lock held.
+        """
+        for playing_track in list(self._tracks):
+            if timeline_id is None or playing_track[2] == timeline_id:
+                self._remove_track(playing_track)
+
+    def press_button(self, button_label, effect='flash', color=RGBl(31, 31, 31, 5), duration=0.3,
+                     radius=8.0, speed=30.0):
+        """
+        Light up a button while it is pressed, starting with a flash or a ripple around it.
+
+        The button shows color until release_button is called. The effect is played as timeline
+        tracks over the LED modes, starting with the next refresh. Unknown labels are ignored.
+
+        :param button_label: Label of the button in button_map.
+        :param effect: 'flash' briefly lights the button in white, 'ripple' sends a ring of color
+            outward from the button through coord_map.
+        :param color: Color of the button while it is pressed, and of the ripple.
+        :param duration: Seconds the flash, or each LED of the ripple, takes to fade out.
+        :param radius: Distance in world coordinates the ripple travels, fading as it goes.
+        :param speed: World coordinates the ripple travels per second.
+        :return: Id of the timeline of the effect, or None if the button or effect is not known.
+        :rtype: int
+        """
+        if button_label not in self.button_map:
+            return None
+        if effect not in PRESS_EFFECTS:
+            print(f"Effect '{effect}' not recognized.")
+            return None
+        button_number = self.button_map[button_label]
+        led_numbers = [led_number for led_number in range(button_number * 4, (button_number + 1) * 4)
+                       if led_number < self.num_leds]
+
+        if effect == 'flash':
+            tracks = [TimelineTrack(led_numbers, [Keyframe(0.0, RGBl(255, 255, 255, color[3]), easing='ease out'),
+                                                  Keyframe(duration, opacity=0.0)], priority=PRESS_PRIORITY + 1)]
+        else:
+            # One track per whole distance from the middle of the button, starting when the ripple reaches it
+            button_coords = [self.geometry.led_coords[led_number] for led_number in led_numbers
+                             if led_number in self.geometry.led_coords]
+            if not button_coords:
+                return None
+            center_x = sum(x for x, _ in button_coords) / len(button_coords)
+            center_y = sum(y for _, y in button_coords) / len(button_coords)
+            rings = {}
+            for (x, y), led_number in self.coord_map.items():
+                distance = math.hypot(x - center_x, y - center_y)
+                if distance <= radius and led_number not in led_numbers:
+                    rings.setdefault(int(distance), []).append(led_number)
+            keyframes = [Keyframe(0.0, color, easing='ease out'), Keyframe(duration, opacity=0.0)]
+            tracks = [TimelineTrack(ring_leds, keyframes, priority=PRESS_PRIORITY,
+                                    opacity=1 - ring / (radius + 1), delay=ring / speed)
+                      for ring, ring_leds in sorted(rings.items())]
+
+        held_track = TimelineTrack(led_numbers, [Keyframe(0.0, color)], priority=PRESS_PRIORITY, loop=True)
+        # One lock for the whole press, so a press or release of the same button from another
+        # thread cannot leave a held color behind that no release stops
+        with self._lock:
+            self._release_button_locked(button_label, 0.0, False)
+            held_timeline_id = self._play_timeline_locked([held_track])
+            self._pressed_buttons[button_label] = (held_timeline_id, color, led_numbers)
+            timeline_id = self._play_timeline_locked(tracks)
+        self._wake_event.set()
+        self._press_event.set()
+        return timeline_id
+
+    def release_button(self, button_label, duration=0.3, fade=True):
+        """
+        Let go of a button lit by press_button, fading it back to its mode. Buttons that are not pressed are ignored.
+
+        :param button_label: Label of the button in button_map.
+        :param duration: Seconds the button takes to fade out.
+        :param fade: Fade the button out, instead of switching it back to its mode at once.
+        """
+        with self._lock:
+            self._release_button_locked(button_label, duration, fade)
+        self._wake_event.set()
+
+    def _release_button_locked(self, button_label, duration, fade):
+        """
+        Lets go of a pressed button, see release_button. Must be called with the lock held.
+        """
+        pressed = self._pressed_buttons.pop(button_label, None)
+        if pressed is None:
+            return
+        held_timeline_id, color, led_numbers = pressed
+        if fade:  # Start the fade before stopping the held color, so no frame shows neither
+            self._play_timeline_locked([TimelineTrack(led_numbers, [Keyframe(0.0, color),
+                                                                    Keyframe(duration, opacity=0.0)],
+                                                      priority=PRESS_PRIORITY)])
+        self._stop_timeline_locked(held_timeline_id)
+
+    def timeline_active(self, timeline_id=None):
+        """
+        Returns True if tracks of the timeline are still playing.
+
+        :param timeline_id: Id returned by play_timeline, or None for any timeline.
+        """
+        with self._lock:
+            return any(timeline_id is None or playing_track[2] == timeline_id for playing_track in self._tracks)
+
+    def _resolve_target(self, target):
+        """
+        Returns the numbers of the existing LEDs of a timeline track target.
+        """
+        if isinstance(target, list):
+            return [led_number for item in target for led_number in self._resolve_target(item)]
+        if isinstance(target, Button):
+            led_numbers = range(target.number * 4, (target.number + 1) * 4)
+        elif isinstance(target, Region):
+            led_numbers = [led_number for (x, y), led_number in self.coord_map.items()
+                           if target.min_x <= x <= target.max_x and target.min_y <= y <= target.max_y]
+        elif isinstance(target, str):
+            if target not in self.button_map:
+                return []
+            button_number = self.button_map[target]
+            led_numbers = range(button_number * 4, (button_number + 1) * 4)
+        elif isinstance(target, tuple):
+            led_numbers = [self.coord_map[target]] if target in self.coord_map else []
+        else:
+            led_numbers = [target]
+        return [led_number for led_number in led_numbers if 0 <= led_number < self.num_leds]
+
+    def _remove_track(self, playing_track):
         """
-        # Access the LED status for the given LED number
-        led_status = self.led_statuses[led_number]
-        led_status.mode = mode  # Set the mode
-
-        if mode == 'normal':
-            led_status.color_to = color_to if color_to else RGBl(0, 0, 0, 0)
-        elif mode == 'blink':
-            led_status.color_from = color_from if color_from else led_status.color_to
-            led_status.color_to = color_to if color_to else led_status.color_to
-            led_status.transition_time = transition_time if transition_time else led_status.transition_time
-            led_status.ticks_since_last_transition = 0  # Reset tick counter
-        elif mode == 'fade':
-            led_status.color_from = color_from if color_from else led_status.color_to
-            led_status.color_to = color_to if color_to else led_status.color_to
-            led_status.transition_time = transition_time if transition_time else led_status.transition_time
-            led_status.ticks_since_last_transition = 0  # Reset tick counter
-        elif mode == 'fade sweep':
-            led_status.color_from = color_from if color_from else led_status.color_to
-            led_status.color_to = color_to if color_to else led_status.color_to
-            led_status.transition_time = transition_time if transition_time else led_status.transition_time
-            led_status.ticks_since_last_transition = 0  # Reset tick counter
+        Stops a playing track and shows the mode of its LEDs again. Must be called with the lock held.
+        """
+        self._tracks.remove(playing_track)
+        for led_number in playing_track[5]:
+            count = self._track_leds[led_number] - 1
+            if count:
+                self._track_leds[led_number] = count
+            else:
+                del self._track_leds[led_number]
+            if not self._effect_ids[led_number]:  # Normal mode
+                self._write_led(led_number, self._colors_to)
+
+    def _apply_changes(self, changes):
+        """
+        Applies the changes collected by a LedBatch under one lock.
+
+        :param changes: List of (LED numbers, mode code, color_to, color_from, transition_time) tuples.
+        """
+        now = self.clock()
+        with self._lock:
+            self._apply_changes_locked(changes, now)
+        self._wake_event.set()
+
+    def _apply_changes_locked(self, changes, now):
+        """
+        Applies a list of changes, see _apply_changes. Must be called with the lock held.
+        """
+        for led_numbers, mode_code, color_to, color_from, transition_time in changes:
+            effects = {}  # LEDs that end up in the same state join one effect
+            for led_number in dict.fromkeys(led_numbers):
+                self._leave_effect(led_number)
+                state = self._set_led_state(led_number, mode_code, color_to, color_from, transition_time, now)
+                if mode_code != LED_MODE_NORMAL:
+                    effects.setdefault(state, {})[led_number] = None
+            for (color_from_state, color_to_state, transition_time_state), leds in effects.items():
+                effect = (mode_code, now, transition_time_state, color_from_state, color_to_state)
+                if len(leds) == 1:
+                    led_number, = leds
+                    self._solo_effects[led_number] = effect
+                    self._effect_ids[led_number] = SOLO_EFFECT_ID
+                else:
+                    effect_id = self._next_effect_id
+                    self._next_effect_id += 1
+                    self._effects[effect_id] = (leds,) + effect
+                    for led_number in leds:
+                        self._effect_ids[led_number] = effect_id
+
+    def _leave_effect(self, led_number):
+        """
+        Removes an LED from the effect it is part of, if any. Must be called with the lock held.
+        """
+        effect_id = self._effect_ids[led_number]
+        if effect_id == SOLO_EFFECT_ID:
+            del self._solo_effects[led_number]
+            self._effect_ids[led_number] = 0
+        elif effect_id:
+            leds = self._effects[effect_id][0]
+            del leds[led_number]
+            if not leds:
+                del self._effects[effect_id]
+            self._effect_ids[led_number] = 0
+
+    def _set_led_state(self, led_number, mode_code, color_to, color_from, transition_time, now):
+        """
+        Stores the parameters of an LED in the parameter arrays. Must be called with the lock held.
+
+        Normal mode only changes the color, the other modes also restart the effect. Parameters
+        that are not given keep their current value, and color_from defaults to the current color.
+        LEDs in normal mode are written to button_leds right away, as they do not change by themselves.
+
+        :return: The colors and transition time of the effect, None in normal mode.
+        :rtype: tuple
+        """
+        index = led_number * 4
+        if mode_code == LED_MODE_NORMAL:
+            self._colors_to[index:index + 4] = array('i', color_to if color_to else (0, 0, 0, 0))
+            self._write_led(led_number, self._colors_to)
+            return None
+        color_from = tuple(array('i', color_from)) if color_from else tuple(self._colors_to[index:index + 4])
+        if color_to:
+            self._colors_to[index:index + 4] = array('i', color_to)
+        if transition_time:
+            self._transition_times[led_number] = transition_time
+        return color_from, tuple(self._colors_to[index:index + 4]), self._transition_times[led_number]
+
+    def _effect_state(self, led_number):
+        """
+        Returns the state of the effect of an LED, or None in normal mode. Must be called with the lock held.
+
+        :return: The mode code, start time, transition time, color_from and color_to of the effect.
+        :rtype: tuple
+        """
+        effect_id = self._effect_ids[led_number]
+        if effect_id == SOLO_EFFECT_ID:
+            return self._solo_effects[led_number]
+        if effect_id:
+            return self._effects[effect_id][1:]
+        return None
+
+    def get_led_status(self, led_number):
+        """
+        Get the mode and parameters of a specific LED.
+
+        :param led_number: The index of the LED.
+        :return: A snapshot of the LED status. Changing it does not change the LED.
+        :rtype: LEDStatus
+        """
+        with self._lock:
+            index = led_number * 4
+            led_status = LEDStatus()
+            led_status.color_to = RGBl(*self._colors_to[index:index + 4])
+            led_status.color_from = led_status.color_to
+            led_status.transition_time = self._transition_times[led_number]
+            effect = self._effect_state(led_number)
+            if effect is not None:
+                mode_code, start_time, led_status.transition_time, color_from, _ = effect
+                led_status.mode = LED_MODE_NAMES[mode_code]
+                led_status.color_from = RGBl(*color_from)
+                led_status.time_since_last_transition = self.clock() - start_time
+            return led_status
 
     def set_all_leds(self, mode="normal", color_to=None, color_from=None, transition_time=None):
-        for led in range(0, self.num_leds):
-            self.set_led_mode(led, mode=mode, color_to=color_to, color_from=color_from, transition_time=transition_time)
+        with self.batch() as batch:
+            batch.set_all_leds(mode, color_to, color_from, transition_time)
 
     def set_button_mode(self, button_number, mode, color_to=None, color_from=None, transition_time=None):
         """
         Set the mode and parameters for all LEDs in a button by button number.
 
         :param button_number: The index of the button to update.
-        :param mode: The mode to set ('normal', 'blink', 'fade', 'fade sweep').
+        :param mode: The mode to set ('normal', 'blink', 'sync blink', 'fade', 'fade sweep').
         :param color_to: The target color or blink color.
         :param color_from: The starting color for fade or off color for blinking.
         :param transition_time: The transition time for fade or blink interval.
         """
-        # Update all LEDs in the specified button (assuming 4 LEDs per button)
-        for i in range(button_number * 4, (button_number + 1) * 4):
-            self.set_led_mode(i, mode, color_to=color_to, color_from=color_from, transition_time=transition_time)
+        with self.batch() as batch:
+            batch.set_button_mode(button_number, mode, color_to, color_from, transition_time)
 
     def set_button_mode_by_label(self, button_label, mode, color_to=None, color_from=None, transition_time=None):
         """
         Set the mode and parameters for all LEDs in a button by button label.
 
         :param button_label: The label of the button to update (e.g., 'P1:A', 'P2:B').
-        :param mode: The mode to set ('normal', 'blink', 'fade', 'fade sweep').
+        :param mode: The mode to set ('normal', 'blink', 'sync blink', 'fade', 'fade sweep').
         :param color_to: The target color or blink color.
         :param color_from: The starting color for fade or off color for blinking.
         :param transition_time: The transition time for fade or blink interval.
         """
-        # Check if the button label exists in the mapping
-        if self.button_map and button_label in self.button_map:
-            button_number = self.button_map[button_label]
-            # Use the existing method to set button mode by number
-            self.set_button_mode(button_number, mode,
-                                 color_to=color_to, color_from=color_from, transition_time=transition_time)
+        with self.batch() as batch:
+            batch.set_button_mode_by_label(button_label, mode, color_to, color_from, transition_time)
 
     def set_led_mode_by_coord(self, coord, mode, color_to=None, color_from=None, transition_time=None):
         """
         Set the mode and parameters for a specific LED by world coordinate.
 
         :param coord: A tuple representing the (x, y) coordinate of the LED.
-        :param mode: The mode to set ('normal', 'blink', 'fade', 'fade sweep').
+        :param mode: The mode to set ('normal', 'blink', 'sync blink', 'fade', 'fade sweep').
         :param color_to: The target color or blink color.
         :param color_from: The starting color for fade or off color for blinking.
         :param transition_time: The transition time for fade or blink interval.
         """
-        # Check if the coordinate exists in the mapping
-        if self.coord_map and coord in self.coord_map:
-            led_number = self.coord_map[coord]
-            # Use the existing method to set LED mode by LED number
-            self.set_led_mode(led_number, mode,
-                              color_to=color_to, color_from=color_from, transition_time=transition_time)
+        with self.batch() as batch:
+            batch.set_led_mode_by_coord(coord, mode, color_to, color_from, transition_time)
 
-    def _calculate_color(self, led_number):
+    def _write_led(self, led_number, colors):
         """
-        Calculate the color of the LED based on its status and elapsed ticks.
+        Writes the color of an LED from a color array to button_leds. Must be called with the lock held.
 
         :param led_number: The index of the LED.
-        :return: An RGBl tuple representing the calculated color.
-        """
-        # Get the status of the LED
-        led_status = self.led_statuses[led_number]
-        # Get the number of ticks since the last transition
-        ticks = led_status.ticks_since_last_transition
-
-        # Determine the color based on the mode
-        if led_status.mode == 'normal':
-            return led_status.color_to
-        elif led_status.mode == 'blink':
-            # Calculate blink status based on ticks
-            cycle_length = self.refresh_rate * led_status.transition_time
-            if (ticks % cycle_length) < (cycle_length / 2):
-                return led_status.color_to
-            else:
-                return led_status.color_from
-        elif led_status.mode == 'fade':
-            # Calculate fade status based on ticks
-            total_ticks_for_fade = self.refresh_rate * led_status.transition_time
-            if ticks >= total_ticks_for_fade:
-                # Fade is complete, switch to normal mode with final color
-                self.set_led_mode(led_number, 'normal', color_to=led_status.color_to)
-                return led_status.color_to
-            # Calculate intermediate color during fade
-            ratio = ticks / total_ticks_for_fade
-            red = int(led_status.color_from.red + (led_status.color_to.red - led_status.color_from.red) * ratio)
-            green = int(led_status.color_from.green + (led_status.color_to.green - led_status.color_from.green) * ratio)
-            blue = int(led_status.color_from.blue + (led_status.color_to.blue - led_status.color_from.blue) * ratio)
-            brightness = int(led_status.color_from.brightness + (
-                    led_status.color_to.brightness - led_status.color_from.brightness) * ratio)
-            return RGBl(red, green, blue, brightness)
-        elif led_status.mode == 'fade sweep':
-            # Calculate fade sweep status based on ticks
-            total_ticks_for_fade = self.refresh_rate * led_status.transition_time
-            half_time_ticks = total_ticks_for_fade / 2
-            if ticks >= total_ticks_for_fade:
-                # Sweep complete, reset ticks
-                led_status.ticks_since_last_transition = 0
-                return led_status.color_from
-            # Calculate intermediate color during fade sweep
-            if ticks < half_time_ticks:
-                ratio = ticks / half_time_ticks
-            else:
-                ratio = (total_ticks_for_fade - ticks) / half_time_ticks
-            red = int(led_status.color_from.red + (led_status.color_to.red - led_status.color_from.red) * ratio)
-            green = int(led_status.color_from.green + (led_status.color_to.green - led_status.color_from.green) * ratio)
-            blue = int(led_status.color_from.blue + (led_status.color_to.blue - led_status.color_from.blue) * ratio)
-            brightness = int(led_status.color_from.brightness + (
-                    led_status.color_to.brightness - led_status.color_from.brightness) * ratio)
-            return RGBl(red, green, blue, brightness)
+        :param colors: Array with four values (RGBl) per LED.
+        """
+        index = led_number * 4
+        button_leds = self.button_leds
+        button_leds[index] = colors[index + 2] & self.COLOR_MASK
+        button_leds[index + 1] = colors[index + 1] & self.COLOR_MASK
+        button_leds[index + 2] = colors[index] & self.COLOR_MASK
+        button_leds[index + 3] = colors[index + 3] & self.BRIGHTNESS_MASK
 
-    def _update_led_colors(self):
+    def _update_led_colors(self, now=None):
         """
         Update all LED colors based on their statuses.
+
+        Computes the next frame in one pass over the effects: the color of each group of LEDs
+        that share an effect is calculated once and written to all of them, and LEDs with an
+        effect of their own are written directly. LEDs in normal mode were already written when
+        their color was set. Timeline tracks are blended over the result last.
+
+        :param now: Clock time to calculate the colors for, defaults to the current time.
         """
+        if now is None:
+            now = self.clock()
         with self._lock:  # Ensure thread safety when updating LED colors
-            for i in range(self.num_leds):
-                # Increment ticks for timing calculations
-                self.led_statuses[i].ticks_since_last_transition += 1
-                # Calculate the current color based on the mode and ticks
-                current_color = self._calculate_color(i)
-                start_index = i * 4
-                # Update the button_leds byte array with the calculated color values
-                self.button_leds[start_index] = current_color.blue & self.COLOR_MASK
-                self.button_leds[start_index + 1] = current_color.green & self.COLOR_MASK
-                self.button_leds[start_index + 2] = current_color.red & self.COLOR_MASK
-                self.button_leds[start_index + 3] = current_color.brightness & self.BRIGHTNESS_MASK
+            if self._attract_program is not None:
+                self._play_attract_program(now)
+            button_leds = self.button_leds
+            color_mask = self.COLOR_MASK
+            brightness_mask = self.BRIGHTNESS_MASK
+            finished_effects = []
+            finished_solo_effects = []
+
+            for effect_id, (leds, mode, start_time, transition_time, color_from, color_to) in \
+                    self._effects.items():
+                red, green, blue, brightness = _effect_color(now, mode, start_time, transition_time,
+                                                             color_from, color_to)
+                if mode == LED_MODE_FADE and now - start_time >= transition_time:
+                    finished_effects.append(effect_id)
+                blue &= color_mask
+                green &= color_mask
+                red &= color_mask
+                brightness &= brightness_mask
+                for led_number in leds:
+                    index = led_number * 4
+                    button_leds[index] = blue
+                    button_leds[index + 1] = green
+                    button_leds[index + 2] = red
+                    button_leds[index + 3] = brightness
+
+            for led_number, (mode, start_time, transition_time, color_from, color_to) in \
+                    self._solo_effects.items():
+                red, green, blue, brightness = _effect_color(now, mode, start_time, transition_time,
+                                                             color_from, color_to)
+                if mode == LED_MODE_FADE and now - start_time >= transition_time:
+                    finished_solo_effects.append(led_number)
+                index = led_number * 4
+                button_leds[index] = blue & color_mask
+                button_leds[index + 1] = green & color_mask
+                button_leds[index + 2] = red & color_mask
+                button_leds[index + 3] = brightness & brightness_mask
+
+            # Finished fades switch to normal mode, their LEDs keep the target color
+            effect_ids = self._effect_ids
+            for effect_id in finished_effects:
+                for led_number in self._effects.pop(effect_id)[0]:
+                    effect_ids[led_number] = 0
+            for led_number in finished_solo_effects:
+                del self._solo_effects[led_number]
+                effect_ids[led_number] = 0
+
+            if self._tracks:
+                self._update_tracks(now)
+
+    def _update_tracks(self, now):
+        """
+        Blends the playing timeline tracks over the LED colors. Must be called with the lock held.
+
+        LEDs in normal mode that are covered by a track get their own color back first, as they
+        are not rewritten by the effects. Then each track is evaluated once and written to its
+        LEDs, from low to high priority. Tracks that are past their last keyframe are removed.
+
+        :param now: Clock time to calculate the colors for.
+        """
+        effect_ids = self._effect_ids
+        colors_to = self._colors_to
+        for led_number in self._track_leds:
+            if not effect_ids[led_number]:  # Normal mode
+                self._write_led(led_number, colors_to)
+
+        button_leds = self.button_leds
+        finished_tracks = []
+        for playing_track in self._tracks:
+            _, _, _, start_time, track, led_numbers = playing_track
+            elapsed = now - start_time - track.delay
+            if elapsed < 0:
+                continue
+            if elapsed >= track.duration and not track.loop:
+                finished_tracks.append(playing_track)
+                continue
+            red, green, blue, brightness, opacity = track.color_at(elapsed)
+            blue &= self.COLOR_MASK
+            green &= self.COLOR_MASK
+            red &= self.COLOR_MASK
+            brightness &= self.BRIGHTNESS_MASK
+            if opacity <= 0.0:
+                continue
+            if opacity >= 1.0:
+                for led_number in led_numbers:
+                    index = led_number * 4
+                    button_leds[index] = blue
+                    button_leds[index + 1] = green
+                    button_leds[index + 2] = red
+                    button_leds[index + 3] = brightness
+            else:
+                for led_number in led_numbers:
+                    index = led_number * 4
+                    button_leds[index] += int((blue - button_leds[index]) * opacity)
+                    button_leds[index + 1] += int((green - button_leds[index + 1]) * opacity)
+                    button_leds[index + 2] += int((red - button_leds[index + 2]) * opacity)
+                    button_leds[index + 3] += int((brightness - button_leds[index + 3]) * opacity)
+
+        for playing_track in finished_tracks:
+            self._remove_track(playing_track)
 
     def write_to_display(self):
         """
         Write the button_leds byte array to the display via the serial port.
+
+        With several controllers, each is sent its own range of the LEDs. The other controllers
+        are written by a thread pool while this thread writes the first one, so a refresh takes
+        as long as the slowest controller instead of all of them together.
+
+        :return: True if the frame was sent or skipped because it did not change, False if it was dropped.
+        :rtype: bool
         """
         with self._lock:  # Ensure thread safety when reading the button_leds array
-            data_to_send = self.PREFIX + self.button_leds
+            data_to_send = bytes(self.button_leds)
 
-        # Open the serial port and send the data
-        try:
-            with serial.Serial(self.serial_port_path, baudrate=115200, timeout=1) as ser:
-                ser.write(data_to_send)
-        except serial.SerialException as e:
-            print(f"Error opening serial port {self.serial_port_path}: {e}")
+        if len(self.transports) == 1:
+            return self.transport.write(self.PREFIX, data_to_send)
+
+        if self._write_pool is None:
+            self._write_pool = ThreadPoolExecutor(max_workers=len(self.transports) - 1,
+                                                  thread_name_prefix="PlasmaButtons")
+        futures = [self._write_pool.submit(transport.write, self.PREFIX, data_to_send[controller_slice])
+                   for transport, controller_slice in zip(self.transports[1:], self._controller_slices[1:])]
+        sent = self.transport.write(self.PREFIX, data_to_send[self._controller_slices[0]])
+        return all([future.result() for future in futures]) and sent
+
+    def is_animating(self):
+        """
+        Returns True if an effect, timeline or attract program is changing the LED colors over time.
+        """
+        return bool(self._effects or self._solo_effects or self._tracks or self._attract_program is not None)
 
     def _refresh_loop(self):
         """
         Continuously refresh the display at the specified refresh rate.
+
+        Every refresh has a deadline, so the time spent calculating and sending a frame is
+        not added to the interval. When a refresh is more than one interval late, the loop
+        continues from the current time instead of trying to catch up.
+
+        When nothing is animating, the loop waits for the wake event, which is set by every
+        change of the LEDs. It still wakes up once every keepalive interval to resend the frame,
+        and every min_backoff seconds while the frame cannot be sent, taking the shortest interval
+        of all the transports.
+
+        A button press does not wait for the next deadline: it sets the press event, which
+        starts an extra refresh right away. The regular refreshes keep their schedule.
         """
+        next_refresh = time.monotonic()
+        pressed = False
         while not self._stop_event.is_set():
+            self._wake_event.clear()  # Changes from here on wake up the wait below
+            self._press_event.clear()
             # Update LED colors and send to display
             self._update_led_colors()
-            self.write_to_display()
-            time.sleep(1 / self.refresh_rate)  # Sleep to maintain the refresh rate
+            sent = self.write_to_display()
+
+            if not self.is_animating():
+                if sent:
+                    # The controller that needs a keepalive first decides when to wake up
+                    keepalive_intervals = [transport.keepalive_interval for transport in self.transports
+                                           if transport.keepalive_interval is not None]
+                    timeout = min(keepalive_intervals) if keepalive_intervals else None
+                else:
+                    timeout = min(transport.min_backoff for transport in self.transports)
+                self._wake_event.wait(timeout)  # Sleep until the LEDs change
+                next_refresh = time.monotonic()
+                continue
+
+            interval = 1 / self.refresh_rate
+            now = time.monotonic()
+            if not pressed:  # After the extra refresh of a button press, the regular one is still due
+                next_refresh += interval
+                if now - next_refresh > interval:
+                    self.frames_late += 1
+                    next_refresh = now
+            pressed = self._press_event.wait(max(0.0, next_refresh - now))  # Sleep until the next refresh is due
 
     def _start_refresh_thread(self):
         """
@@ -428,7 +1168,14 @@ class PlasmaButtons:
         Stop the refresh loop.
         """
         self._stop_event.set()  # Signal the refresh loop to stop
+        self._wake_event.set()
+        self._press_event.set()
         self._refresh_thread.join()  # Wait for the refresh thread to finish
+        if self._write_pool is not None:
+            self._write_pool.shutdown()
+            self._write_pool = None
+        for transport in self.transports:
+            transport.close()
 
     def __str__(self):
         """
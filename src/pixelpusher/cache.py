@@ -0,0 +1,115 @@
+from collections import OrderedDict, namedtuple
+import threading
+
+# An image rendered for a display: its encoded frames, the GIF loop count, whether it has
+# transparent pixels, and the display buffer after rendering its first frame
+CachedImage = namedtuple('CachedImage', ['frames', 'loop', 'opaque', 'display_buffer'])
+
+# Size of a frame cache in bytes, enough for a few hundred static marquees or a dozen long animations
+DEFAULT_FRAME_CACHE_SIZE = 8 * 1024 * 1024
+
+
+class FrameCache:
+    """
+    Least recently used cache of rendered images, bounded by the number of bytes it holds.
+
+    Entries are looked up with a key describing the source file (path, modification time
+    and size) and everything that changes the rendered bytes (display, color order,
+    compression, rescale, brightness and background). When adding an entry pushes the
+    total size over the budget, the least recently used entries are evicted.
+
+    Attributes:
+        max_bytes (int): Maximum number of bytes held by the cache.
+        size_bytes (int): Number of bytes currently held by the cache.
+        hits (int): Number of lookups that found an entry.
+        misses (int): Number of lookups that did not find an entry.
+        evictions (int): Number of entries evicted to stay within max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_FRAME_CACHE_SIZE):
+        """
+        Initializes the FrameCache object.
+
+        :param max_bytes: Maximum number of bytes held by the cache. Images larger than this are not cached.
+        """
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (CachedImage, size), least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, *keys):
+        """
+        Looks up a cached image and marks it as recently used.
+
+        Several keys can be given, the first one that is cached is used. This counts as one hit or miss.
+
+        :param keys: Keys to try, in order.
+        :return: The cached image, or None if none of the keys is cached.
+        :rtype: CachedImage
+        """
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, cached_image):
+        """
+        Adds an image to the cache, evicting the least recently used images if needed.
+
+        :param key: Key of the image.
+        :param cached_image: The rendered image.
+        :return: True if the image was cached, False if it is larger than the whole cache.
+        :rtype: bool
+        """
+        size = self._image_size(cached_image)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return False
+            self._entries[key] = (cached_image, size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        """
+        Removes all images from the cache. The statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+
+    @staticmethod
+    def _image_size(cached_image):
+        """
+        Calculates the number of bytes held by a cached image.
+        """
+        size = len(cached_image.display_buffer)
+        for rendered_frame in cached_image.frames:
+            size += len(rendered_frame.payload)
+        return size
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        return (f"FrameCache({len(self._entries)} images, {self.size_bytes}/{self.max_bytes} bytes, "
+                f"{self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), {self.evictions} evictions)")
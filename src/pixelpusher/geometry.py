@@ -0,0 +1,76 @@
+import math
+
+
+class GeometryIndex:
+    """
+    Precomputed layout of the LEDs in a coordinate map, used by the attract mode patterns.
+
+    The index is built once from a coord_map ({(x, y): led_number}) and holds everything the
+    patterns need, so they do not recalculate bounds, distances and angles every time they run.
+
+    Attributes:
+        coords (list): All mapped coordinates.
+        led_coords (dict): Coordinate of each mapped LED number.
+        min_x (int): Smallest x coordinate.
+        max_x (int): Largest x coordinate.
+        min_y (int): Smallest y coordinate.
+        max_y (int): Largest y coordinate.
+        center (tuple): Center the distances and angles are measured from.
+        columns (dict): Coordinates per x value, sorted by y.
+        rows (dict): Coordinates per y value, sorted by x.
+        rings (list): Coordinates per whole distance from the center: ring n holds the
+            coordinates with n <= distance < n + 1, sorted by distance.
+        angular_order (list): Coordinates sorted by angle around the center, from 0 to 2 pi
+            (clockwise on the buttons, as y points down).
+        distances (dict): Distance of each coordinate from the center.
+        angles (dict): Angle of each coordinate around the center, from 0 to 2 pi.
+    """
+
+    def __init__(self, coord_map, center=None):
+        """
+        Builds the index.
+
+        :param coord_map: Dictionary mapping (x, y) coordinates to LED numbers.
+        :param center: The (x, y) center for the distances and angles. Defaults to the center
+            of the bounding box of all coordinates.
+        """
+        self.coords = list(coord_map.keys())
+        self.led_coords = {led_number: coord for coord, led_number in coord_map.items()}
+        self.columns = {}
+        self.rows = {}
+        self.rings = []
+        self.angular_order = []
+        self.distances = {}
+        self.angles = {}
+        if not self.coords:
+            self.min_x = self.max_x = self.min_y = self.max_y = 0
+            self.center = center if center is not None else (0, 0)
+            return
+
+        self.min_x = min(x for x, _ in self.coords)
+        self.max_x = max(x for x, _ in self.coords)
+        self.min_y = min(y for _, y in self.coords)
+        self.max_y = max(y for _, y in self.coords)
+        if center is None:
+            center = ((self.min_x + self.max_x) / 2, (self.min_y + self.max_y) / 2)
+        self.center = center
+
+        for coord in sorted(self.coords, key=lambda c: (c[1], c[0])):
+            self.rows.setdefault(coord[1], []).append(coord)
+        for coord in sorted(self.coords):
+            self.columns.setdefault(coord[0], []).append(coord)
+
+        center_x, center_y = center
+        for coord in self.coords:
+            dx = coord[0] - center_x
+            dy = coord[1] - center_y
+            self.distances[coord] = math.hypot(dx, dy)
+            self.angles[coord] = (math.atan2(dy, dx) + 2 * math.pi) % (2 * math.pi)
+
+        self.rings = [[] for _ in range(int(max(self.distances.values())) + 1)]
+        for coord in sorted(self.coords, key=self.distances.get):
+            self.rings[int(self.distances[coord])].append(coord)
+        self.angular_order = sorted(self.coords, key=self.angles.get)
+
+    def __len__(self):
+        return len(self.coords)
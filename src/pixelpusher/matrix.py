@@ -1,8 +1,10 @@
 from PIL import Image, ImageSequence, ImageDraw, ImageFont
+from .asset import ASSET_EXTENSION, MarqueeAsset, RenderedFrame, asset_path_for, write_asset
+from .cache import CachedImage, FrameCache, DEFAULT_FRAME_CACHE_SIZE
 from .colors import RGBl
+from .transport import SerialTransport
 import threading
 import time
-import serial
 import os
 import zlib
 import struct
@@ -16,6 +18,19 @@ DISPLAY_SIZES = {
     DISPLAY_INTERSTATE75_128x32: (128, 32)
 }
 
+# GIF frames shorter than this are shown for DEFAULT_FRAME_DURATION instead, like web browsers do
+MIN_FRAME_DURATION = 0.02
+DEFAULT_FRAME_DURATION = 0.1
+# If an animation falls further behind than this (in seconds), it restarts its timeline instead of catching up
+MAX_FRAME_LAG = 1.0
+# Animations whose encoded frames take more bytes than this are decoded again for every loop instead of kept in memory
+MAX_ANIMATION_BYTES = 4 * 1024 * 1024
+# Seconds a directory listing of compiled assets is trusted, so assets compiled meanwhile are found after this long
+ASSET_LISTING_INTERVAL = 60.0
+
+# Seconds between checks that the writer thread is still running, while flush waits for it
+WRITER_CHECK_INTERVAL = 0.5
+
 # Color order permutations
 COLOR_ORDER_RGB = (0, 1, 2)  # RGB
 COLOR_ORDER_RBG = (0, 2, 1)  # RBG
@@ -25,6 +40,16 @@ COLOR_ORDER_BGR = (2, 1, 0)  # BGR
 COLOR_ORDER_BRG = (2, 0, 1)  # BRG
 
 
+def _play_duration(rendered_frame):
+    """
+    Returns the seconds a frame of an animation is shown. Zero or tiny durations would spin the CPU,
+    so frames shorter than MIN_FRAME_DURATION are shown for DEFAULT_FRAME_DURATION.
+    """
+    if rendered_frame.duration < MIN_FRAME_DURATION:
+        return DEFAULT_FRAME_DURATION
+    return rendered_frame.duration
+
+
 class LedMatrix:
     """
     Class for controlling an LED matrix display.
@@ -38,7 +63,12 @@ class LedMatrix:
         height (int): Height of the LED matrix.
         display_buffer (bytearray): Internal buffer to store pixel data.
         serial_port_path (str): Path to the serial port for sending data.
+        transport (SerialTransport): Persistent connection to the serial port. Its frames_sent and
+            frames_skipped counters show how many frames were sent and how many were skipped as unchanged.
         color_order (tuple): Order of the color channels (RGB, BGR, etc.).
+        frames_dropped (int): Animation frames skipped because playback fell behind.
+        frames_replaced (int): Frames replaced by a newer frame before the writer thread sent them.
+        frame_cache (FrameCache): Recently displayed images, already rendered for this display, or None.
         _stop_event (threading.Event): Event to control stopping GIF playback.
         _thread (threading.Thread): Thread for asynchronous GIF playback.
     """
@@ -48,7 +78,8 @@ class LedMatrix:
 
     def __init__(self, display=DISPLAY_GALACTIC_UNICORN,
                  serial_port_path="/dev/unicorn",
-                 color_order=COLOR_ORDER_RGB, compress=False):
+                 color_order=COLOR_ORDER_RGB, compress=False, keepalive_interval=5.0,
+                 frame_cache_size=DEFAULT_FRAME_CACHE_SIZE):
         """
         Initializes the LedMatrix object.
 
@@ -56,71 +87,223 @@ class LedMatrix:
         :param serial_port_path: Path to the serial port used for communication.
         :param color_order: A tuple defining the color order (e.g., COLOR_ORDER_RGB).
         :param compress: Boolean indicating whether to compress the data stream.
+        :param keepalive_interval: Seconds after which the last frame is sent again, even if it did not change,
+            so the display recovers after a reset. None disables the keepalive.
+        :param frame_cache_size: Number of bytes of rendered images kept in memory, so images that were
+            displayed recently are shown again without decoding them. 0 or None disables the cache.
         """
+        self.display = display
         (self.width, self.height) = DISPLAY_SIZES[display]
         self.display_buffer = bytearray([0] * (self.width * self.height * 4))  # 4 bytes per pixel (RGBA)
         self.background_buffer = bytearray([20] * (self.width * self.height * 4))  # 4 bytes per pixel (RGBA)
         self.serial_port_path = serial_port_path
+        self.transport = SerialTransport(serial_port_path, keepalive_interval=keepalive_interval)
         self.color_order = color_order  # Set the desired color order
         self.compress = compress  # Enable or disable compression
+        self._translated_buffer = None  # Reused output buffer for translate_buffer
         self._stop_event = threading.Event()
         self._thread = None
+        self._asset = None  # Compiled asset that is being displayed
+        self._asset_listings = {}  # directory -> (time listed, names of the compiled assets in it)
+        self.frames_dropped = 0  # Animation frames skipped because playback fell behind
+        self.frame_cache = FrameCache(frame_cache_size) if frame_cache_size else None
+        self._lock = threading.RLock()  # Serializes access to the display and background buffers
+        self._display_lock = threading.RLock()  # Serializes starting and stopping what is displayed
+
+        # One-slot mailbox for the writer thread: a new frame replaces a frame that was not sent yet
+        self._frame_condition = threading.Condition()
+        self._pending_frame = None
+        self._writing = False
+        self._closed = False
+        self._writer_thread = None
+        self.frames_replaced = 0  # Frames replaced by a newer frame before they were sent
 
     def stop(self):
         """
         Stops any ongoing display, such as an animated GIF.
         """
-        if self._thread is not None:
-            self._stop_event.set()
-            # Only join if it's a different thread from the current one
-            if self._thread != threading.current_thread():
-                self._thread.join()
-            self._thread = None  # Reset the thread variable
+        with self._display_lock:
+            if self._thread is not None:
+                self._stop_event.set()
+                # Only join if it's a different thread from the current one
+                if self._thread != threading.current_thread():
+                    self._thread.join()
+                self._thread = None  # Reset the thread variable
+
+    def close(self):
+        """
+        Stops any ongoing display, sends the last frame and closes the serial port.
+        """
+        with self._display_lock:
+            self.stop()
+            with self._frame_condition:
+                self._closed = True
+                self._frame_condition.notify_all()
+            if self._writer_thread is not None:
+                self._writer_thread.join()
+                self._writer_thread = None
+            self._close_asset()
+            self.transport.close()
+
+    def flush(self, timeout=None):
+        """
+        Waits until the writer thread has sent the last submitted frame.
+
+        :param timeout: Seconds to wait at most, or None to wait as long as the writer thread runs.
+        :return: True if the frame was sent, False if the timeout expired or the writer thread stopped.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._frame_condition:
+            while self._pending_frame is not None or self._writing:
+                if self._writer_thread is None or not self._writer_thread.is_alive():
+                    return False
+                wait_time = WRITER_CHECK_INTERVAL
+                if deadline is not None:
+                    wait_time = min(wait_time, deadline - time.monotonic())
+                    if wait_time <= 0:
+                        return False
+                self._frame_condition.wait(wait_time)
+            return True
+
+    def _submit_frame(self, *chunks):
+        """
+        Hands a frame to the writer thread without waiting for it to be sent.
+
+        If the previous frame was not sent yet, it is replaced: only the latest frame matters.
+
+        :param chunks: Bytes objects that make up the frame. They must not be modified afterwards.
+        """
+        with self._frame_condition:
+            if self._closed:
+                return
+            if self._pending_frame is not None:
+                self.frames_replaced += 1
+            self._pending_frame = chunks
+            if self._writer_thread is None or not self._writer_thread.is_alive():
+                self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+                self._writer_thread.start()
+            self._frame_condition.notify_all()
+
+    def _cancel_pending_frame(self):
+        """
+        Drops the frame waiting for the writer thread, and waits for a write in progress to finish.
+        """
+        with self._frame_condition:
+            self._pending_frame = None
+            self._frame_condition.wait_for(lambda: not self._writing)
+
+    def _writer_loop(self):
+        """
+        Sends submitted frames to the serial port. Runs on the writer thread.
+
+        When no new frame arrives within the keepalive interval, the last frame is sent
+        again so a static image comes back after the display was reset or plugged back in.
+        A frame that fails to be sent is reported, and the loop goes on with the next one.
+        """
+        while True:
+            with self._frame_condition:
+                if self._pending_frame is None and not self._closed:
+                    self._frame_condition.wait(self.transport.keepalive_interval)
+                chunks = self._pending_frame
+                if chunks is None and self._closed:
+                    return
+                self._pending_frame = None
+                self._writing = True
+            try:
+                if chunks is not None:
+                    self.transport.write(*chunks)
+                else:
+                    self.transport.resend()
+            except Exception as e:
+                print(f"Error sending frame: {e}")
+            finally:
+                with self._frame_condition:
+                    self._writing = False
+                    self._frame_condition.notify_all()
 
     def write_to_display(self):
         """
         Sends the display buffer to the LED matrix by writing to the serial port.
 
         Translates the display buffer based on the configured color order
-        before sending it to the hardware.
+        before handing it to the writer thread, which sends it to the hardware.
+        This method does not wait for the data to be sent; use flush for that.
         """
-        translated_buffer = self.translate_buffer()
-        try:
-            with serial.Serial(self.serial_port_path, baudrate=115200, timeout=1) as ser:
-                if self.compress:
-                    # Compress the data using zlib
-                    compressed_data = zlib.compress(translated_buffer)
-                    compressed_size = len(compressed_data)
-                    # Send the compressed data with the compressed prefix and size
-                    ser.write(self.COMPRESSED_PREFIX)
-                    ser.write(struct.pack('<I', compressed_size))  # Send size as 4 bytes (little-endian)
-                    ser.write(compressed_data)
-                else:
-                    # Send the uncompressed data with the standard prefix
-                    ser.write(self.PREFIX + translated_buffer)
-        except serial.SerialException as e:
-            print(f"Error opening serial port {self.serial_port_path}: {e}")
+        with self._lock:
+            translated_buffer = self.translate_buffer()
+        self._submit_frame(*self._payload_chunks(translated_buffer))
 
-    def translate_buffer(self):
+    def _payload_chunks(self, translated_buffer):
+        """
+        Builds the chunks that make up the data sent to the display for a translated buffer.
+
+        :param translated_buffer: Display buffer in the hardware's color order.
+        :return: Prefix, optional size and pixel data, in the order they must be sent.
+        :rtype: tuple
+        """
+        if self.compress:
+            # Compress the data using zlib and send it with the compressed prefix and size
+            compressed_data = zlib.compress(translated_buffer)
+            return (self.COMPRESSED_PREFIX,
+                    struct.pack('<I', len(compressed_data)),  # Size as 4 bytes (little-endian)
+                    compressed_data)
+        # Send the uncompressed data with the standard prefix
+        return self.PREFIX, translated_buffer
+
+    def _encode_frame(self, duration):
+        """
+        Encodes the display buffer into the final bytes sent to the display.
+
+        The result can be sent again later with _send_frame without translating
+        or compressing the display buffer again.
+
+        :param duration: How long the frame is shown, in seconds.
+        :return: The encoded frame.
+        :rtype: RenderedFrame
+        """
+        translated_buffer = self.translate_buffer(reuse_buffer=True)
+        return RenderedFrame(b"".join(self._payload_chunks(translated_buffer)), duration)
+
+    def _send_frame(self, rendered_frame):
+        """
+        Sends a frame encoded by _encode_frame to the display.
+
+        :param rendered_frame: The encoded frame.
+        """
+        self._submit_frame(rendered_frame.payload)
+
+    def translate_buffer(self, reuse_buffer=False):
         """
         Translates the display buffer based on the selected color order.
 
         This method adjusts the RGB channels of each pixel in the buffer to match
-        the hardware's color order.
+        the hardware's color order. Each channel is copied for the whole buffer at
+        once using strided slices, so no per-pixel Python code runs.
 
+        :param reuse_buffer: If True, the result is written into a buffer owned by this
+            object that is reused on every call, instead of allocating a new bytearray.
+            The returned buffer is overwritten by the next call.
         :return: Translated display buffer.
         :rtype: bytearray
         """
-        translated_buffer = bytearray(len(self.display_buffer))
-        for i in range(0, len(self.display_buffer), 4):
-            r, g, b, a = self.display_buffer[i:i + 4]  # RGBA values
-            translated_buffer[i:i + 4] = [
-                self.display_buffer[i + self.color_order[0]],  # Red or equivalent channel
-                self.display_buffer[i + self.color_order[1]],  # Green or equivalent channel
-                self.display_buffer[i + self.color_order[2]],  # Blue or equivalent channel
-                a  # Alpha remains unchanged
-            ]
-        return translated_buffer
+        with self._lock:
+            if reuse_buffer:
+                if self._translated_buffer is None or len(self._translated_buffer) != len(self.display_buffer):
+                    self._translated_buffer = bytearray(len(self.display_buffer))
+                translated_buffer = self._translated_buffer
+            else:
+                translated_buffer = bytearray(len(self.display_buffer))
+
+            if self.color_order == COLOR_ORDER_RGB:
+                translated_buffer[:] = self.display_buffer
+                return translated_buffer
+
+            translated_buffer[0::4] = self.display_buffer[self.color_order[0]::4]  # Red or equivalent channel
+            translated_buffer[1::4] = self.display_buffer[self.color_order[1]::4]  # Green or equivalent channel
+            translated_buffer[2::4] = self.display_buffer[self.color_order[2]::4]  # Blue or equivalent channel
+            translated_buffer[3::4] = self.display_buffer[3::4]  # Alpha remains unchanged
+            return translated_buffer
 
     def _set_pixel(self, x, y, color: RGBl):
         """
@@ -132,12 +315,13 @@ class LedMatrix:
         """
         if 0 <= x < self.width and 0 <= y < self.height:
             index = (x + y * self.width) * 4
-            self.display_buffer[index:index + 4] = [
-                color.red,
-                color.green,
-                color.blue,
-                color.brightness  # Using brightness as the alpha channel
-            ]
+            with self._lock:
+                self.display_buffer[index:index + 4] = [
+                    color.red,
+                    color.green,
+                    color.blue,
+                    color.brightness  # Using brightness as the alpha channel
+                ]
 
     def _get_pixel(self, x, y):
         """
@@ -150,7 +334,8 @@ class LedMatrix:
         """
         if 0 <= x < self.width and 0 <= y < self.height:
             index = (x + y * self.width) * 4
-            r, g, b, a = self.display_buffer[index:index + 4]
+            with self._lock:
+                r, g, b, a = self.display_buffer[index:index + 4]
             return RGBl(r, g, b, a)
         return RGBl(0, 0, 0, 0)
 
@@ -160,10 +345,10 @@ class LedMatrix:
 
         :param background_color: The RGBl color to fill the background with.
         """
-
-        for x in range(self.width):
-            for y in range(self.height):
-                self._set_pixel(x, y, background_color)
+        pixel = bytes([background_color.red, background_color.green, background_color.blue,
+                       background_color.brightness])
+        with self._lock:
+            self.display_buffer[:] = pixel * (self.width * self.height)
 
     def display_image(self, image_path, rescale=False, background_color=None, brightness=127):
         """
@@ -177,59 +362,371 @@ class LedMatrix:
         :param background_color: The color used for filling transparent areas, if provided.
         :param brightness: Brightness of the image (applies to the image as a whole). Defaults to 127.
         """
-        self.stop()  # Stop any ongoing GIF animation
-        self._stop_event.clear()  # Ensure the stop flag is cleared
+        with self._display_lock:
+            self.stop()  # Stop any ongoing GIF animation
+            self._stop_event.clear()  # Ensure the stop flag is cleared
+            self._close_asset()
+
+            # Check if the image file exists
+            if not image_path or not os.path.exists(image_path):
+                # Display an error message if no file or file doesn't exist
+                error_message = "Not found"
+                self.display_text(error_message, brightness)
+                return
+
+            with self._lock:
+                # Clear with the background and save the buffer before starting the animation or static image
+                if background_color:
+                    self.clear_with_background(background_color)
+
+                # Always copy the current display buffer to the background buffer
+                self.background_buffer = self.display_buffer[:]
+
+            # Stream the frames from a compiled asset if there is an up-to-date one for these parameters
+            asset = self._open_asset(image_path, rescale, brightness, background_color)
+            if asset is not None:
+                self._asset = asset
+                with self._lock:
+                    # Leave the buffer as if the image was rendered, for images blended over it later
+                    self.display_buffer[:] = asset.display_buffer
+                if len(asset.frames) == 1:
+                    self._send_frame(asset.frames[0])
+                else:
+                    self._thread = threading.Thread(target=self._animate, args=(asset.frames, asset.loop))
+                    self._thread.start()
+                return
+
+            # Replay the frames rendered the last time this image was displayed with these parameters
+            cache_keys = self._cache_keys(image_path, rescale, brightness)
+            if self.frame_cache is not None:
+                cached_image = self.frame_cache.get(*cache_keys)
+                if cached_image is not None:
+                    self._display_cached_image(cached_image)
+                    return
+
+            img = self._open_image(image_path, rescale)
+            if not getattr(img, 'is_animated', False):
+                with img, self._lock:
+                    opaque = self._render_frame(img, rescale, brightness)
+                    rendered_frame = self._encode_frame(0.0)
+                    self._cache_image(cache_keys, [rendered_frame], None, opaque, self.display_buffer)
+                self._send_frame(rendered_frame)
+            else:
+                # The frames are decoded on the animation thread as they are played, the first one right away
+                loop = img.info.get('loop')
+                self._thread = threading.Thread(
+                    target=self._animate,
+                    args=(self._render_frames(img, rescale, brightness, loop, cache_keys), loop,
+                          lambda: self._render_image_again(image_path, rescale, brightness)))
+                self._thread.start()
+
+    def _open_image(self, image_path, rescale):
+        """
+        Opens an image for rendering on this display.
 
-        # Check if the image file exists
-        if not image_path or not os.path.exists(image_path):
-            # Display an error message if no file or file doesn't exist
-            error_message = "Not found"
-            self.display_text(error_message, brightness)
-            return
+        When the image is rescaled, JPEG images are decoded at the smallest scale that is
+        still at least as large as the display, instead of at full resolution.
 
+        :param image_path: Path to the image file.
+        :param rescale: If True, the image will be rescaled to fit the display.
+        :return: The opened image.
+        :rtype: Image.Image
+        """
         img = Image.open(image_path)
+        if rescale and img.format == "JPEG":
+            img.draft("RGB", (self.width, self.height))
+        return img
+
+    def _cache_keys(self, image_path, rescale, brightness):
+        """
+        Builds the frame cache keys of an image displayed with these parameters.
+
+        An image without transparent pixels looks the same on any background, so it is cached
+        under the first key. Other images are cached under the second key, which includes a
+        checksum of the background buffer they are blended against.
+
+        :param image_path: Path to the source image.
+        :param rescale: If True, the image will be rescaled to fit the display.
+        :param brightness: Brightness of the image.
+        :return: Key for opaque images and key for transparent images.
+        :rtype: tuple
+        """
+        source_stat = os.stat(image_path)
+        key = (image_path, source_stat.st_mtime_ns, source_stat.st_size, self.display, tuple(self.color_order),
+               self.compress, rescale, brightness)
+        with self._lock:
+            background_checksum = zlib.crc32(self.background_buffer)
+        return key + (None,), key + (background_checksum,)
+
+    def _cache_image(self, cache_keys, rendered_frames, loop, opaque, display_buffer):
+        """
+        Adds a rendered image to the frame cache.
 
-        # Clear with the background and save the buffer before starting the animation or static image
-        if background_color:
-            self.clear_with_background(background_color)
+        :param cache_keys: Keys returned by _cache_keys.
+        :param rendered_frames: All frames of the image, as RenderedFrame objects.
+        :param loop: GIF loop count of the image.
+        :param opaque: True if no frame has transparent pixels.
+        :param display_buffer: Display buffer with the first frame rendered into it.
+        """
+        if self.frame_cache is not None:
+            cached_image = CachedImage(tuple(rendered_frames), loop, opaque, bytes(display_buffer))
+            self.frame_cache.put(cache_keys[0] if opaque else cache_keys[1], cached_image)
 
-        # Always copy the current display buffer to the background buffer
-        self.background_buffer = self.display_buffer[:]
+    def _display_cached_image(self, cached_image):
+        """
+        Displays an image from the frame cache.
 
-        frames = [frame.copy() for frame in ImageSequence.Iterator(img)]
-        if len(frames) == 1:
-            self._display_frame(frames[0], rescale, brightness)
+        :param cached_image: The cached image.
+        """
+        with self._lock:
+            # Leave the display buffer as if the image was rendered, it is the background of the next image
+            self.display_buffer[:] = cached_image.display_buffer
+        if len(cached_image.frames) == 1:
+            self._send_frame(cached_image.frames[0])
         else:
-            def animate_gif():
-                while not self._stop_event.is_set():
-                    for frame in frames:
-                        start_time = time.time()  # Record the start time
-                        self._display_frame(frame.convert("RGBA"), rescale, brightness)
-                        elapsed_time = time.time() - start_time  # Calculate the time taken to display the frame
-
-                        frame_duration = frame.info.get('duration', 100) / 1000.0  # Frame duration in seconds
-                        sleep_time = frame_duration - elapsed_time  # Adjust sleep time
-
-                        if sleep_time > 0:
-                            time.sleep(sleep_time)
-                        else:
-                            # If the data transfer takes longer than the frame duration, skip sleeping
-                            pass
-
-            self._thread = threading.Thread(target=animate_gif)
+            self._thread = threading.Thread(target=self._animate, args=(cached_image.frames, cached_image.loop))
             self._thread.start()
 
+    def _close_asset(self):
+        """
+        Closes the compiled asset that was displayed, once the writer thread no longer uses its frames.
+        """
+        if self._asset is not None:
+            self._cancel_pending_frame()
+            self._asset.close()
+            self._asset = None
+
+    def _open_asset(self, image_path, rescale, brightness, background_color):
+        """
+        Opens the compiled asset next to an image, if it can be used instead of the image.
+
+        The asset is ignored when it is missing, invalid, older than the image, or was
+        compiled for a different display or different parameters.
+
+        :param image_path: Path to the source image.
+        :param rescale: If True, the image will be rescaled to fit the display.
+        :param brightness: Brightness of the image.
+        :param background_color: The color used for filling transparent areas, if provided.
+        :return: The opened asset, or None if the image has to be rendered.
+        :rtype: MarqueeAsset
+        """
+        asset_path = asset_path_for(image_path)
+        directory, asset_name = os.path.split(asset_path)
+        if asset_name not in self._asset_names(directory):
+            return None
+        try:
+            asset = MarqueeAsset(asset_path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring marquee asset {asset_path}: {e}")
+            return None
+        if not asset.frames or not asset.is_fresh(image_path) or \
+                not asset.matches(self.display, self.color_order, self.compress, rescale, brightness,
+                                  background_color):
+            asset.close()
+            return None
+        return asset
+
+    def _asset_names(self, directory):
+        """
+        Lists the compiled assets in a directory. The listing is kept for ASSET_LISTING_INTERVAL
+        seconds, so displaying images does not look for an asset on disk every time.
+
+        :param directory: The directory.
+        :return: File names of the assets in the directory.
+        :rtype: frozenset
+        """
+        now = time.monotonic()
+        listing = self._asset_listings.get(directory)
+        if listing is None or now - listing[0] > ASSET_LISTING_INTERVAL:
+            try:
+                names = frozenset(name for name in os.listdir(directory or ".") if name.endswith(ASSET_EXTENSION))
+            except OSError:
+                names = frozenset()
+            listing = (now, names)
+            self._asset_listings[directory] = listing
+        return listing[1]
+
+    def _render_frames(self, img, rescale, brightness, loop=None, cache_keys=None):
+        """
+        Decodes, renders and encodes the frames of an image one by one.
+
+        Each frame is decoded only when the next frame is requested, and the source frame is
+        released as soon as it is rendered, so only one full resolution frame is in memory.
+        The image is closed when all frames are rendered or the generator is closed.
+        If cache_keys is given and the frames fit in the frame cache, they are added to it
+        once all frames are rendered.
+
+        :param img: Opened image. The generator takes ownership of it.
+        :param rescale: If True, the frames will be rescaled to fit the display.
+        :param brightness: Brightness of the frames.
+        :param loop: GIF loop count, stored in the frame cache.
+        :param cache_keys: Keys returned by _cache_keys, or None to not cache the frames.
+        :return: Generator of RenderedFrame objects.
+        """
+        if self.frame_cache is None:
+            cache_keys = None
+        rendered_frames = []  # Kept for the frame cache, until they no longer fit in it
+        rendered_bytes = 0
+        opaque = True
+        first_display_buffer = None
+        with img:
+            for frame in ImageSequence.Iterator(img):
+                with self._lock:
+                    opaque = self._render_frame(frame.convert("RGBA"), rescale, brightness) and opaque
+                    rendered_frame = self._encode_frame(frame.info.get('duration', 100) / 1000.0)
+                    if first_display_buffer is None:
+                        first_display_buffer = bytes(self.display_buffer)
+                if cache_keys is not None:
+                    rendered_bytes += len(rendered_frame.payload)
+                    if rendered_bytes + len(first_display_buffer) > self.frame_cache.max_bytes:
+                        cache_keys = None
+                        rendered_frames = []
+                    else:
+                        rendered_frames.append(rendered_frame)
+                yield rendered_frame
+
+        if cache_keys is not None and rendered_frames:
+            self._cache_image(cache_keys, rendered_frames, loop, opaque, first_display_buffer)
+
+    def _render_image_again(self, image_path, rescale, brightness):
+        """
+        Opens an image again and renders its frames, for animations too large to keep in memory.
+
+        :param image_path: Path to the image file.
+        :param rescale: If True, the frames will be rescaled to fit the display.
+        :param brightness: Brightness of the frames.
+        :return: Generator of RenderedFrame objects, empty if the image can no longer be read.
+        """
+        try:
+            img = self._open_image(image_path, rescale)
+        except OSError as e:
+            print(f"Error reading image {image_path}: {e}")
+            return
+        yield from self._render_frames(img, rescale, brightness)
+
+    def _animate(self, rendered_frames, loop=0, render_again=None):
+        """
+        Plays an animation until it ends or is stopped. Runs on the animation thread.
+
+        Every frame has a deadline on a monotonic timeline that starts when the first
+        frame is ready, so time spent rendering and sending is not added to the frame
+        durations. A frame that is late is still sent, and the time lost is made up by
+        the next ones. A frame is only dropped when the deadline of the frame after it
+        has passed too, going by the duration of that frame. That needs the frame after
+        it to be rendered already, so frames are dropped only while replaying stored
+        frames, and never when a frame starts a pass or was rendered just now: such a
+        frame is shown for its full duration from the moment it is ready.
+
+        :param rendered_frames: Iterable of RenderedFrame objects.
+        :param loop: GIF loop count: 0 repeats forever, N repeats N times after the first
+            play, None or -1 plays the animation once.
+        :param render_again: Function returning a new iterable of the same frames, used by
+            _loop_frames when the animation is too large to keep in memory.
+        """
+        frame_end = None
+        for rendered_frame, first_in_pass, rendered, next_frame in self._loop_frames(rendered_frames, loop,
+                                                                                     render_again):
+            duration = _play_duration(rendered_frame)
+
+            now = time.monotonic()
+            frame_start = now if frame_end is None else frame_end
+            frame_end = frame_start + duration
+            if now - frame_end > MAX_FRAME_LAG:
+                # Far behind (e.g. the device was stuck), continue from here instead of dropping many frames
+                frame_end = now + duration
+            elif now >= frame_end:
+                if first_in_pass or rendered:
+                    frame_end = now + duration
+                elif next_frame is not None and now >= frame_end + _play_duration(next_frame):
+                    # The next frame is due as well, skip straight to it
+                    self.frames_dropped += 1
+                    if self._stop_event.is_set():
+                        return
+                    continue
+
+            self._send_frame(rendered_frame)
+            if self._stop_event.wait(max(0.0, frame_end - time.monotonic())):
+                return
+
+    @staticmethod
+    def _loop_frames(rendered_frames, loop, render_again=None):
+        """
+        Yields the frames of every loop of an animation.
+
+        The frames are taken from rendered_frames during the first loop only and kept,
+        later loops yield the stored frames again without rendering anything. If the kept
+        frames would take more than MAX_ANIMATION_BYTES and render_again is given, they are
+        dropped instead and every loop renders the frames again from the iterable it returns.
+
+        :param rendered_frames: Iterable of RenderedFrame objects. A sequence (such as the
+            frames of a cached image or asset) holds frames that are already rendered, any
+            other iterable is expected to render each frame when it is requested.
+        :param loop: GIF loop count, see _animate.
+        :param render_again: Function returning a new iterable of the same frames, or None.
+        :return: Generator of (RenderedFrame, first frame of a pass, rendered just now, next
+            RenderedFrame) tuples. The next frame is None when it is not rendered yet or the
+            animation ends.
+        """
+        def next_frame(frames, index, repeats):
+            # The frame played after frames[index] if it is already rendered, from the next pass if there is one
+            if index + 1 < len(frames):
+                return frames[index + 1]
+            if loop == 0 or (loop is not None and repeats < loop):
+                return frames[0]
+            return None
+
+        played_frames = []
+        played_bytes = 0
+        rendering = not hasattr(rendered_frames, '__len__')
+        for index, rendered_frame in enumerate(rendered_frames):
+            if played_frames is not None:
+                played_bytes += len(rendered_frame.payload)
+                if render_again is not None and played_bytes > MAX_ANIMATION_BYTES:
+                    played_frames = None
+                else:
+                    played_frames.append(rendered_frame)
+            yield rendered_frame, index == 0, rendering, None if rendering else next_frame(rendered_frames, index, 0)
+
+        repeats = 0
+        while loop == 0 or (loop is not None and repeats < loop):
+            frame_count = 0
+            for rendered_frame in played_frames if played_frames is not None else render_again():
+                if played_frames is None:
+                    yield rendered_frame, frame_count == 0, True, None
+                else:
+                    yield rendered_frame, frame_count == 0, False, next_frame(played_frames, frame_count, repeats + 1)
+                frame_count += 1
+            if frame_count == 0:
+                return  # Nothing left to play, don't spin on an empty loop
+            repeats += 1
+
     def _display_frame(self, img, rescale, brightness):
         """
         Displays a single frame of a GIF or a PNG image.
 
+        :param img: The image frame to display.
+        :param rescale: If True, the image will be rescaled to fit the display.
+        :param brightness: Brightness of the image being displayed.
+        """
+        with self._lock:
+            self._render_frame(img, rescale, brightness)
+            self.write_to_display()
+
+    def _render_frame(self, img, rescale, brightness):
+        """
+        Renders a single frame of a GIF or a PNG image into the display buffer.
+
         This method resizes or crops the image to fit the display, and updates the
         display buffer with the image's pixel data. Blends the incoming pixel with
-        the current background based on opacity.
+        the current background based on opacity. The blend and the brightness are
+        applied to the whole image at once by Pillow, and the result is copied
+        straight into the display buffer.
 
         :param img: The image frame to display.
         :param rescale: If True, the image will be rescaled to fit the display.
         :param brightness: Brightness of the image being displayed.
+        :return: True if the frame has no transparent pixels.
+        :rtype: bool
         """
         if rescale:
             img = img.resize((self.width, self.height))
@@ -241,31 +738,25 @@ class LedMatrix:
             lower = upper + self.height
             img = img.crop((left, upper, right, lower))
 
-        for x in range(img.width):
-            for y in range(img.height):
-                pixel = img.getpixel((x, y))
-                if len(pixel) == 4:
-                    r, g, b, a = pixel  # RGBA
-                else:
-                    r, g, b = pixel  # RGB
-                    a = 255  # Assume fully opaque if no alpha channel
-
-                # Get the current pixel from the background buffer
-                index = (x + y * self.width) * 4
-                current_r, current_g, current_b, _ = self.background_buffer[index:index + 4]
-
-                # Calculate blend factor based on opacity (alpha channel)
-                blend_factor = a / 255
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")  # Images without an alpha channel become fully opaque
 
-                # Perform blending calculation
-                blended_r = (r * blend_factor) + (current_r * (1 - blend_factor))
-                blended_g = (g * blend_factor) + (current_g * (1 - blend_factor))
-                blended_b = (b * blend_factor) + (current_b * (1 - blend_factor))
-
-                # Set the pixel on the display, passing the brightness separately
-                self._set_pixel(x, y, RGBl(int(blended_r), int(blended_g), int(blended_b), brightness))
+        # Blend the image with the background based on opacity (alpha channel)
+        alpha = img.getchannel("A")
+        min_alpha, max_alpha = alpha.getextrema()
+        if min_alpha == 255:
+            frame = img
+        else:
+            background = Image.frombytes("RGBA", img.size, bytes(self.background_buffer))
+            if max_alpha == 0:
+                frame = background
+            else:
+                frame = Image.composite(img, background, alpha)
 
-        self.write_to_display()
+        # Store the brightness in the alpha channel of every pixel
+        frame.putalpha(brightness)
+        self.display_buffer[:] = frame.tobytes()
+        return min_alpha == 255
 
     def display_text(self, message, brightness):
         """
@@ -295,3 +786,49 @@ class LedMatrix:
 
         # Display the text as an image
         self._display_frame(img, rescale=True, brightness=brightness)
+
+
+def compile_asset(image_path, display, color_order=COLOR_ORDER_RGB, compress=False, rescale=False,
+                  background_color=None, brightness=127, output_path=None):
+    """
+    Compiles an image into a marquee asset that LedMatrix.display_image streams instead of the image.
+
+    Every frame is resized or cropped, blended, translated to the color order and
+    (optionally) compressed, and stored as the exact bytes sent to the display.
+    Transparent pixels are blended against background_color, or black if it is None.
+
+    :param image_path: Path to the PNG, GIF or JPG file.
+    :param display: Type of display (e.g., DISPLAY_GALACTIC_UNICORN).
+    :param color_order: A tuple defining the color order (e.g., COLOR_ORDER_RGB).
+    :param compress: Boolean indicating whether to store compressed data.
+    :param rescale: If True, the image will be rescaled to fit the display. Defaults to False (cropped).
+    :param background_color: The color used for filling transparent areas, if provided.
+    :param brightness: Brightness of the image. Defaults to 127.
+    :param output_path: Where to write the asset. Defaults to the image path with ASSET_EXTENSION appended.
+    :return: Path of the written asset.
+    :rtype: str
+    """
+    output_path = output_path or asset_path_for(image_path)
+    matrix = LedMatrix(display=display, serial_port_path=None, color_order=color_order, compress=compress,
+                       keepalive_interval=None, frame_cache_size=None)
+    if background_color:
+        matrix.clear_with_background(background_color)
+    matrix.background_buffer = matrix.display_buffer[:]
+
+    source_stat = os.stat(image_path)
+    opaque = True
+    frames = []
+    first_display_buffer = None
+    with matrix._open_image(image_path, rescale) as img:
+        loop = img.info.get('loop', -1)
+        animated = getattr(img, 'is_animated', False)
+        for frame in ImageSequence.Iterator(img):
+            # Convert the frames the same way display_image does, so the asset matches it exactly
+            opaque = matrix._render_frame(frame.convert("RGBA") if animated else frame, rescale, brightness) and opaque
+            frames.append(matrix._encode_frame(frame.info.get('duration', 100) / 1000.0))
+            if first_display_buffer is None:
+                first_display_buffer = bytes(matrix.display_buffer)
+
+    write_asset(output_path, display, matrix.width, matrix.height, color_order, compress, rescale, opaque,
+                brightness, background_color, loop, source_stat, frames, first_display_buffer)
+    return output_path
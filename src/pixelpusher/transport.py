@@ -0,0 +1,224 @@
+import threading
+import time
+import zlib
+import serial
+
+
+class SerialTransport:
+    """
+    Persistent serial connection shared by the LED devices.
+
+    The port is opened on the first write and kept open for subsequent frames.
+    When the USB device disappears (or was never there), the transport closes
+    the port and retries with an exponential backoff, so a device that is
+    plugged back in (udev hotplug) is picked up again without restarting.
+    Error messages are rate limited to avoid flooding the log while a device
+    is unplugged.
+
+    Frames identical to the previous one are skipped, unless the previous frame
+    was sent more than keepalive_interval seconds ago. The last frame is also sent
+    again right after reconnecting, so the hardware shows the right thing after a
+    reset even when nothing changes.
+
+    Attributes:
+        port_path (str): Path or pyserial URL of the serial port.
+        baudrate (int): Baud rate used to open the port.
+        timeout (float): Read and write timeout in seconds.
+        min_backoff (float): Initial delay before retrying a failed port, in seconds.
+        max_backoff (float): Upper limit for the retry delay, in seconds.
+        error_interval (float): Minimum number of seconds between two printed errors.
+        skip_unchanged (bool): Skip frames that are identical to the previous frame.
+        keepalive_interval (float): Seconds after which an unchanged frame is sent anyway, or None to never resend.
+        frames_sent (int): Number of frames written to the port.
+        frames_skipped (int): Number of frames skipped because they did not change.
+    """
+
+    def __init__(self, port_path, baudrate=115200, timeout=1,
+                 min_backoff=0.5, max_backoff=10.0, error_interval=10.0,
+                 skip_unchanged=True, keepalive_interval=5.0):
+        """
+        Initializes the SerialTransport object. The port is not opened until the first write.
+
+        :param port_path: Path to the serial port, or any URL understood by serial.serial_for_url.
+        :param baudrate: Baud rate used to open the port.
+        :param timeout: Read and write timeout in seconds.
+        :param min_backoff: Initial delay before retrying a failed port, in seconds.
+        :param max_backoff: Upper limit for the retry delay, in seconds.
+        :param error_interval: Minimum number of seconds between two printed errors.
+        :param skip_unchanged: Skip frames that are identical to the previous frame.
+        :param keepalive_interval: Seconds after which an unchanged frame is sent anyway, or None to never resend.
+        """
+        self.port_path = port_path
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.error_interval = error_interval
+        self.skip_unchanged = skip_unchanged
+        self.keepalive_interval = keepalive_interval
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self._serial = None
+        self._lock = threading.Lock()
+        self._backoff = min_backoff
+        self._retry_at = 0.0
+        self._last_error_time = None
+        self._suppressed_errors = 0
+        self._last_frame = None  # Chunks of the last frame passed to write
+        self._last_frame_fingerprint = None
+        self._sent_fingerprint = None  # Fingerprint of the last frame sent, None after (re)connecting
+        self._last_sent_time = 0.0
+
+    @property
+    def is_open(self):
+        """
+        True if the serial port is currently open.
+        """
+        return self._serial is not None
+
+    def open(self):
+        """
+        Opens the serial port if it is not open yet and the backoff delay has passed.
+
+        :return: True if the port is open after the call.
+        :rtype: bool
+        """
+        with self._lock:
+            return self._ensure_open()
+
+    def close(self):
+        """
+        Closes the serial port. The next write will open it again.
+        """
+        with self._lock:
+            self._close()
+            self._retry_at = 0.0
+
+    def write(self, *chunks):
+        """
+        Writes one frame to the serial port.
+
+        Each chunk is written separately, so a prefix and a payload can be sent
+        without concatenating them first. If the port cannot be opened or the write
+        fails, the frame is dropped and a reconnect is scheduled. A frame identical
+        to the previous one is skipped unless the keepalive interval has passed.
+
+        :param chunks: Bytes-like objects to write, in order.
+        :return: True if the frame was written or skipped, False if it was dropped.
+        :rtype: bool
+        """
+        fingerprint = self._fingerprint(chunks)
+        with self._lock:
+            # Remember the newest frame even when the port is closed, so resend shows it once the
+            # device is back. Keep a copy of chunks that are not bytes, the caller may reuse or release them
+            if fingerprint != self._last_frame_fingerprint:
+                self._last_frame = tuple(chunk if isinstance(chunk, bytes) else bytes(chunk) for chunk in chunks)
+                self._last_frame_fingerprint = fingerprint
+            if not self._ensure_open():
+                return False
+            if self.skip_unchanged and self._is_current(fingerprint):
+                self.frames_skipped += 1
+                return True
+            return self._write_chunks(chunks, fingerprint)
+
+    def resend(self):
+        """
+        Writes the last frame again if it was sent more than keepalive_interval seconds ago,
+        or if it was not sent since the port (re)connected.
+
+        :return: True if the last frame is on the display, False if there is none or it was dropped.
+        :rtype: bool
+        """
+        with self._lock:
+            if self._last_frame is None or not self._ensure_open():
+                return False
+            if self._is_current(self._last_frame_fingerprint):
+                return True
+            return self._write_chunks(self._last_frame, self._last_frame_fingerprint)
+
+    @staticmethod
+    def _fingerprint(chunks):
+        """
+        Calculates a fingerprint of a frame: its length and CRC-32 checksum.
+        """
+        crc = 0
+        length = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            length += len(chunk)
+        return length, crc
+
+    def _is_current(self, fingerprint):
+        """
+        True if this frame was the last one sent and the keepalive interval has not passed yet.
+        """
+        return fingerprint == self._sent_fingerprint and (
+                self.keepalive_interval is None or
+                time.monotonic() - self._last_sent_time < self.keepalive_interval)
+
+    def _write_chunks(self, chunks, fingerprint):
+        """
+        Writes the chunks of a frame to the open port. Must be called with the lock held.
+        """
+        try:
+            for chunk in chunks:
+                self._serial.write(chunk)
+        except (serial.SerialException, OSError) as e:
+            self._report_error(f"Error writing to serial port {self.port_path}: {e}")
+            self._close()
+            self._schedule_retry()
+            return False
+        self.frames_sent += 1
+        self._sent_fingerprint = fingerprint
+        self._last_sent_time = time.monotonic()
+        return True
+
+    def _ensure_open(self):
+        """
+        Opens the port when needed. Must be called with the lock held.
+        """
+        if self._serial is not None:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        try:
+            self._serial = serial.serial_for_url(self.port_path, baudrate=self.baudrate,
+                                                 timeout=self.timeout, write_timeout=self.timeout)
+        except (serial.SerialException, OSError, ValueError) as e:
+            self._report_error(f"Error opening serial port {self.port_path}: {e}")
+            self._schedule_retry()
+            return False
+        if self._last_error_time is not None:
+            print(f"Serial port {self.port_path} connected")
+            self._last_error_time = None
+            self._suppressed_errors = 0
+        self._backoff = self.min_backoff
+        return True
+
+    def _close(self):
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except (serial.SerialException, OSError):
+                pass
+            self._serial = None
+        self._sent_fingerprint = None  # Send the next frame even if it did not change
+
+    def _schedule_retry(self):
+        self._retry_at = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _report_error(self, message):
+        """
+        Prints an error message, unless one was printed less than error_interval seconds ago.
+        """
+        now = time.monotonic()
+        if self._last_error_time is not None and now - self._last_error_time < self.error_interval:
+            self._suppressed_errors += 1
+            return
+        if self._suppressed_errors:
+            message += f" ({self._suppressed_errors} similar errors suppressed)"
+        print(message)
+        self._last_error_time = now
+        self._suppressed_errors = 0
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pixelpusher import DISPLAY_INTERSTATE75_128x32, LedMatrix, PlasmaButtons  # noqa: E402
+
+
+class FakeTransport:
+    """
+    Stands in for a SerialTransport: records the frames written to it instead of opening a serial port.
+    """
+
+    def __init__(self, keepalive_interval=None, min_backoff=0.5):
+        self.keepalive_interval = keepalive_interval
+        self.min_backoff = min_backoff
+        self.frames = []
+
+    def write(self, *chunks):
+        self.frames.append(b"".join(chunks))
+        return True
+
+    def resend(self):
+        return bool(self.frames)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def make_matrix():
+    """
+    Factory of LedMatrix objects for a 128x32 display, without a frame cache, writing to a FakeTransport.
+    """
+    matrices = []
+
+    def make_matrix(**kwargs):
+        kwargs.setdefault("frame_cache_size", None)
+        matrix = LedMatrix(display=DISPLAY_INTERSTATE75_128x32, serial_port_path=None, **kwargs)
+        matrix.transport = FakeTransport()
+        matrices.append(matrix)
+        return matrix
+
+    yield make_matrix
+    for matrix in matrices:
+        matrix.close()
+
+
+@pytest.fixture
+def make_buttons():
+    """
+    Factory of PlasmaButtons objects whose refresh thread is stopped, so the test drives the updates,
+    with a clock fixed at 0.0 and a FakeTransport per controller.
+    """
+    def make_buttons(num_leds=8, **kwargs):
+        kwargs.setdefault("refresh_rate", 64)
+        buttons = PlasmaButtons(num_leds=num_leds, serial_port_path="loop://", **kwargs)
+        buttons.stop()
+        buttons.transports = [FakeTransport() for _ in buttons.transports]
+        buttons.transport = buttons.transports[0]
+        buttons.clock = lambda: 0.0
+        return buttons
+
+    return make_buttons
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from pixelpusher.asset import RenderedFrame
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def matrix(make_matrix, sent):
+    matrix = make_matrix()
+    matrix._send_frame = sent.append
+    return matrix
+
+
+def slow_frames(count, render_time, duration):
+    for number in range(count):
+        time.sleep(render_time)  # Decoding and rendering take longer than the frame is shown
+        yield RenderedFrame(bytes([number]), duration)
+
+
+def test_slow_first_pass_sends_every_frame(matrix, sent):
+    matrix._animate(slow_frames(10, 0.06, 0.05), loop=None)
+    assert [frame.payload for frame in sent] == [bytes([number]) for number in range(10)]
+    assert matrix.frames_dropped == 0
+
+
+def test_slow_first_pass_of_looping_animation_sends_every_frame(matrix, sent):
+    matrix._animate(slow_frames(5, 0.06, 0.05), loop=1)
+    # The first pass is rendered and sent completely, the second pass replays the stored frames
+    assert [frame.payload for frame in sent[:5]] == [bytes([number]) for number in range(5)]
+    assert sent[5].payload == bytes([0])
+
+
+def test_single_frame_is_sent(matrix, sent):
+    matrix._animate(slow_frames(1, 0.06, 0.01), loop=None)
+    assert len(sent) == 1
+
+
+def stored_frames(*durations):
+    return [RenderedFrame(bytes([number]), duration) for number, duration in enumerate(durations)]
+
+
+def send_first_frame_late(matrix, sent, delay):
+    def send_frame(rendered_frame):
+        if not sent:
+            time.sleep(delay)  # The device is stuck while the first frame is sent
+        sent.append(rendered_frame)
+
+    matrix._send_frame = send_frame
+
+
+def test_late_frame_is_sent_while_the_next_frame_is_not_due(matrix, sent):
+    send_first_frame_late(matrix, sent, 0.34)
+    matrix._animate(stored_frames(0.1, 0.1, 0.6), loop=None)
+    # Frame 1 is 0.14 s late, but frame 2 is shown for 0.6 s and is not due yet
+    assert [frame.payload for frame in sent] == [bytes([0]), bytes([1]), bytes([2])]
+    assert matrix.frames_dropped == 0
+
+
+def test_late_frame_is_dropped_when_the_next_frame_is_due(matrix, sent):
+    send_first_frame_late(matrix, sent, 0.34)
+    matrix._animate(stored_frames(0.1, 0.1, 0.06, 0.2), loop=None)
+    # Frame 2 was due at 0.26 s, so frame 1 is dropped; frame 3 is not due until 0.46 s, so frame 2 is sent
+    assert [frame.payload for frame in sent] == [bytes([0]), bytes([2]), bytes([3])]
+    assert matrix.frames_dropped == 1
@@ -0,0 +1,180 @@
+import os
+import time
+
+import pytest
+
+from pixelpusher import ArtIndex, normalize_rom_name
+
+
+@pytest.mark.parametrize("name, file_name, normalized", [
+    ("/userdata/roms/mame/Mr.Do.zip", True, "mrdo"),
+    ("Mr. Do!", False, "mrdo"),
+    ("Vol.2", False, "vol2"),
+    ("Vol.2", True, "vol2"),
+    ("Puzzle Collection Vol.2.nes.zip", True, "puzzlecollectionvol2"),
+    ("Game.nes", False, "gamenes"),
+    ("/roms/snes/Legend of Zelda, The (USA) [!].SFC", True, "legendofzelda"),
+])
+def test_normalize_rom_name(name, file_name, normalized):
+    assert normalize_rom_name(name, file_name) == normalized
+
+
+def test_match_keeps_dots_in_names(tmp_path):
+    mame = tmp_path / "mame"
+    mame.mkdir()
+    for name in ("Mr.Do.png", "Mr.png", "Puzzle Vol.2.png", "Puzzle Vol.3.png"):
+        (mame / name).write_bytes(b"")
+    art_index = ArtIndex(str(tmp_path), ("png",))
+
+    assert art_index.match("mame", "/userdata/roms/mame/Mr.Do.zip") == str(mame / "Mr.Do.png")
+    assert art_index.match("mame", None, "Mr. Do!") == str(mame / "Mr.Do.png")
+    assert art_index.match("mame", "/userdata/roms/mame/puzzle.zip", "Puzzle Vol.2") == \
+        str(mame / "Puzzle Vol.2.png")
+    assert art_index.match("mame", "/userdata/roms/mame/Puzzle Vol.3 (Japan).7z") == str(mame / "Puzzle Vol.3.png")
+    assert art_index.match("mame", None, "Puzzle Vol.4") is None
+
+
+def make_tree(root, *names):
+    """
+    Creates empty image files below root, and dates all directories of the tree a minute back,
+    so a scan trusts their modification time.
+    """
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+    past = time.time_ns() - 60_000_000_000
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, ns=(past, past))
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def directory_reads(monkeypatch):
+    """
+    The directories ArtIndex objects read from disk, in order.
+    """
+    reads = []
+    read_directory = ArtIndex._read_directory
+
+    def recording_read_directory(self, directory, mtime=None):
+        reads.append(directory)
+        return read_directory(self, directory, mtime)
+
+    monkeypatch.setattr(ArtIndex, "_read_directory", recording_read_directory)
+    return reads
+
+
+def test_scan_picks_up_added_and_removed_images(tmp_path):
+    make_tree(tmp_path, "snes.png", "snes/mario.png")
+    art_index = ArtIndex(str(tmp_path), ("png", "gif"))
+    assert art_index.find("snes") == str(tmp_path / "snes.png")
+    assert art_index.find("snes", "mario") == str(tmp_path / "snes" / "mario.png")
+    assert art_index.find("snes", "zelda") is None
+
+    (tmp_path / "snes" / "zelda.gif").write_bytes(b"")
+    (tmp_path / "snes" / "mario.gif").write_bytes(b"")
+    art_index.scan()
+    assert art_index.find("snes", "zelda") == str(tmp_path / "snes" / "zelda.gif")
+    assert art_index.find("snes", "mario") == str(tmp_path / "snes" / "mario.png")  # Preferred extension
+
+    (tmp_path / "snes" / "mario.png").unlink()
+    art_index.scan()
+    assert art_index.find("snes", "mario") == str(tmp_path / "snes" / "mario.gif")
+
+    for name in ("mario.gif", "zelda.gif"):
+        (tmp_path / "snes" / name).unlink()
+    (tmp_path / "snes").rmdir()
+    art_index.scan()
+    assert art_index.find("snes", "zelda") is None
+    assert art_index.match("snes", "mario.sfc") is None
+    assert art_index.find("snes") == str(tmp_path / "snes.png")
+
+
+def test_scan_reads_only_changed_directories(tmp_path, directory_reads):
+    make_tree(tmp_path, "snes/mario.png", "nes/zelda.png")
+    art_index = ArtIndex(str(tmp_path), ("png",))
+    assert sorted(directory_reads) == sorted([str(tmp_path), str(tmp_path / "nes"), str(tmp_path / "snes")])
+
+    del directory_reads[:]
+    art_index.scan()
+    assert directory_reads == []
+
+    (tmp_path / "nes" / "metroid.png").write_bytes(b"")
+    art_index.scan()
+    assert directory_reads == [str(tmp_path / "nes")]
+    assert art_index.find("nes", "metroid") == str(tmp_path / "nes" / "metroid.png")
+
+
+def test_index_without_inotify_is_scanned_periodically(tmp_path, monkeypatch):
+    monkeypatch.setattr("pixelpusher.artindex._load_inotify", lambda: None)
+    make_tree(tmp_path, "snes/mario.png")
+    art_index = ArtIndex(str(tmp_path), ("png",), scan_interval=0.05)
+    art_index.start()
+    try:
+        assert not art_index.uses_inotify
+        (tmp_path / "snes" / "zelda.png").write_bytes(b"")
+        assert wait_until(lambda: art_index.find("snes", "zelda") is not None)
+        (tmp_path / "snes" / "mario.png").unlink()
+        assert wait_until(lambda: art_index.find("snes", "mario") is None)
+    finally:
+        art_index.stop()
+
+
+def test_index_follows_inotify_events(tmp_path):
+    make_tree(tmp_path, "snes/mario.png")
+    art_index = ArtIndex(str(tmp_path), ("png",), scan_interval=3600.0)
+    art_index.start()
+    try:
+        if not art_index.uses_inotify:
+            pytest.skip("inotify is not available")
+        (tmp_path / "snes" / "zelda.png").write_bytes(b"")
+        assert wait_until(lambda: art_index.find("snes", "zelda") is not None)
+        (tmp_path / "nes").mkdir()
+        (tmp_path / "nes" / "metroid.png").write_bytes(b"")
+        assert wait_until(lambda: art_index.match("nes", "Metroid (USA).nes") is not None)
+        (tmp_path / "snes" / "mario.png").unlink()
+        assert wait_until(lambda: art_index.find("snes", "mario") is None)
+    finally:
+        art_index.stop()
+
+
+def test_index_is_loaded_from_its_cache(tmp_path, directory_reads):
+    make_tree(tmp_path, "art/snes/mario.png", "art/snes.png")
+    root = str(tmp_path / "art")
+    cache_path = str(tmp_path / "art_index.json")
+    ArtIndex(root, ("png",), cache_path=cache_path)
+    assert os.path.exists(cache_path)
+
+    del directory_reads[:]
+    art_index = ArtIndex(root, ("png",), cache_path=cache_path)
+    assert directory_reads == []
+    assert art_index.find("snes", "mario") == str(tmp_path / "art" / "snes" / "mario.png")
+    assert len(art_index) == 2
+
+
+@pytest.mark.parametrize("change", ["version", "extensions", "corrupt"])
+def test_stale_cache_is_ignored(tmp_path, directory_reads, monkeypatch, change):
+    make_tree(tmp_path, "art/snes/mario.png", "art/snes/mario.gif")
+    root = str(tmp_path / "art")
+    cache_path = str(tmp_path / "art_index.json")
+    ArtIndex(root, ("png", "gif"), cache_path=cache_path)
+
+    extensions = ("png", "gif")
+    if change == "version":
+        monkeypatch.setattr("pixelpusher.artindex.ART_INDEX_CACHE_VERSION", 3)
+    elif change == "extensions":
+        extensions = ("gif", "png")
+    else:
+        with open(cache_path, "w") as file:
+            file.write('{"version": ')
+    del directory_reads[:]
+    art_index = ArtIndex(root, extensions, cache_path=cache_path)
+    assert sorted(directory_reads) == sorted([root, os.path.join(root, "snes")])
+    assert art_index.find("snes", "mario") == os.path.join(root, "snes", "mario." + extensions[0])
@@ -0,0 +1,63 @@
+import os
+import random
+import shutil
+
+from PIL import Image
+
+from pixelpusher import DISPLAY_INTERSTATE75_128x32, RGBl, compile_asset
+
+
+def save_image(path, alpha):
+    rng = random.Random(5)
+    img = Image.new("RGBA", (128, 32))
+    img.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256), alpha(rng)) for _ in range(128 * 32)])
+    img.save(path)
+
+
+def display_with_and_without_asset(make_matrix, tmp_path, alpha, background_color):
+    compiled_dir = tmp_path / "compiled"
+    plain_dir = tmp_path / "plain"
+    compiled_dir.mkdir()
+    plain_dir.mkdir()
+    image_path = str(compiled_dir / "art.png")
+    save_image(image_path, alpha)
+    shutil.copy(image_path, plain_dir / "art.png")
+    compile_asset(image_path, DISPLAY_INTERSTATE75_128x32, rescale=True, background_color=background_color)
+
+    from_asset = make_matrix()
+    from_asset.display_image(image_path, rescale=True, background_color=background_color)
+    assert from_asset._asset is not None
+
+    from_image = make_matrix()
+    from_image.display_image(str(plain_dir / "art.png"), rescale=True, background_color=background_color)
+    assert from_image._asset is None
+    return from_asset, from_image
+
+
+def test_opaque_asset_restores_display_buffer(make_matrix, tmp_path):
+    from_asset, from_image = display_with_and_without_asset(make_matrix, tmp_path, lambda rng: 255, None)
+    assert from_asset.display_buffer == from_image.display_buffer
+    assert any(from_asset.display_buffer)
+
+
+def test_transparent_asset_restores_display_buffer(make_matrix, tmp_path):
+    from_asset, from_image = display_with_and_without_asset(make_matrix, tmp_path, lambda rng: rng.randrange(256),
+                                                            RGBl(40, 80, 120, 200))
+    assert from_asset.display_buffer == from_image.display_buffer
+
+
+def test_asset_compiled_later_is_found_after_listing_expires(make_matrix, tmp_path, monkeypatch):
+    image_path = str(tmp_path / "art.png")
+    save_image(image_path, lambda rng: 255)
+    matrix = make_matrix()
+    matrix.display_image(image_path, rescale=True)
+    assert matrix._asset is None
+
+    compile_asset(image_path, DISPLAY_INTERSTATE75_128x32, rescale=True)
+    matrix.display_image(image_path, rescale=True)
+    assert matrix._asset is None  # The listing of the directory is still current
+
+    monkeypatch.setattr("pixelpusher.matrix.ASSET_LISTING_INTERVAL", 0.0)
+    matrix.display_image(image_path, rescale=True)
+    assert matrix._asset is not None
+    assert os.path.exists(image_path + ".pmv")
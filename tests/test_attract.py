@@ -0,0 +1,52 @@
+import pytest
+
+from pixelpusher import FIELD_PATTERNS, RGBl, compile_attract_program
+
+REFRESH_RATE = 64
+COORD_MAP = {(led % 8, led // 8): led for led in range(32)}
+
+
+@pytest.fixture
+def buttons(make_buttons):
+    return make_buttons(num_leds=32, coord_map=COORD_MAP, refresh_rate=REFRESH_RATE)
+
+
+def frame_of(buttons):
+    """
+    The colors of all LEDs as RGBl bytes, like the frames of a field pattern.
+    """
+    leds = buttons.button_leds
+    return b"".join(bytes((leds[index + 2], leds[index + 1], leds[index], leds[index + 3]))
+                    for index in range(0, len(leds), 4))
+
+
+@pytest.mark.parametrize("pattern_name", sorted(FIELD_PATTERNS))
+def test_field_pattern_compiles_to_one_step(buttons, pattern_name):
+    program = compile_attract_program([(pattern_name, {'duration': 2.0})], COORD_MAP, buttons.geometry, 32,
+                                      REFRESH_RATE)
+    assert len(program.steps) == 1
+    assert program.duration == 2.0
+    assert program.steps[0].field.frame_count == 2 * REFRESH_RATE
+
+
+@pytest.mark.parametrize("pattern_name", sorted(FIELD_PATTERNS))
+def test_field_pattern_frames_are_rendered_per_refresh(buttons, pattern_name):
+    pattern_queue = [(pattern_name, {'duration': 0.5})]
+    field = compile_attract_program(pattern_queue, COORD_MAP, buttons.geometry, 32, REFRESH_RATE).steps[0].field
+    buttons.start_attract_mode(pattern_queue)
+
+    frames = set()
+    for tick in range(2 * field.frame_count):  # Two passes
+        buttons._update_led_colors(tick / REFRESH_RATE)
+        assert frame_of(buttons) == field.render(tick % field.frame_count)
+        frames.add(frame_of(buttons))
+    assert len(frames) > 1
+
+
+def test_steps_after_a_field_pattern_are_applied(buttons):
+    color_on = RGBl(1, 2, 3, 4)
+    pattern_queue = [('wave', {'duration': 0.25}),
+                     ('linear', {'direction': 'left_to_right', 'color_on': color_on, 'delay': 0.0})]
+    buttons.start_attract_mode(pattern_queue)
+    buttons._update_led_colors(0.3)
+    assert frame_of(buttons) == bytes(color_on) * 32
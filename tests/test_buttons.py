@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+
+from pixelpusher import ButtonController, PlasmaButtons, RGBl
+
+RED = RGBl(200, 10, 20, 31)
+BLUE = RGBl(0, 40, 250, 15)
+
+
+@pytest.fixture
+def buttons(make_buttons):
+    return make_buttons()
+
+
+def led_bytes(buttons, led_number):
+    return bytes(buttons.button_leds[led_number * 4:led_number * 4 + 4])
+
+
+@pytest.mark.parametrize("mode", ["blink", "sync blink", "fade", "fade sweep"])
+def test_led_with_own_effect_matches_shared_effect(buttons, mode):
+    with buttons.batch() as batch:
+        batch.set_leds_mode((0, 1), mode, color_to=RED, color_from=BLUE, transition_time=0.5)
+        batch.set_led_mode(2, mode, color_to=RED, color_from=BLUE, transition_time=0.5)
+    assert buttons._effect_ids[0] == buttons._effect_ids[1] > 0
+    assert 2 in buttons._solo_effects
+
+    for tick in range(64):
+        buttons._update_led_colors(tick / 64)
+        assert led_bytes(buttons, 2) == led_bytes(buttons, 0) == led_bytes(buttons, 1)
+
+
+def test_finished_fade_of_own_effect_returns_to_normal_mode(buttons):
+    buttons.set_led_mode(3, "fade", color_to=RED, color_from=BLUE, transition_time=0.25)
+    buttons._update_led_colors(0.5)
+    assert not buttons.is_animating()
+    assert buttons.get_led_status(3).mode == "normal"
+    assert led_bytes(buttons, 3) == bytes((RED.blue, RED.green, RED.red, RED.brightness))
+
+
+def test_led_leaves_its_own_effect(buttons):
+    buttons.set_led_mode(4, "blink", color_to=RED, color_from=BLUE, transition_time=0.5)
+    buttons.set_led_mode(4, "normal", color_to=BLUE)
+    assert not buttons._solo_effects
+    assert buttons._effect_ids[4] == 0
+    buttons._update_led_colors(0.3)
+    assert led_bytes(buttons, 4) == bytes((BLUE.blue, BLUE.green, BLUE.red, BLUE.brightness))
+
+
+def test_repeated_led_joins_one_effect(buttons):
+    with buttons.batch() as batch:
+        batch.set_leds_mode((5, 5), "blink", color_to=RED, color_from=BLUE, transition_time=0.5)
+    assert list(buttons._solo_effects) == [5]
+    assert not buttons._effects
+
+
+def test_led_status_comes_from_the_effect(buttons):
+    buttons.clock = lambda: 2.0
+    buttons.set_led_mode(6, "fade sweep", color_to=RED, color_from=BLUE, transition_time=0.75)
+    buttons.clock = lambda: 2.5
+    status = buttons.get_led_status(6)
+    assert (status.mode, status.color_from, status.color_to) == ("fade sweep", BLUE, RED)
+    assert (status.transition_time, status.time_since_last_transition) == (0.75, 0.5)
+
+    buttons.set_led_mode(6, "normal", color_to=BLUE)
+    status = buttons.get_led_status(6)
+    assert (status.mode, status.color_from, status.color_to) == ("normal", BLUE, BLUE)
+    assert (status.transition_time, status.time_since_last_transition) == (0.75, 0.0)
+
+
+def test_refresh_never_sees_part_of_a_batch(buttons):
+    scenes = [[RGBl(led * 3 + 1, scene * 10, 31 - led, scene + 2) for led in range(8)] for scene in range(2)]
+    frames = {PlasmaButtons.PREFIX + bytes(8 * 4)}
+    for scene in scenes:
+        frames.add(PlasmaButtons.PREFIX + b"".join(bytes((color.blue, color.green, color.red, color.brightness))
+                                                   for color in scene))
+    stop = threading.Event()
+
+    def refresh():
+        while not stop.is_set():
+            buttons._update_led_colors()
+            buttons.write_to_display()
+
+    refresh_thread = threading.Thread(target=refresh)
+    refresh_thread.start()
+    try:
+        for commit in range(500):
+            with buttons.batch() as batch:
+                for led, color in enumerate(scenes[commit % 2]):  # One change per LED
+                    batch.set_led_mode(led, "normal", color_to=color)
+    finally:
+        stop.set()
+        refresh_thread.join()
+    assert buttons.transport.frames
+    assert set(buttons.transport.frames) <= frames
+
+
+def test_effect_targets_resolve_to_their_leds(make_buttons):
+    buttons = make_buttons(num_leds=12, button_map={"P1:A": 2}, coord_map={(3, 4): 1})
+    buttons.set_effects({5: ("normal", RED),
+                         "P1:A": ("normal", BLUE),
+                         (3, 4): ("normal", RED),
+                         "P2:A": ("normal", BLUE),  # Unknown label
+                         (9, 9): ("normal", BLUE)})  # Unknown coordinate
+    red = bytes((RED.blue, RED.green, RED.red, RED.brightness))
+    blue = bytes((BLUE.blue, BLUE.green, BLUE.red, BLUE.brightness))
+    expected = {1: red, 5: red, 8: blue, 9: blue, 10: blue, 11: blue}
+    for led in range(12):
+        assert led_bytes(buttons, led) == expected.get(led, bytes(4))
+
+
+@pytest.fixture
+def running_buttons():
+    """
+    Factory of PlasmaButtons objects with a running refresh thread, that count their refreshes.
+    """
+    running = []
+
+    def running_buttons(**kwargs):
+        buttons = PlasmaButtons(**kwargs)
+        buttons.refreshes = 0
+        update_led_colors = buttons._update_led_colors
+
+        def counting_update_led_colors():
+            buttons.refreshes += 1
+            update_led_colors()
+
+        buttons._update_led_colors = counting_update_led_colors
+        running.append(buttons)
+        return buttons
+
+    yield running_buttons
+    for buttons in running:
+        buttons.stop()
+
+
+def wait_for_refresh(buttons, refreshes, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while buttons.refreshes <= refreshes and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return buttons.refreshes > refreshes
+
+
+def test_idle_refresh_thread_sleeps_until_the_leds_change(running_buttons):
+    buttons = running_buttons(num_leds=8, serial_port_path="loop://", keepalive_interval=None)
+    buttons.set_led_mode(1, "normal", color_to=BLUE)  # The first refresh may have run before counting started
+    wait_for_refresh(buttons, 0)
+    time.sleep(0.05)
+    refreshes = buttons.refreshes
+    time.sleep(0.2)
+    assert buttons.refreshes == refreshes
+
+    buttons.set_led_mode(0, "normal", color_to=RED)
+    assert wait_for_refresh(buttons, refreshes)
+
+
+def test_idle_refresh_thread_wakes_for_the_shortest_keepalive(running_buttons):
+    buttons = running_buttons(num_leds=None, keepalive_interval=None,
+                              controllers=[ButtonController("loop://", 4), ButtonController("loop://", 4)])
+    buttons.transports[1].keepalive_interval = 0.02
+    buttons.set_led_mode(0, "normal", color_to=RED)  # Wakes up the thread, which then sees the keepalive
+    wait_for_refresh(buttons, 0)
+    refreshes = buttons.refreshes
+    time.sleep(0.3)
+    assert buttons.refreshes >= refreshes + 3
+
+
+def test_each_controller_is_sent_its_own_leds(make_buttons):
+    buttons = make_buttons(num_leds=None, controllers=[ButtonController("loop://", 3), ButtonController("loop://", 5)])
+    assert buttons.num_leds == 8
+    assert len(buttons.transports) == 2
+    for led in range(8):
+        buttons.set_led_mode(led, "normal", color_to=RGBl(led + 1, led + 10, led + 20, led))
+    buttons._update_led_colors()
+    assert buttons.write_to_display()
+
+    first, second = (transport.frames for transport in buttons.transports)
+    assert first == [PlasmaButtons.PREFIX + bytes(buttons.button_leds[:3 * 4])]
+    assert second == [PlasmaButtons.PREFIX + bytes(buttons.button_leds[3 * 4:])]
+    assert second[0][len(PlasmaButtons.PREFIX):][:4] == bytes((23, 13, 4, 3))  # LED 3 comes first
+
+
+def test_presses_from_several_threads_leave_no_held_button(make_buttons):
+    buttons = make_buttons(button_map={"P1:A": 1})
+
+    def press_and_release():
+        for _ in range(300):
+            buttons.press_button("P1:A")
+            buttons.release_button("P1:A", fade=False)
+
+    threads = [threading.Thread(target=press_and_release) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    buttons.release_button("P1:A", fade=False)
+    assert not buttons._pressed_buttons
+    buttons._update_led_colors(10.0)  # Long after the flashes ended
+    assert not buttons._tracks
+    assert not buttons.is_animating()
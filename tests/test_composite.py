@@ -0,0 +1,84 @@
+import random
+
+import pytest
+from PIL import Image
+
+from pixelpusher import RGBl
+
+BRIGHTNESS = 127
+
+
+def legacy_render_frame(matrix, img, rescale, brightness):
+    """
+    The per-pixel blend _render_frame used before it blended whole images, as the reference.
+    """
+    if rescale:
+        img = img.resize((matrix.width, matrix.height))
+    else:
+        left = (img.width - matrix.width) // 2
+        upper = (img.height - matrix.height) // 2
+        img = img.crop((left, upper, left + matrix.width, upper + matrix.height))
+
+    display_buffer = bytearray(len(matrix.display_buffer))
+    for x in range(img.width):
+        for y in range(img.height):
+            pixel = img.getpixel((x, y))
+            if len(pixel) == 4:
+                r, g, b, a = pixel
+            else:
+                r, g, b = pixel
+                a = 255
+            index = (x + y * matrix.width) * 4
+            current_r, current_g, current_b, _ = matrix.background_buffer[index:index + 4]
+            blend_factor = a / 255
+            display_buffer[index:index + 4] = [
+                int((r * blend_factor) + (current_r * (1 - blend_factor))),
+                int((g * blend_factor) + (current_g * (1 - blend_factor))),
+                int((b * blend_factor) + (current_b * (1 - blend_factor))),
+                brightness
+            ]
+    return display_buffer
+
+
+def source_image(kind, width, height):
+    generator = random.Random(kind)
+    size = (width * 3, height * 3)
+    if kind == "opaque":
+        return Image.frombytes("RGB", size, generator.randbytes(size[0] * size[1] * 3))
+    img = Image.frombytes("RGBA", size, generator.randbytes(size[0] * size[1] * 4))
+    if kind == "binary alpha":
+        img.putalpha(img.getchannel("A").point(lambda a: 255 if a > 127 else 0))
+    return img
+
+
+# Opaque pixels are copied, so they match exactly. Where alpha is partial, Pillow rounds the blend
+# where the per-pixel code truncated it, so those pixels may differ by one step. Binary alpha only
+# has partial alpha after rescaling, where resampling smooths the alpha channel along the edges.
+TOLERANCES = {
+    ("opaque", False): 0,
+    ("opaque", True): 0,
+    ("binary alpha", False): 0,
+    ("binary alpha", True): 1,
+    ("partial alpha", False): 1,
+    ("partial alpha", True): 1,
+}
+
+
+@pytest.mark.parametrize("kind, rescale", sorted(TOLERANCES))
+def test_render_frame_matches_per_pixel_blend(make_matrix, kind, rescale):
+    matrix = make_matrix()
+    matrix.background_buffer = bytearray(random.Random(1).randbytes(len(matrix.background_buffer)))
+    img = source_image(kind, matrix.width, matrix.height)
+
+    expected = legacy_render_frame(matrix, img, rescale, BRIGHTNESS)
+    opaque = matrix._render_frame(img, rescale, BRIGHTNESS)
+
+    differences = [abs(a - b) for a, b in zip(matrix.display_buffer, expected)]
+    assert max(differences) <= TOLERANCES[kind, rescale]
+    assert opaque == (kind == "opaque")
+
+
+def test_clear_with_background_fills_every_pixel(make_matrix):
+    matrix = make_matrix()
+    matrix.clear_with_background(RGBl(1, 2, 3, 4))
+    assert matrix.display_buffer == bytearray([1, 2, 3, 4] * (matrix.width * matrix.height))
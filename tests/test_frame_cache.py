@@ -0,0 +1,29 @@
+import random
+
+from PIL import Image
+
+from pixelpusher import RGBl
+
+
+def test_transparent_image_is_cached_per_background_color(make_matrix, tmp_path):
+    rng = random.Random(3)
+    image_path = str(tmp_path / "art.png")
+    img = Image.new("RGBA", (128, 32))
+    img.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.randrange(256))
+                 for _ in range(128 * 32)])
+    img.save(image_path)
+    matrix = make_matrix(frame_cache_size=4 * 1024 * 1024)
+    dark, light = RGBl(10, 20, 30, 31), RGBl(200, 210, 220, 31)
+
+    matrix.display_image(image_path, background_color=dark)
+    on_dark = bytes(matrix.display_buffer)
+    assert (matrix.frame_cache.hits, len(matrix.frame_cache)) == (0, 1)
+
+    matrix.display_image(image_path, background_color=light)
+    assert matrix.frame_cache.hits == 0  # Blended against another background, so rendered again
+    assert len(matrix.frame_cache) == 2
+    assert bytes(matrix.display_buffer) != on_dark
+
+    matrix.display_image(image_path, background_color=dark)
+    assert matrix.frame_cache.hits == 1
+    assert bytes(matrix.display_buffer) == on_dark
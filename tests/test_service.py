@@ -0,0 +1,157 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+@pytest.fixture(params=["batocera", "retropie"])
+def service(request):
+    """
+    The service module of a distribution, loaded without running it.
+    """
+    spec = importlib.util.spec_from_file_location(f"{request.param}_service",
+                                                  os.path.join(ROOT, request.param, "service.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.logger = logging.getLogger(request.param)
+    module.buttons = None
+    return module
+
+
+def selection_event(service):
+    """
+    Name of the event sent when a game is selected, which differs between the distributions.
+    """
+    return next(name for name, event_class in service.COALESCED_EVENT_CLASSES.items()
+                if event_class == "selection" and name.startswith("game"))
+
+
+class FakeWriter:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.append(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingQueue:
+    def __init__(self):
+        self.events = []
+
+    def put(self, event_name, arguments):
+        self.events.append((event_name, arguments))
+
+
+async def read_all(service, data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return [text async for text in service.read_messages(reader)]
+
+
+def test_messages_are_split_by_lines_and_length_prefixes(service):
+    framed = b'{"event": "quit",\n "arguments": {}}'
+    data = (b'{"event": "wake"}\n\n#' + str(len(framed)).encode() + b"\n" + framed +
+            b'5\n{"event": "sleep"}')
+    assert asyncio.run(read_all(service, data)) == ['{"event": "wake"}', framed.decode(), "5",
+                                                     '{"event": "sleep"}']
+
+
+def test_bare_number_does_not_swallow_the_next_message(service):
+    data = b'12\n{"event": "wake"}\n'
+    assert asyncio.run(read_all(service, data)) == ["12", '{"event": "wake"}']
+
+
+def test_oversized_message_is_refused(service):
+    with pytest.raises(ValueError):
+        asyncio.run(read_all(service, b"#" + str(service.MAX_MESSAGE_SIZE + 1).encode() + b"\n"))
+
+
+def test_batch_is_queued_and_acknowledged(service):
+    game = selection_event(service)
+    messages = [{"event": "wake"},
+                {"events": [{"event": game, "arguments": {"game_name": "pacman"}},
+                            {"event": "button-press", "arguments": {"button": "P1:A"}},
+                            {"arguments": {}}],
+                 "ack": True, "id": 7},
+                7,
+                {"event": "sleep", "ack": True}]
+    writer = FakeWriter()
+    queue = RecordingQueue()
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(json.dumps(message).encode() + b"\n" for message in messages))
+        reader.feed_eof()
+        await service.handle_client(reader, writer, queue)
+
+    asyncio.run(run())
+
+    # The button press is handled right away instead of being queued, the bare number holds no events
+    assert queue.events == [("wake", {}), (game, {"game_name": "pacman"}), ("sleep", {})]
+    assert [json.loads(line) for line in writer.lines] == [{"accepted": 2, "rejected": 1, "id": 7},
+                                                           {"accepted": 1, "rejected": 0}]
+
+
+def test_waiting_selection_is_replaced_by_a_newer_one(service):
+    game = selection_event(service)
+    handled = []
+    handlers = {name: (lambda arguments, name=name: handled.append((name, arguments)))
+                for name in ("quit", game)}
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            event_queue = service.EventQueue(executor, handlers)
+            event_queue.put(game, {"game_name": "pacman"})
+            event_queue.put("quit", {})
+            event_queue.put(game, {"game_name": "galaga"})
+            task = asyncio.create_task(event_queue.run())
+            while len(handled) < 2:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            return event_queue
+
+    event_queue = asyncio.run(asyncio.wait_for(run(), 5.0))
+    assert handled == [("quit", {}), (game, {"game_name": "galaga"})]
+    assert event_queue.coalesced == 1
+
+
+def test_newer_selection_cancels_the_render_in_progress(service):
+    game = selection_event(service)
+    started = threading.Event()
+    handled = []
+
+    def render(arguments):
+        started.set()
+        # The first render waits for its cancellation, the next one only checks for it
+        handled.append((arguments["game_name"], service.render_cancelled.wait(5.0 if not handled else 0.0)))
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            event_queue = service.EventQueue(executor, {game: render})
+            task = asyncio.create_task(event_queue.run())
+            event_queue.put(game, {"game_name": "pacman"})
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            event_queue.put(game, {"game_name": "galaga"})
+            while len(handled) < 2:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            return event_queue
+
+    event_queue = asyncio.run(asyncio.wait_for(run(), 10.0))
+    assert handled == [("pacman", True), ("galaga", False)]
+    assert event_queue.cancelled == 1
@@ -0,0 +1,132 @@
+import pytest
+
+from pixelpusher import EASINGS, Keyframe, RGBl, TimelineTrack
+
+RED = RGBl(200, 0, 0, 20)
+BLUE = RGBl(0, 0, 240, 10)
+GREEN = RGBl(0, 100, 0, 30)
+
+
+@pytest.fixture
+def buttons(make_buttons):
+    buttons = make_buttons(num_leds=8, button_map={"P1:A": 1})
+    buttons.set_led_mode(0, "normal", color_to=GREEN)
+    return buttons
+
+
+def led_color(buttons, led_number):
+    """
+    The color of an LED as an RGBl tuple.
+    """
+    blue, green, red, brightness = buttons.button_leds[led_number * 4:led_number * 4 + 4]
+    return RGBl(red, green, blue, brightness)
+
+
+def blend(color_below, color_above, opacity):
+    return RGBl(*(below + int((above - below) * opacity) for below, above in zip(color_below, color_above)))
+
+
+def test_keyframes_are_interpolated(buttons):
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, RGBl(0, 0, 0, 0)), Keyframe(1.0, RED)])])
+    buttons._update_led_colors(0.5)
+    assert led_color(buttons, 0) == RGBl(100, 0, 0, 10)
+
+
+def test_keyframe_brightness_scales_the_color(buttons):
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, RED, 0.5), Keyframe(1.0, None, 1.0)])])
+    buttons._update_led_colors(0.0)
+    assert led_color(buttons, 0) == RGBl(100, 0, 0, 20)
+    buttons._update_led_colors(0.5)
+    assert led_color(buttons, 0) == RGBl(150, 0, 0, 20)
+
+
+@pytest.mark.parametrize("easing", sorted(EASINGS))
+def test_easing_shapes_the_change_towards_the_next_keyframe(easing):
+    track = TimelineTrack(0, [Keyframe(0.0, RGBl(0, 0, 0, 0), easing=easing), Keyframe(1.0, RED)])
+    for elapsed in (0.0, 0.25, 0.5, 0.75):
+        ratio = EASINGS[easing](elapsed)
+        assert track.color_at(elapsed) == (int(200 * ratio), 0, 0, int(20 * ratio), 1.0)
+    assert track.color_at(1.0) == (*RED, 1.0)
+
+
+def test_unknown_easing_is_rejected():
+    with pytest.raises(ValueError):
+        TimelineTrack(0, [Keyframe(0.0, RED, easing='bounce')])
+
+
+def test_higher_priority_is_drawn_on_top(buttons):
+    # Started first, but drawn last
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, BLUE)], priority=2, loop=True)])
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, RED)], priority=1, loop=True)])
+    buttons._update_led_colors(0.1)
+    assert led_color(buttons, 0) == BLUE
+
+
+def test_track_opacity_blends_over_the_tracks_below(buttons):
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, RED)], priority=1, loop=True),
+                           TimelineTrack(0, [Keyframe(0.0, BLUE)], priority=2, loop=True, opacity=0.5)])
+    buttons._update_led_colors(0.1)
+    assert led_color(buttons, 0) == blend(RED, BLUE, 0.5)
+
+
+def test_track_opacity_blends_over_the_mode_color(buttons):
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, BLUE)], loop=True, opacity=0.25)])
+    for now in (0.1, 0.2):  # The mode color is restored before every blend
+        buttons._update_led_colors(now)
+        assert led_color(buttons, 0) == blend(GREEN, BLUE, 0.25)
+
+
+def test_keyframe_opacity_is_multiplied_by_the_track_opacity(buttons):
+    track = TimelineTrack(0, [Keyframe(0.0, BLUE, opacity=1.0), Keyframe(1.0, None, opacity=0.0)], opacity=0.5)
+    assert track.color_at(0.0)[4] == 0.5
+    assert track.color_at(0.5)[4] == 0.25
+    buttons.play_timeline([track])
+    buttons._update_led_colors(0.5)
+    assert led_color(buttons, 0) == blend(GREEN, BLUE, 0.25)
+
+
+def test_delayed_track_starts_later(buttons):
+    buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, RGBl(0, 0, 0, 0)), Keyframe(1.0, RED)], delay=0.5)])
+    buttons._update_led_colors(0.25)
+    assert led_color(buttons, 0) == GREEN
+    buttons._update_led_colors(1.0)
+    assert led_color(buttons, 0) == RGBl(100, 0, 0, 10)
+    buttons._update_led_colors(1.4)  # Past the last keyframe of an undelayed track
+    assert buttons.timeline_active()
+
+
+def test_looping_track_starts_again(buttons):
+    timeline_id = buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, RGBl(0, 0, 0, 0)), Keyframe(1.0, RED)],
+                                                       loop=True)])
+    buttons._update_led_colors(0.5)
+    first_pass = led_color(buttons, 0)
+    buttons._update_led_colors(3.5)
+    assert led_color(buttons, 0) == first_pass
+    assert buttons.timeline_active(timeline_id)
+
+
+def test_finished_track_is_removed_and_leds_show_their_mode(buttons):
+    timeline_id = buttons.play_timeline([TimelineTrack([0, "P1:A"], [Keyframe(0.0, BLUE), Keyframe(0.5, RED)])])
+    buttons._update_led_colors(0.25)
+    assert led_color(buttons, 0) != GREEN
+    assert led_color(buttons, 4) != RGBl(0, 0, 0, 0)
+
+    buttons._update_led_colors(0.5)
+    assert not buttons.timeline_active(timeline_id)
+    assert not buttons._tracks
+    assert not buttons._track_leds
+    assert not buttons.is_animating()
+    assert led_color(buttons, 0) == GREEN
+    assert all(led_color(buttons, led) == RGBl(0, 0, 0, 0) for led in range(4, 8))
+
+
+def test_stopped_timeline_leaves_the_others_playing(buttons):
+    first = buttons.play_timeline([TimelineTrack(0, [Keyframe(0.0, BLUE)], loop=True)])
+    second = buttons.play_timeline([TimelineTrack(1, [Keyframe(0.0, RED)], loop=True)])
+    buttons._update_led_colors(0.1)
+    buttons.stop_timeline(first)
+    assert led_color(buttons, 0) == GREEN
+    assert not buttons.timeline_active(first)
+    assert buttons.timeline_active(second)
+    buttons._update_led_colors(0.2)
+    assert led_color(buttons, 1) == RED
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from pixelpusher import (COLOR_ORDER_BGR, COLOR_ORDER_BRG, COLOR_ORDER_GBR, COLOR_ORDER_GRB, COLOR_ORDER_RBG,
+                         COLOR_ORDER_RGB)
+
+COLOR_ORDERS = [COLOR_ORDER_RGB, COLOR_ORDER_RBG, COLOR_ORDER_GBR, COLOR_ORDER_GRB, COLOR_ORDER_BGR,
+                COLOR_ORDER_BRG]
+
+
+def legacy_translate_buffer(matrix):
+    """
+    The per-pixel translate_buffer used before it copied whole channels, as the reference.
+    """
+    translated_buffer = bytearray(len(matrix.display_buffer))
+    for i in range(0, len(matrix.display_buffer), 4):
+        a = matrix.display_buffer[i + 3]
+        translated_buffer[i:i + 4] = [
+            matrix.display_buffer[i + matrix.color_order[0]],
+            matrix.display_buffer[i + matrix.color_order[1]],
+            matrix.display_buffer[i + matrix.color_order[2]],
+            a
+        ]
+    return translated_buffer
+
+
+@pytest.mark.parametrize("color_order", COLOR_ORDERS)
+def test_translate_buffer_matches_per_pixel_translation(make_matrix, color_order):
+    matrix = make_matrix(color_order=color_order)
+    matrix.display_buffer[:] = os.urandom(len(matrix.display_buffer))
+    expected = legacy_translate_buffer(matrix)
+    assert matrix.translate_buffer() == expected
+    assert matrix.translate_buffer(reuse_buffer=True) == expected
+
+
+def test_reused_buffer_follows_the_display_buffer(make_matrix):
+    matrix = make_matrix(color_order=COLOR_ORDER_GRB)
+    for _ in range(2):
+        matrix.display_buffer[:] = os.urandom(len(matrix.display_buffer))
+        assert matrix.translate_buffer(reuse_buffer=True) == legacy_translate_buffer(matrix)
@@ -0,0 +1,42 @@
+from pixelpusher import SerialTransport
+
+
+def unplug(transport):
+    transport.close()
+    transport.port_path = "/nonexistent/serial/device"
+
+
+def plug_in(transport):
+    transport.port_path = "loop://"
+    transport._retry_at = 0.0
+
+
+def test_resend_shows_frame_written_while_unplugged():
+    transport = SerialTransport("loop://", keepalive_interval=None)
+    assert transport.write(b"OLD")
+    unplug(transport)
+    assert not transport.write(b"NEW")
+
+    plug_in(transport)
+    assert transport.resend()
+    assert transport._serial.read(16) == b"NEW"
+    transport.close()
+
+
+def test_frame_written_before_device_appears_is_sent_on_connect():
+    transport = SerialTransport("/nonexistent/serial/device", keepalive_interval=None)
+    assert not transport.write(b"BOOT", bytearray(b"FRAME"))
+
+    plug_in(transport)
+    assert transport.resend()
+    assert transport._serial.read(16) == b"BOOTFRAME"
+    transport.close()
+
+
+def test_unchanged_frame_is_skipped_after_it_was_sent():
+    transport = SerialTransport("loop://", keepalive_interval=None)
+    assert transport.write(b"SAME")
+    assert transport.write(b"SAME")
+    assert transport.frames_sent == 1
+    assert transport.frames_skipped == 1
+    transport.close()
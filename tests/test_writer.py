@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def matrix_writing_with(make_matrix):
+    def matrix_writing_with(write):
+        matrix = make_matrix()
+        matrix.transport.write = write
+        return matrix
+
+    return matrix_writing_with
+
+
+def test_writer_keeps_running_after_a_failed_write(matrix_writing_with):
+    sent = []
+
+    def write(*chunks):
+        if chunks == (b"BAD",):
+            raise ValueError("broken frame")
+        sent.append(chunks)
+        return True
+
+    matrix = matrix_writing_with(write)
+    matrix._submit_frame(b"BAD")
+    assert matrix.flush(timeout=1.0)
+    matrix._submit_frame(b"GOOD")
+    assert matrix.flush(timeout=1.0)
+    assert sent == [(b"GOOD",)]
+
+
+def test_flush_times_out_while_a_write_hangs(matrix_writing_with):
+    release = threading.Event()
+    matrix = matrix_writing_with(lambda *chunks: release.wait())
+    matrix._submit_frame(b"FRAME")
+    assert not matrix.flush(timeout=0.1)
+    release.set()
+    assert matrix.flush(timeout=1.0)
+
+
+def test_flush_returns_when_the_writer_thread_is_gone(matrix_writing_with):
+    matrix = matrix_writing_with(lambda *chunks: True)
+    # A writer thread that stopped while a frame was still pending
+    matrix._pending_frame = (b"FRAME",)
+    matrix._writer_thread = threading.Thread(target=lambda: None)
+    matrix._writer_thread.start()
+    matrix._writer_thread.join()
+    assert not matrix.flush()
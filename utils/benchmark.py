@@ -0,0 +1,626 @@
+# Benchmarks for the pixelpusher library.
+# Run from the repository root, e.g.:
+#
+#   python utils/benchmark.py transport
+#   python utils/benchmark.py transport --port /dev/unicorn
+#   python utils/benchmark.py translate
+#   python utils/benchmark.py composite
+#   python utils/benchmark.py cache
+#   python utils/benchmark.py buttons
+#   python utils/benchmark.py fields
+#   python utils/benchmark.py press
+#   python utils/benchmark.py art
+#
+# Without --port, frames are written to a pseudo terminal that is drained by a background thread, so the numbers
+# show the cost on the Python side. With a real device connected the numbers show what the device can sustain.
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import serial  # noqa: E402
+from PIL import Image  # noqa: E402
+from pixelpusher import (  # noqa: E402
+    ArtIndex,
+    ButtonController,
+    FIELD_PATTERNS,
+    LedMatrix,
+    RGBl,
+    PlasmaButtons,
+    compile_attract_program,
+    DISPLAY_GALACTIC_UNICORN,
+    DISPLAY_INTERSTATE75_128x32,
+    DISPLAY_SIZES,
+    COLOR_ORDER_RGB,
+    COLOR_ORDER_RBG,
+    COLOR_ORDER_GBR,
+    COLOR_ORDER_GRB,
+    COLOR_ORDER_BGR,
+    COLOR_ORDER_BRG,
+)
+
+# Time a refresh of the buttons may take to play a frame of a field pattern on a Raspberry Pi
+FIELD_FRAME_BUDGET = 0.001
+
+COLOR_ORDERS = {
+    "RGB": COLOR_ORDER_RGB,
+    "RBG": COLOR_ORDER_RBG,
+    "GBR": COLOR_ORDER_GBR,
+    "GRB": COLOR_ORDER_GRB,
+    "BGR": COLOR_ORDER_BGR,
+    "BRG": COLOR_ORDER_BRG,
+}
+
+
+class FakeDevice:
+    """
+    Pseudo terminal that swallows everything written to it, standing in for a USB serial device.
+    """
+
+    def __init__(self):
+        self._master, slave = os.openpty()
+        self.port_path = os.ttyname(slave)
+        self._slave = slave
+        self.bytes_received = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while self._running:
+            try:
+                data = os.read(self._master, 65536)
+            except OSError:
+                return
+            self.bytes_received += len(data)
+
+    def close(self):
+        self._running = False
+        os.close(self._slave)
+        os.close(self._master)
+
+
+def measure(label, func, duration):
+    """
+    Calls func repeatedly for the given number of seconds, prints the achieved rate and returns the seconds per call.
+    """
+    frames = 0
+    start = time.perf_counter()
+    end = start + duration
+    while time.perf_counter() < end:
+        func()
+        frames += 1
+    elapsed = time.perf_counter() - start
+    print(f"{label:<48} {frames / elapsed:10.1f} frames/s {elapsed / frames * 1000:8.3f} ms/frame")
+    return elapsed / frames
+
+
+def legacy_write(port_path, *chunks):
+    """
+    The pre-transport write: open the port, write the frame and close it again.
+    """
+    with serial.Serial(port_path, baudrate=115200, timeout=1) as ser:
+        ser.write(b"".join(chunks))
+
+
+def benchmark_transport(args):
+    fake = None
+    port_path = args.port
+    if port_path is None:
+        fake = FakeDevice()
+        port_path = fake.port_path
+
+    for display, name in ((DISPLAY_GALACTIC_UNICORN, "Galactic Unicorn"),
+                          (DISPLAY_INTERSTATE75_128x32, "Interstate75 128x32")):
+        for compress in (False, True):
+            matrix = LedMatrix(display=display, serial_port_path=port_path, compress=compress)
+            matrix.transport.skip_unchanged = False  # Every frame is the same, send them anyway
+            width, height = DISPLAY_SIZES[display]
+            matrix.display_buffer[:] = os.urandom(width * height * 4)
+            label = f"LedMatrix {name}{' compressed' if compress else ''}"
+            measure(label, lambda: (matrix.write_to_display(), matrix.flush()), args.duration)
+            if not compress:
+                data = matrix.translate_buffer()
+                measure(label + " (open per frame)", lambda: legacy_write(port_path, matrix.PREFIX, data),
+                        args.duration)
+            matrix.close()
+
+    buttons = PlasmaButtons(num_leds=args.num_leds, serial_port_path=port_path)
+    buttons.stop()  # Drive the writes from here instead of the refresh thread
+    buttons.transport.skip_unchanged = False
+    measure(f"PlasmaButtons {args.num_leds} leds", buttons.write_to_display, args.duration)
+    data = bytes(buttons.button_leds)
+    measure(f"PlasmaButtons {args.num_leds} leds (open per frame)",
+            lambda: legacy_write(port_path, buttons.PREFIX, data), args.duration)
+    buttons.transport.close()
+
+    if fake is not None:
+        # The same LEDs spread over four controllers, written at the same time
+        fakes = [FakeDevice() for _ in range(4)]
+        controllers = [ButtonController(device.port_path, args.num_leds // 4) for device in fakes]
+        buttons = PlasmaButtons(num_leds=None, controllers=controllers)
+        buttons.stop()
+        for transport in buttons.transports:
+            transport.skip_unchanged = False
+        measure(f"PlasmaButtons {args.num_leds} leds on 4 controllers", buttons.write_to_display, args.duration)
+        buttons.stop()
+        for device in fakes:
+            device.close()
+        fake.close()
+
+
+def legacy_translate_buffer(matrix):
+    """
+    The per-pixel translate_buffer implementation, used as the reference for the whole-buffer version.
+    """
+    translated_buffer = bytearray(len(matrix.display_buffer))
+    for i in range(0, len(matrix.display_buffer), 4):
+        a = matrix.display_buffer[i + 3]
+        translated_buffer[i:i + 4] = [
+            matrix.display_buffer[i + matrix.color_order[0]],
+            matrix.display_buffer[i + matrix.color_order[1]],
+            matrix.display_buffer[i + matrix.color_order[2]],
+            a
+        ]
+    return translated_buffer
+
+
+def benchmark_translate(args):
+    for name, color_order in COLOR_ORDERS.items():
+        matrix = LedMatrix(display=DISPLAY_INTERSTATE75_128x32, serial_port_path=None, color_order=color_order)
+        matrix.display_buffer[:] = os.urandom(len(matrix.display_buffer))
+        expected = legacy_translate_buffer(matrix)
+        if matrix.translate_buffer() != expected or matrix.translate_buffer(reuse_buffer=True) != expected:
+            print(f"Color order {name}: output differs from the per-pixel implementation")
+            sys.exit(1)
+        measure(f"translate_buffer {name} per pixel", lambda: legacy_translate_buffer(matrix), args.duration)
+        measure(f"translate_buffer {name}", matrix.translate_buffer, args.duration)
+        measure(f"translate_buffer {name} reused buffer", lambda: matrix.translate_buffer(reuse_buffer=True),
+                args.duration)
+
+
+def legacy_render_frame(matrix, img, rescale, brightness):
+    """
+    The per-pixel blending of _render_frame, used as the reference for the whole-image version.
+    """
+    if rescale:
+        img = img.resize((matrix.width, matrix.height))
+    else:
+        left = (img.width - matrix.width) // 2
+        upper = (img.height - matrix.height) // 2
+        img = img.crop((left, upper, left + matrix.width, upper + matrix.height))
+
+    display_buffer = bytearray(len(matrix.display_buffer))
+    for x in range(img.width):
+        for y in range(img.height):
+            pixel = img.getpixel((x, y))
+            if len(pixel) == 4:
+                r, g, b, a = pixel
+            else:
+                r, g, b = pixel
+                a = 255
+            index = (x + y * matrix.width) * 4
+            current_r, current_g, current_b, _ = matrix.background_buffer[index:index + 4]
+            blend_factor = a / 255
+            display_buffer[index:index + 4] = [
+                int((r * blend_factor) + (current_r * (1 - blend_factor))),
+                int((g * blend_factor) + (current_g * (1 - blend_factor))),
+                int((b * blend_factor) + (current_b * (1 - blend_factor))),
+                brightness
+            ]
+    return display_buffer
+
+
+def test_images(width, height):
+    """
+    Builds source images covering the alpha cases the marquee sees.
+    """
+    size = (width * 3, height * 3)
+    rgb = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    rgba = Image.frombytes("RGBA", size, os.urandom(size[0] * size[1] * 4))
+    binary = rgba.copy()
+    binary.putalpha(rgba.getchannel("A").point(lambda a: 255 if a > 127 else 0))
+    return {"opaque RGB": rgb, "binary alpha": binary, "partial alpha": rgba}
+
+
+def benchmark_composite(args):
+    matrix = LedMatrix(display=DISPLAY_INTERSTATE75_128x32, serial_port_path=None)
+    failed = False
+    for name, img in test_images(matrix.width, matrix.height).items():
+        for rescale in (True, False):
+            matrix.background_buffer = bytearray(os.urandom(len(matrix.background_buffer)))
+            expected = legacy_render_frame(matrix, img, rescale, 127)
+            matrix._render_frame(img, rescale, 127)
+            differences = [abs(a - b) for a, b in zip(matrix.display_buffer, expected) if a != b]
+            label = f"{name}{' rescaled' if rescale else ' cropped'}"
+            # Pillow rounds partial alpha blends where the per-pixel code truncated, so allow one step there.
+            # Resampling a binary alpha channel also produces partial alpha along the edges.
+            tolerance = 0 if name == "opaque RGB" or (name == "binary alpha" and not rescale) else 1
+            if differences and max(differences) > tolerance:
+                print(f"{label}: {len(differences)} bytes differ, up to {max(differences)}")
+                failed = True
+            else:
+                print(f"{label}: {len(differences)} bytes differ by at most {tolerance}")
+            measure(f"_render_frame {label} per pixel",
+                    lambda: legacy_render_frame(matrix, img, rescale, 127), args.duration)
+            measure(f"_render_frame {label}", lambda: matrix._render_frame(img, rescale, 127), args.duration)
+
+    matrix.clear_with_background(RGBl(1, 2, 3, 4))
+    if matrix.display_buffer != bytearray([1, 2, 3, 4] * (matrix.width * matrix.height)):
+        print("clear_with_background: unexpected buffer contents")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+def benchmark_cache(args):
+    with tempfile.TemporaryDirectory() as directory:
+        image_paths = []
+        for name, img in test_images(128, 32).items():
+            image_path = os.path.join(directory, name.replace(" ", "_") + ".png")
+            img.save(image_path)
+            image_paths.append(image_path)
+
+        for cache_size in (None, 8 * 1024 * 1024):
+            matrix = LedMatrix(display=DISPLAY_INTERSTATE75_128x32, serial_port_path=None, compress=True,
+                               frame_cache_size=cache_size)
+            matrix.transport.write = lambda *chunks: True  # Measure the rendering, not the transport
+            sent = []
+            for image_path in image_paths * 2:
+                matrix.display_image(image_path, rescale=True)
+                matrix.flush()
+                sent.append(bytes(matrix.display_buffer))
+            if sent[:len(image_paths)] != sent[len(image_paths):]:
+                print("Images displayed from the cache differ from the rendered images")
+                sys.exit(1)
+            label = "display_image" + (" cached" if cache_size else " uncached")
+            next_image = iter(image_paths * 1000000)
+            measure(label, lambda: matrix.display_image(next(next_image), rescale=True), args.duration)
+            if matrix.frame_cache is not None:
+                print(matrix.frame_cache)
+            matrix.close()
+
+
+class LegacyLEDStatus:
+    def __init__(self):
+        self.mode = 'normal'
+        self.color_from = RGBl(0, 0, 0, 0)
+        self.transition_time = 0
+        self.color_to = RGBl(0, 0, 0, 0)
+        self.ticks_since_last_transition = 0
+
+
+class LegacyLedEngine:
+    """
+    The per-LED effect engine of PlasmaButtons, with an LEDStatus object per LED that counts refresh ticks, used as
+    the reference for the struct-of-arrays version.
+    """
+
+    def __init__(self, num_leds, refresh_rate=60):
+        self.num_leds = num_leds
+        self.refresh_rate = refresh_rate
+        self.button_leds = bytearray(num_leds * 4)
+        self.led_statuses = [LegacyLEDStatus() for _ in range(num_leds)]
+
+    def set_led_mode(self, led_number, mode, color_to=None, color_from=None, transition_time=None):
+        led_status = self.led_statuses[led_number]
+        led_status.mode = mode
+        if mode == 'normal':
+            led_status.color_to = color_to if color_to else RGBl(0, 0, 0, 0)
+        else:
+            led_status.color_from = color_from if color_from else led_status.color_to
+            led_status.color_to = color_to if color_to else led_status.color_to
+            led_status.transition_time = transition_time if transition_time else led_status.transition_time
+            led_status.ticks_since_last_transition = 0
+
+    def _interpolate(self, led_status, ratio):
+        color_from, color_to = led_status.color_from, led_status.color_to
+        return RGBl(int(color_from.red + (color_to.red - color_from.red) * ratio),
+                    int(color_from.green + (color_to.green - color_from.green) * ratio),
+                    int(color_from.blue + (color_to.blue - color_from.blue) * ratio),
+                    int(color_from.brightness + (color_to.brightness - color_from.brightness) * ratio))
+
+    def _calculate_color(self, led_number):
+        led_status = self.led_statuses[led_number]
+        ticks = led_status.ticks_since_last_transition
+        if led_status.mode == 'normal':
+            return led_status.color_to
+        elif led_status.mode == 'blink':
+            cycle_length = self.refresh_rate * led_status.transition_time
+            if (ticks % cycle_length) < (cycle_length / 2):
+                return led_status.color_to
+            return led_status.color_from
+        elif led_status.mode == 'fade':
+            total_ticks_for_fade = self.refresh_rate * led_status.transition_time
+            if ticks >= total_ticks_for_fade:
+                self.set_led_mode(led_number, 'normal', color_to=led_status.color_to)
+                return led_status.color_to
+            return self._interpolate(led_status, ticks / total_ticks_for_fade)
+        elif led_status.mode == 'fade sweep':
+            total_ticks_for_fade = self.refresh_rate * led_status.transition_time
+            half_time_ticks = total_ticks_for_fade / 2
+            if ticks >= total_ticks_for_fade:
+                led_status.ticks_since_last_transition = 0
+                return led_status.color_from
+            if ticks < half_time_ticks:
+                ratio = ticks / half_time_ticks
+            else:
+                ratio = (total_ticks_for_fade - ticks) / half_time_ticks
+            return self._interpolate(led_status, ratio)
+
+    def update_led_colors(self):
+        for i in range(self.num_leds):
+            self.led_statuses[i].ticks_since_last_transition += 1
+            current_color = self._calculate_color(i)
+            start_index = i * 4
+            self.button_leds[start_index] = current_color.blue & 0xFF
+            self.button_leds[start_index + 1] = current_color.green & 0xFF
+            self.button_leds[start_index + 2] = current_color.red & 0xFF
+            self.button_leds[start_index + 3] = current_color.brightness & 0x1F
+
+
+def random_color():
+    return RGBl(random.randrange(256), random.randrange(256), random.randrange(256), random.randrange(32))
+
+
+def random_led_modes(num_leds, animated_fraction, leds_per_effect=1, modes=("blink", "fade", "fade sweep")):
+    """
+    Builds set_led_mode arguments for every LED, with the given fraction of LEDs in one of the animated modes.
+    Each run of leds_per_effect LEDs gets the same mode, like set_button_mode does for the 4 LEDs of a button.
+    """
+    calls = []
+    for first_led in range(0, num_leds, leds_per_effect):
+        if random.random() < animated_fraction:
+            arguments = (random.choice(modes), random_color(), random_color(),
+                         random.choice((0.5, 1, 2, 3)))
+        else:
+            arguments = ("normal", random_color(), None, None)
+        calls.extend((led_number,) + arguments for led_number in range(first_led, first_led + leds_per_effect))
+    return calls
+
+
+def benchmark_buttons(args):
+    random.seed(1)
+    fake = FakeDevice()
+    failed = False
+
+    # Parity: apply the same mode changes at random ticks and compare every frame. The effects are timed with a
+    # clock that advances one refresh per tick; a refresh rate of 64 keeps the times exact in floating point.
+    legacy = LegacyLedEngine(128, refresh_rate=64)
+    buttons = PlasmaButtons(num_leds=128, serial_port_path=fake.port_path, refresh_rate=64)
+    buttons.stop()  # Drive the updates from here instead of the refresh thread
+    for tick in range(2000):
+        buttons.clock = lambda: tick / 64
+        if tick % 50 == 0:
+            calls = random_led_modes(128, 0.7, leds_per_effect=random.choice((1, 4)))
+            for call in random.sample(calls, 32):
+                legacy.set_led_mode(*call)
+                buttons.set_led_mode(*call)
+            if tick % 200 == 0:
+                mode, color_to, transition_time = random.choice(("blink", "fade", "fade sweep")), random_color(), 1
+                for led_number in range(128):
+                    legacy.set_led_mode(led_number, mode, color_to=color_to, transition_time=transition_time)
+                buttons.set_all_leds(mode, color_to=color_to, transition_time=transition_time)
+        legacy.update_led_colors()
+        buttons._update_led_colors((tick + 1) / 64)
+        if legacy.button_leds != buttons.button_leds:
+            print(f"Tick {tick}: button_leds differ from the per-LED implementation")
+            failed = True
+            break
+
+    # The timed runs use modes that keep animating: a fade ends after its transition time, and the per-LED
+    # implementation counts a tick per call, so its fades would end within the first milliseconds of a run
+    for num_leds in (128, 512, 2048):
+        for animated_fraction, leds_per_effect in ((0.1, 1), (1.0, 1), (1.0, 4)):
+            legacy = LegacyLedEngine(num_leds)
+            buttons = PlasmaButtons(num_leds=num_leds, serial_port_path=fake.port_path)
+            buttons.stop()
+            for led_number, mode, color_to, color_from, transition_time in \
+                    random_led_modes(num_leds, animated_fraction, leds_per_effect, ("blink", "fade sweep")):
+                legacy.set_led_mode(led_number, mode, color_to, color_from, transition_time)
+                if led_number % leds_per_effect == 0:
+                    leds = range(led_number, led_number + leds_per_effect)
+                    with buttons.batch() as batch:
+                        batch.set_leds_mode(leds, mode, color_to, color_from, transition_time)
+            label = f"{num_leds} leds, {animated_fraction:.0%} animated"
+            if leds_per_effect > 1:
+                label += f" per {leds_per_effect}"
+            measure(f"_update_led_colors {label} per LED", legacy.update_led_colors, args.duration)
+            measure(f"_update_led_colors {label}", buttons._update_led_colors, args.duration)
+
+    fake.close()
+    if failed:
+        sys.exit(1)
+
+
+def print_budget(label, seconds, budget):
+    print(f"{label:<48} {'PASS' if seconds <= budget else 'FAIL':>10} {seconds * 1000:17.3f} of {budget * 1000:.3f} ms")
+
+
+def benchmark_fields(args):
+    print(f"Playing a frame of a field pattern, which includes rendering it, has a budget of "
+          f"{FIELD_FRAME_BUDGET * 1000:.0f} ms; run this on the Raspberry Pi to check it")
+    fake = FakeDevice()
+    for num_leds in (128, 512):
+        # A grid of buttons, 4 LEDs around each one, like the led_map of a control panel
+        coord_map = {(button % 16 * 4 + led % 2 * 2, button // 16 * 4 + led // 2 * 2): button * 4 + led
+                     for button in range(num_leds // 4) for led in range(4)}
+        buttons = PlasmaButtons(num_leds=num_leds, serial_port_path=fake.port_path, coord_map=coord_map)
+        buttons.stop()
+        for pattern_name in FIELD_PATTERNS:
+            pattern_queue = [(pattern_name, {'duration': 5.0})]
+            start = time.perf_counter()
+            program = compile_attract_program(pattern_queue, coord_map, buttons.geometry, num_leds,
+                                              buttons.refresh_rate)
+            print(f"{f'{pattern_name} {num_leds} leds, compiling':<48} "
+                  f"{(time.perf_counter() - start) * 1000:10.3f} ms")
+
+            field = program.steps[0].field
+            frame_indexes = itertools.cycle(range(field.frame_count))
+            measure(f"{pattern_name} {num_leds} leds, rendering a frame",
+                    lambda: field.render(next(frame_indexes)), args.duration)
+
+            # A refresh per call, each showing the next frame
+            buttons.clock = lambda: 0.0
+            buttons.start_attract_mode(pattern_queue)
+            ticks = itertools.count(1)
+            playing = measure(f"{pattern_name} {num_leds} leds, playing a frame",
+                              lambda: buttons._update_led_colors(next(ticks) / buttons.refresh_rate), args.duration)
+            buttons.stop_attract_mode()
+            print_budget(f"{pattern_name} {num_leds} leds, frame budget", playing, FIELD_FRAME_BUDGET)
+    fake.close()
+
+
+def benchmark_press(args):
+    random.seed(1)
+    fake = FakeDevice()
+    coord_map = {(led % 16, led // 16): led for led in range(128)}
+    buttons = PlasmaButtons(num_leds=128, serial_port_path=fake.port_path, coord_map=coord_map,
+                            button_map={"P1:A": 9})
+    marker = RGBl(1, 2, 3, 31)  # Color of the pressed button, recognized in the frames written to the port
+    written = threading.Event()
+    write_times = []
+    transport_write = buttons.transport.write
+
+    def write(prefix, data):
+        result = transport_write(prefix, data)
+        if data[9 * 16:9 * 16 + 3] == b"\x03\x02\x01":
+            write_times.append(time.perf_counter())
+            written.set()
+        return result
+
+    buttons.transport.write = write
+    for scenario in ("idle", "animating"):
+        if scenario == "animating":
+            buttons.set_led_mode(0, "blink", color_to=random_color(), transition_time=1.0)
+        latencies = []
+        for _ in range(args.presses):
+            time.sleep(random.uniform(0.02, 0.04))  # Press at a random moment of the refresh interval
+            written.clear()
+            write_times.clear()
+            start = time.perf_counter()
+            buttons.press_button("P1:A", effect="ripple", color=marker, radius=0)  # Just the button
+            if written.wait(1.0):
+                latencies.append(write_times[0] - start)
+            buttons.release_button("P1:A", fade=False)
+        latencies.sort()
+        print(f"{f'press_button to serial write, {scenario}':<48} "
+              f"median {latencies[len(latencies) // 2] * 1000:6.2f} ms, "
+              f"90% {latencies[len(latencies) * 9 // 10] * 1000:6.2f} ms, max {latencies[-1] * 1000:6.2f} ms")
+    buttons.stop()
+    fake.close()
+
+
+def legacy_find_image(image_path, image_extensions, *parts):
+    """
+    Probes the file system for an image once per extension, as the services used to.
+    """
+    for ext in image_extensions:
+        candidate = os.path.join(image_path, *parts[:-1], f"{parts[-1]}.{ext}")
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def benchmark_art(args):
+    extensions = ["gif", "png", "jpg"]
+    with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as cache_directory:
+        lookups = []
+        for system in range(args.systems):
+            system_name = f"system{system}"
+            open(os.path.join(directory, f"{system_name}.png"), "w").close()
+            os.mkdir(os.path.join(directory, system_name))
+            for game in range(args.games):
+                # Every other game has art named after the ROM, the others only art with tags in its name
+                if game % 2 == 0:
+                    art_name = f"game{game}.{extensions[game % 3]}"
+                else:
+                    art_name = f"Game {game} (USA) [!].png"
+                open(os.path.join(directory, system_name, art_name), "w").close()
+                lookups.append((system_name, f"game{game}"))
+            os.utime(os.path.join(directory, system_name), (0, 0))  # As if the art was added long ago
+        os.utime(directory, (0, 0))
+        random.shuffle(lookups)
+        cache_path = os.path.join(cache_directory, "art_index.json")
+
+        for label in ("build index", "build index and save the cache", "load index from the cache"):
+            start = time.perf_counter()
+            art_index = ArtIndex(directory, extensions, cache_path=cache_path if "cache" in label else None)
+            print(f"{label:<48} {(time.perf_counter() - start) * 1000:10.1f} ms")
+        print(art_index)
+        for system_name, game in lookups:
+            if art_index.find(system_name, game) != legacy_find_image(directory, extensions, system_name, game):
+                print(f"Index and file system disagree on {system_name}/{game}")
+                sys.exit(1)
+            if art_index.match(system_name, f"/userdata/roms/{system_name}/{game.title()} (Europe).zip") is None:
+                print(f"No art matched for {system_name}/{game}")
+                sys.exit(1)
+
+        def find(lookup_image):
+            system_name, game = next(next_lookup)
+            return lookup_image(system_name, game) or lookup_image(system_name)
+
+        def match():
+            system_name, game = next(next_lookup)
+            return art_index.match(system_name, f"/userdata/roms/{system_name}/{game} (Europe).zip", game)
+
+        next_lookup = itertools.cycle(lookups)
+        measure("lookup probing the file system",
+                lambda: find(lambda *parts: legacy_find_image(directory, extensions, *parts)), args.duration)
+        measure("lookup in the art index", lambda: find(art_index.find), args.duration)
+        measure("normalized name match in the art index", match, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the pixelpusher library.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    transport_parser = subparsers.add_parser("transport", help="Frames per second each device can sustain.")
+    transport_parser.add_argument("--port", help="Serial port to write to. Defaults to a fake device.")
+    transport_parser.add_argument("--duration", type=float, default=2.0, help="Seconds per measurement.")
+    transport_parser.add_argument("--num-leds", type=int, default=128, help="Number of button LEDs.")
+    transport_parser.set_defaults(func=benchmark_transport)
+
+    translate_parser = subparsers.add_parser("translate", help="Color order translation of a 128x32 frame.")
+    translate_parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement.")
+    translate_parser.set_defaults(func=benchmark_translate)
+
+    composite_parser = subparsers.add_parser("composite", help="Rendering an image into a 128x32 frame.")
+    composite_parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement.")
+    composite_parser.set_defaults(func=benchmark_composite)
+
+    cache_parser = subparsers.add_parser("cache", help="Displaying recently shown images again.")
+    cache_parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement.")
+    cache_parser.set_defaults(func=benchmark_cache)
+
+    buttons_parser = subparsers.add_parser("buttons", help="Computing one frame of button LED effects.")
+    buttons_parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement.")
+    buttons_parser.set_defaults(func=benchmark_buttons)
+
+    fields_parser = subparsers.add_parser("fields", help="Rendering and playing field patterns of the attract mode.")
+    fields_parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement.")
+    fields_parser.set_defaults(func=benchmark_fields)
+
+    press_parser = subparsers.add_parser("press", help="Latency from a button press to the serial write.")
+    press_parser.add_argument("--presses", type=int, default=100, help="Number of presses per measurement.")
+    press_parser.set_defaults(func=benchmark_press)
+
+    art_parser = subparsers.add_parser("art", help="Finding the marquee image of a game.")
+    art_parser.add_argument("--duration", type=float, default=1.0, help="Seconds per measurement.")
+    art_parser.add_argument("--systems", type=int, default=50, help="Number of systems.")
+    art_parser.add_argument("--games", type=int, default=1000, help="Number of games per system.")
+    art_parser.set_defaults(func=benchmark_art)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Tool to precompile marquee art into assets that LedMatrix streams straight from disk.
+# The compiled asset is written next to each image, with .pmv appended to the file name (e.g. pacman.png.pmv).
+# LedMatrix only uses an asset when it is newer than the image and was compiled for the same display, color order,
+# compression, rescale and brightness settings; otherwise it falls back to the image itself.
+#
+# Run from the repository root, e.g.:
+#
+#   python utils/compile_marquee.py /userdata/pixel_multiverse/visuals/marquee --type I75_128X32 --color-order GBR
+#
+# The defaults match what the service uses: rescaled, compressed, brightness 127.
+#
+# Images with transparent pixels are blended against a background when they are compiled: black, or the color given
+# with --background R,G,B,brightness. Such an asset is only used when display_image is called with that same
+# background_color. The services display art without a background color (transparent pixels show the previous
+# image), so for them transparent art is always rendered from the image itself.
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pixelpusher import (  # noqa: E402
+    compile_asset,
+    asset_path_for,
+    MarqueeAsset,
+    RGBl,
+    DISPLAY_INTERSTATE75_128x32,
+    DISPLAY_GALACTIC_UNICORN,
+    COLOR_ORDER_RGB,
+    COLOR_ORDER_RBG,
+    COLOR_ORDER_BGR,
+    COLOR_ORDER_BRG,
+    COLOR_ORDER_GRB,
+    COLOR_ORDER_GBR,
+)
+
+DISPLAY_TYPES = {
+    "I75_128X32": DISPLAY_INTERSTATE75_128x32,
+    "GALACTIC_UNICORN": DISPLAY_GALACTIC_UNICORN,
+}
+
+COLOR_ORDERS = {
+    "RGB": COLOR_ORDER_RGB,
+    "RBG": COLOR_ORDER_RBG,
+    "BGR": COLOR_ORDER_BGR,
+    "BRG": COLOR_ORDER_BRG,
+    "GRB": COLOR_ORDER_GRB,
+    "GBR": COLOR_ORDER_GBR,
+}
+
+
+def parse_background(value):
+    """
+    Parses a --background value: red, green and blue (0-255) and the brightness (0-255), separated by commas.
+    """
+    try:
+        return RGBl(*(int(part) for part in value.split(",")))
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"expected R,G,B,brightness, got '{value}'")
+
+
+def is_up_to_date(image_path, display, color_order, compress, rescale, brightness, background_color):
+    asset_path = asset_path_for(image_path)
+    if not os.path.exists(asset_path):
+        return False
+    try:
+        asset = MarqueeAsset(asset_path)
+    except (OSError, ValueError):
+        return False
+    try:
+        return asset.is_fresh(image_path) and asset.matches(display, color_order, compress, rescale, brightness,
+                                                            background_color or (0, 0, 0, 0))
+    finally:
+        asset.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile marquee art for a display.")
+    parser.add_argument("path", help="Directory with marquee art, searched recursively.")
+    parser.add_argument("--type", default="I75_128X32", type=str.upper, choices=DISPLAY_TYPES.keys(),
+                        help="Marquee type, as in the service configuration.")
+    parser.add_argument("--color-order", default="RGB", type=str.upper, choices=COLOR_ORDERS.keys(),
+                        help="Color order, as in the service configuration.")
+    parser.add_argument("--extensions", default="gif,png,jpg", help="Comma separated image extensions.")
+    parser.add_argument("--brightness", type=int, default=127, help="Brightness of the images.")
+    parser.add_argument("--background", type=parse_background,
+                        help="R,G,B,brightness to blend transparent pixels against. Defaults to black.")
+    parser.add_argument("--no-compress", action="store_true", help="Store uncompressed frames.")
+    parser.add_argument("--crop", action="store_true", help="Crop the images instead of rescaling them.")
+    parser.add_argument("--force", action="store_true", help="Recompile assets that are up to date.")
+    args = parser.parse_args()
+
+    display = DISPLAY_TYPES[args.type]
+    color_order = COLOR_ORDERS[args.color_order]
+    compress = not args.no_compress
+    rescale = not args.crop
+    extensions = tuple(f".{ext.strip().lower()}" for ext in args.extensions.split(","))
+
+    compiled = skipped = failed = transparent = 0
+    for directory, _, file_names in os.walk(args.path):
+        for file_name in sorted(file_names):
+            if not file_name.lower().endswith(extensions):
+                continue
+            image_path = os.path.join(directory, file_name)
+            if not args.force and is_up_to_date(image_path, display, color_order, compress, rescale,
+                                                args.brightness, args.background):
+                skipped += 1
+                continue
+            try:
+                asset_path = compile_asset(image_path, display, color_order, compress=compress, rescale=rescale,
+                                           background_color=args.background, brightness=args.brightness)
+            except Exception as e:
+                print(f"Failed to compile {image_path}: {e}")
+                failed += 1
+                continue
+            asset = MarqueeAsset(asset_path)
+            if not asset.opaque:
+                # Transparent art is only streamed when displayed with the same background color
+                transparent += 1
+            asset.close()
+            compiled += 1
+
+    print(f"Compiled {compiled} assets ({transparent} with transparency), {skipped} up to date, {failed} failed.")
+
+
+if __name__ == "__main__":
+    main()